@@ -2,12 +2,15 @@ version_info = (0, 35, 2)
 __version__ = '.'.join(map(str, version_info))
 
 try:
-    import pyuv_cffi  # only to compile the shared library before monkey-patching
+    try:
+        import pyuv_cffi  # only to load (or compile) the shared library before monkey-patching
+    except ImportError:
+        pass  # libuv is not available; use another hub
 
     from . import greenpool
     from . import queue
-    from .hubs.switch import gyield, trampoline
-    from .greenthread import sleep, spawn, spawn_n, spawn_after, kill
+    from .hubs.switch import gyield, maybe_yield, trampoline
+    from .greenthread import sleep, spawn, spawn_n, spawn_priority, spawn_after, kill
     from .greenpool import GreenPool, GreenPile
     from .timeout import Timeout, with_timeout
     from .patcher import import_patched, monkey_patch
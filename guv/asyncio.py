@@ -0,0 +1,451 @@
+"""asyncio event loop running on the guv hub
+
+:class:`GuvEventLoop` is an :class:`asyncio.AbstractEventLoop` which does not have a loop of its
+own: its callbacks are scheduled with :meth:`~guv.hubs.abc.AbstractHub.schedule_call_now`, its
+timers with :meth:`~guv.hubs.abc.AbstractHub.schedule_call_global`, and its readers and writers are
+hub listeners (see :meth:`~guv.hubs.abc.AbstractHub.add`). asyncio libraries and greenlets
+therefore share one thread and one set of polled file descriptors::
+
+    asyncio.set_event_loop_policy(guv.asyncio.EventLoopPolicy())
+
+    # in a greenlet
+    reader, writer = guv.asyncio.wait_coroutine(asyncio.open_connection(host, port))
+
+    # in a coroutine
+    result = await guv.asyncio.run_in_greenlet(blocking_green_function, arg)
+
+Notes:
+
+- Coroutines and asyncio callbacks run in the hub greenlet, so they must not call blocking guv
+  functions (such as :func:`guv.sleep` or green socket methods); use :func:`run_in_greenlet`.
+- :meth:`GuvEventLoop.run_forever` and :meth:`~GuvEventLoop.run_until_complete` only suspend the
+  calling greenlet. :func:`wait_coroutine` is the equivalent of
+  :meth:`~GuvEventLoop.run_until_complete` which may be called from several greenlets at once.
+- A greenlet and an asyncio reader (or writer) cannot wait on the same file descriptor at the same
+  time, since the hub only supports one listener per event type and file descriptor.
+- asyncio transports read once per readiness notification, so the epoll hub must not be used in
+  edge-triggered mode.
+- Signal handlers and subprocesses are not supported.
+"""
+import asyncio
+import functools
+import os
+import selectors
+import sys
+from asyncio import events, selector_events
+
+import greenlet
+
+from . import patcher
+from .const import READ, WRITE
+from .greenthread import spawn
+from .hubs import get_hub
+from .timeout import Timeout
+
+_threading = patcher.original('threading')
+
+__all__ = ['GuvEventLoop', 'EventLoopPolicy', 'get_event_loop', 'wait_coroutine',
+           'run_in_greenlet']
+
+_local = _threading.local()  # the event loop of each hub thread
+
+
+class _TimerHandle(events.TimerHandle):
+    __slots__ = ('_timer',)
+
+
+class _ListenerMap:
+    """The part of the selector interface used by asyncio's transports (to describe themselves),
+    backed by the loop's readers and writers
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def get_key(self, fd):
+        reader = self.loop._readers.get(fd)
+        writer = self.loop._writers.get(fd)
+        if reader is None and writer is None:
+            raise KeyError(fd)
+
+        events = ((selectors.EVENT_READ if reader is not None else 0) |
+                  (selectors.EVENT_WRITE if writer is not None else 0))
+        data = (reader and reader[1], writer and writer[1])
+        return selectors.SelectorKey(fd, fd, events, data)
+
+    def close(self):
+        pass
+
+
+class _SocketTransport(selector_events._SelectorSocketTransport):
+    def _call_connection_lost(self, exc):
+        # the loop is detached from the transport once the socket is closed
+        self._loop._fd_closed(self._sock_fd)
+        super()._call_connection_lost(exc)
+
+
+class _DatagramTransport(selector_events._SelectorDatagramTransport):
+    def _call_connection_lost(self, exc):
+        self._loop._fd_closed(self._sock_fd)
+        super()._call_connection_lost(exc)
+
+
+def _file_id(fd):
+    """Identify the open file of a file descriptor, to tell a recycled file descriptor apart
+
+    :rtype: tuple[int, int] or None
+    """
+    try:
+        st = os.fstat(fd)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def _fileno(fd):
+    return fd if isinstance(fd, int) else fd.fileno()
+
+
+def _ignore_throw(*args):
+    pass
+
+
+class GuvEventLoop(selector_events.BaseSelectorEventLoop):
+    """asyncio event loop which schedules its callbacks, timers and I/O on a guv hub
+
+    All of asyncio's socket transports, servers and ``sock_*()`` methods are supported. The loop
+    must be used in the thread of its hub.
+    """
+
+    def __init__(self, hub=None):
+        """
+        :param hub: (optional) hub to run on; defaults to the current thread's hub
+        :type hub: guv.hubs.abc.AbstractHub
+        """
+        #: :type: guv.hubs.abc.AbstractHub
+        self.hub = hub or get_hub()
+
+        #: hub listener and asyncio handle of each reader and writer
+        #: :type: dict[int, tuple]
+        self._readers = {}
+        self._writers = {}
+
+        #: open file of each file descriptor which has had a reader or writer
+        #: :type: dict[int, tuple[int, int]]
+        self._files = {}
+
+        #: hub timers of the pending timer handles
+        self._timers = set()
+
+        self._waiter = None  # greenlet running `run_forever()`
+        super().__init__(_ListenerMap(self))
+
+    # the hub wakes itself up for callbacks scheduled from other threads
+    def _make_self_pipe(self):
+        pass
+
+    def _close_self_pipe(self):
+        pass
+
+    def _write_to_self(self):
+        pass
+
+    def _run_handle(self, handle):
+        """Run an asyncio callback in the hub greenlet
+
+        The loop is the running loop (see :func:`asyncio.get_running_loop`) while callbacks run.
+        """
+        if handle._cancelled:
+            return
+
+        events._set_running_loop(self)
+        try:
+            handle._run()
+        finally:
+            events._set_running_loop(None)
+
+    def time(self):
+        return self.hub.now()
+
+    def _call_soon(self, callback, args, context):
+        handle = events.Handle(callback, args, self, context)
+        if handle._source_traceback:
+            del handle._source_traceback[-1]
+        self.hub.schedule_call_now(self._run_handle, handle)
+        return handle
+
+    def call_soon_threadsafe(self, callback, *args, context=None):
+        self._check_closed()
+        if self._debug:
+            self._check_callback(callback, 'call_soon_threadsafe')
+        handle = events.Handle(callback, args, self, context)
+        if handle._source_traceback:
+            del handle._source_traceback[-1]
+        self.hub.schedule_call_threadsafe(self._run_handle, handle)
+        return handle
+
+    def call_at(self, when, callback, *args, context=None):
+        if when is None:
+            raise TypeError('when cannot be None')
+        self._check_closed()
+        if self._debug:
+            self._check_thread()
+            self._check_callback(callback, 'call_at')
+        handle = _TimerHandle(when, callback, args, self, context)
+        if handle._source_traceback:
+            del handle._source_traceback[-1]
+
+        handle._timer = self.hub.schedule_call_global(max(when - self.time(), 0),
+                                                      self._fire_timer, handle)
+        handle._scheduled = True
+        self._timers.add(handle._timer)
+        return handle
+
+    def _fire_timer(self, handle):
+        handle._scheduled = False
+        self._timers.discard(handle._timer)
+        self._run_handle(handle)
+
+    def _timer_handle_cancelled(self, handle):
+        if handle._scheduled:
+            handle._scheduled = False
+            handle._timer.cancel()
+            self._timers.discard(handle._timer)
+
+    def _add_listener(self, evtype, listeners, fd, callback, args):
+        self._check_closed()
+        handle = events.Handle(callback, args, self, None)
+        self._remove_listener(listeners, fd)
+        if not self._watched(fd):
+            # asyncio opens and closes file descriptors without notifying the hub; if this one
+            # refers to a different file than the last time, it has been recycled, and the hub's
+            # state for the old file must be discarded
+            file_id = _file_id(fd)
+            if file_id is None or self._files.get(fd) != file_id:
+                self.hub.notify_opened(fd)
+                self._files[fd] = file_id
+        listener = self.hub.add(evtype, fd, self._run_handle, _ignore_throw, (handle,))
+        listeners[fd] = (listener, handle)
+        return handle
+
+    def _remove_listener(self, listeners, fd):
+        entry = listeners.pop(fd, None)
+        if entry is None:
+            return False
+
+        listener, handle = entry
+        self.hub.remove(listener)
+        handle.cancel()
+        return True
+
+    def _fd_closed(self, fd):
+        """Release the hub's resources for a file descriptor (such as its poll handle) which asyncio
+        is about to close
+        """
+        if self._files.pop(fd, None) is not None and not self._watched(fd):
+            self.hub.notify_close(fd)
+
+    def _watched(self, fd):
+        """Check if anything waits on the specified file descriptor
+
+        :rtype: bool
+        """
+        return any(fd in bucket for bucket in self.hub.listeners.values())
+
+    def _make_socket_transport(self, sock, protocol, waiter=None, *, extra=None, server=None):
+        return _SocketTransport(self, sock, protocol, waiter, extra, server)
+
+    def _make_datagram_transport(self, sock, protocol, address=None, waiter=None, extra=None):
+        return _DatagramTransport(self, sock, protocol, address, waiter, extra)
+
+    def _stop_serving(self, sock):
+        self._remove_reader(sock.fileno())
+        self._fd_closed(sock.fileno())
+        sock.close()
+
+    def _add_reader(self, fd, callback, *args):
+        return self._add_listener(READ, self._readers, _fileno(fd), callback, args)
+
+    def _remove_reader(self, fd):
+        if self.is_closed():
+            return False
+        return self._remove_listener(self._readers, _fileno(fd))
+
+    def _add_writer(self, fd, callback, *args):
+        return self._add_listener(WRITE, self._writers, _fileno(fd), callback, args)
+
+    def _remove_writer(self, fd):
+        if self.is_closed():
+            return False
+        return self._remove_listener(self._writers, _fileno(fd))
+
+    def run_forever(self):
+        """Suspend the calling greenlet until :meth:`stop` is called
+
+        The hub keeps running other greenlets in the meantime, and does not exit while this method
+        is running, even if there is nothing to wait for.
+        """
+        self._check_closed()
+        self._check_running()
+        current = greenlet.getcurrent()
+        assert current is not self.hub, 'do not call blocking functions from the mainloop'
+
+        self._set_coroutine_origin_tracking(self._debug)
+        old_agen_hooks = sys.get_asyncgen_hooks()
+        self._thread_id = _threading.get_ident()
+        sys.set_asyncgen_hooks(firstiter=self._asyncgen_firstiter_hook,
+                               finalizer=self._asyncgen_finalizer_hook)
+        self.hub.ref_threadsafe()
+        try:
+            while not self._stopping:
+                self._waiter = current
+                self.hub.switch()
+        finally:
+            self._waiter = None
+            self.hub.unref_threadsafe()
+            self._stopping = False
+            self._thread_id = None
+            self._set_coroutine_origin_tracking(False)
+            sys.set_asyncgen_hooks(*old_agen_hooks)
+
+    def stop(self):
+        """Resume the greenlet running :meth:`run_forever`
+
+        Callbacks which have already been scheduled are called first.
+        """
+        self._stopping = True
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None:
+            self.hub.schedule_call_now(waiter.switch)
+
+    def close(self):
+        """Close the loop
+
+        Readers, writers and pending timers are removed from the hub.
+        """
+        if self.is_running():
+            raise RuntimeError('Cannot close a running event loop')
+        if self.is_closed():
+            return
+
+        for fd in list(self._readers):
+            self._remove_listener(self._readers, fd)
+        for fd in list(self._writers):
+            self._remove_listener(self._writers, fd)
+        for t in self._timers:
+            t.cancel()
+        self._timers.clear()
+
+        super().close()
+
+
+def get_event_loop():
+    """Get the event loop of the current thread's hub, creating it if necessary
+
+    :rtype: GuvEventLoop
+    """
+    loop = getattr(_local, 'loop', None)
+    if loop is None or loop.hub is not get_hub() or loop.is_closed():
+        loop = _local.loop = GuvEventLoop()
+    return loop
+
+
+class EventLoopPolicy(asyncio.AbstractEventLoopPolicy):
+    """Event loop policy which makes :func:`get_event_loop` the default event loop of each thread
+    """
+
+    def get_event_loop(self):
+        return get_event_loop()
+
+    def set_event_loop(self, loop):
+        if loop is not None and not isinstance(loop, GuvEventLoop):
+            raise TypeError('loop must be a GuvEventLoop, not {}'.format(type(loop).__name__))
+        _local.loop = loop
+
+    def new_event_loop(self):
+        return GuvEventLoop()
+
+
+def wait_coroutine(aw, timeout=None):
+    """Run a coroutine (or wait for an awaitable) on the hub's event loop and return its result
+
+    This is the cooperative equivalent of :meth:`asyncio.loop.run_until_complete`: only the calling
+    greenlet is suspended. If the greenlet is killed or the timeout expires, the coroutine is
+    cancelled.
+
+    :param aw: coroutine, task, future or other awaitable
+    :param float timeout: (optional) maximum time to wait in seconds
+    :return: the result of the awaitable
+    :raises asyncio.TimeoutError: if the awaitable has not completed within `timeout`
+    """
+    hub = get_hub()
+    current = greenlet.getcurrent()
+    assert current is not hub, 'do not call blocking functions from the mainloop'
+
+    fut = asyncio.ensure_future(aw, loop=get_event_loop())
+    if not fut.done():
+        waiting = True
+
+        def resume():
+            if waiting:
+                current.switch()
+
+        def wake(fut):
+            # resume the greenlet outside of the loop's callback, so that the greenlet does not see
+            # the loop as the running loop
+            hub.schedule_call_now(resume)
+
+        fut.add_done_callback(wake)
+        hub.ref_threadsafe()  # keep the loop running for `call_soon_threadsafe()` callbacks
+        try:
+            with Timeout(timeout, False):
+                while not fut.done():
+                    hub.switch()
+        finally:
+            waiting = False
+            fut.remove_done_callback(wake)
+            hub.unref_threadsafe()
+            timed_out = not fut.done()
+            if timed_out:
+                fut.cancel()
+
+        if timed_out:
+            raise asyncio.TimeoutError()
+
+    return fut.result()
+
+
+def _greenthread_done(gt, fut):
+    if fut.done():
+        return
+
+    try:
+        result = gt.wait()
+    except greenlet.GreenletExit:
+        fut.cancel()
+    except Exception as e:
+        fut.set_exception(e)
+    else:
+        fut.set_result(result)
+
+
+def _future_done(gt, fut):
+    if fut.cancelled():
+        gt.kill()
+
+
+def run_in_greenlet(func, *args, **kwargs):
+    """Spawn a greenlet and return an :class:`asyncio.Future` for its result
+
+    This lets coroutines call blocking guv functions. Cancelling the future kills the greenlet.
+
+    :param Callable func: function to call in the new greenlet
+    :param args: positional arguments to pass to `func`
+    :param kwargs: keyword arguments to pass to `func`
+    :rtype: asyncio.Future
+    """
+    fut = get_event_loop().create_future()
+    gt = spawn(func, *args, **kwargs)
+    gt.link(_greenthread_done, fut)
+    fut.add_done_callback(functools.partial(_future_done, gt))
+    return fut
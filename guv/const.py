@@ -3,3 +3,12 @@ READ = 1
 
 #: This is equivalent to ``UV_WRITABLE``
 WRITE = 2
+
+#: Priority for latency-sensitive callbacks and greenlets, such as heartbeats and health checks
+PRIORITY_HIGH = 0
+
+#: Default priority for callbacks and greenlets
+PRIORITY_NORMAL = 1
+
+#: Priority for bulk work which may be delayed by other work
+PRIORITY_LOW = 2
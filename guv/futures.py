@@ -0,0 +1,217 @@
+"""Cooperative bridge to :mod:`concurrent.futures`
+
+Calling :meth:`concurrent.futures.Future.result` blocks the OS thread, and therefore the hub and
+every other greenlet. :func:`wait_future` and :func:`as_completed` only suspend the calling
+greenlet: the futures' done callbacks (which may be called in any thread) wake the hub up with
+:meth:`~guv.hubs.abc.AbstractHub.schedule_call_threadsafe`.
+
+:class:`GreenExecutor` goes the other way: it runs functions in greenlets and returns
+:class:`concurrent.futures.Future` objects, for libraries which expect an executor.
+"""
+import collections
+import concurrent.futures
+import time
+
+import greenlet
+
+from .greenthread import spawn_n
+from .hubs import get_hub
+from .semaphore import Semaphore
+from .timeout import Timeout
+
+__all__ = ['wait_future', 'as_completed', 'GreenExecutor']
+
+
+class _Waiter:
+    """Suspends the current greenlet until futures complete
+    """
+
+    def __init__(self):
+        self.hub = get_hub()
+        self.greenlet = greenlet.getcurrent()
+        assert self.greenlet is not self.hub, 'do not call blocking functions from the mainloop'
+
+        #: futures which have completed but have not been returned by :meth:`wait` yet
+        #: :type: collections.deque[concurrent.futures.Future]
+        self.completed = collections.deque()
+        self.waiting = False
+
+    def add(self, fut):
+        """Wait for the specified future
+        """
+        fut.add_done_callback(self._done_callback)
+
+    def close(self):
+        """Stop waiting for the futures
+
+        `concurrent.futures.Future` has no way of removing a done callback, so the callbacks stay
+        attached to the futures which have not completed, but they no longer do anything and no
+        longer keep the greenlet alive.
+        """
+        self.hub = None
+        self.greenlet = None
+        self.completed.clear()
+
+    def _done_callback(self, fut):
+        # called in the thread which completed the future
+        hub = self.hub
+        if hub is not None:
+            hub.schedule_call_threadsafe(self._wake, fut)
+
+    def _wake(self, fut):
+        if self.greenlet is None:
+            return  # closed
+
+        self.completed.append(fut)
+        if self.waiting:
+            self.waiting = False
+            self.greenlet.switch()
+
+    def wait(self, deadline=None):
+        """Wait until a future has completed
+
+        :param float deadline: (optional) monotonic time to wait until
+        :return: the completed future, or None if the deadline has passed
+        :rtype: concurrent.futures.Future or None
+        """
+        if not self.completed:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            self.hub.ref_threadsafe()  # keep the loop running until the callback is called
+            try:
+                with Timeout(timeout, False):
+                    while not self.completed:
+                        self.waiting = True
+                        self.hub.switch()
+            finally:
+                self.waiting = False
+                self.hub.unref_threadsafe()
+
+        return self.completed.popleft() if self.completed else None
+
+
+def wait_future(fut, timeout=None):
+    """Wait for a future to complete and return its result
+
+    This is the cooperative equivalent of :meth:`concurrent.futures.Future.result`.
+
+    :param fut: future to wait for
+    :type fut: concurrent.futures.Future
+    :param float timeout: (optional) maximum time to wait in seconds
+    :return: the future's result
+    :raises concurrent.futures.TimeoutError: if the future has not completed within `timeout`
+    :raises concurrent.futures.CancelledError: if the future was cancelled
+    """
+    if not fut.done():
+        waiter = _Waiter()
+        waiter.add(fut)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            if waiter.wait(deadline) is None:
+                raise concurrent.futures.TimeoutError()
+        finally:
+            waiter.close()
+
+    return fut.result(0)
+
+
+def as_completed(fs, timeout=None):
+    """Iterate over futures as they complete
+
+    This is the cooperative equivalent of :func:`concurrent.futures.as_completed`. Futures which
+    have already completed are yielded first.
+
+    :param fs: futures to wait for; duplicates are only yielded once
+    :type fs: Iterable[concurrent.futures.Future]
+    :param float timeout: (optional) maximum total time to wait in seconds
+    :rtype: Iterator[concurrent.futures.Future]
+    :raises concurrent.futures.TimeoutError: if some futures have not completed within `timeout`
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    fs = set(fs)
+    pending = set()
+    for fut in fs:
+        if fut.done():
+            yield fut
+        else:
+            pending.add(fut)
+
+    if not pending:
+        return
+
+    waiter = _Waiter()
+    for fut in pending:
+        waiter.add(fut)
+
+    try:
+        while pending:
+            fut = waiter.wait(deadline)
+            if fut is None:
+                raise concurrent.futures.TimeoutError(
+                    '{} (of {}) futures unfinished'.format(len(pending), len(fs)))
+
+            if fut in pending:
+                pending.remove(fut)
+                yield fut
+    finally:
+        waiter.close()
+
+
+class GreenExecutor(concurrent.futures.Executor):
+    """Executor which runs functions in greenlets
+
+    Calls are run in the thread which submitted them. The returned futures can be waited for with
+    :func:`wait_future` or :func:`as_completed` (calling :meth:`~concurrent.futures.Future.result`
+    before the future has completed would block the hub, which runs the calls).
+    """
+
+    def __init__(self, max_workers=None):
+        """
+        :param int max_workers: (optional) maximum number of calls running at once; further calls
+            are queued
+        """
+        self.slots = Semaphore(max_workers) if max_workers else None
+        self.pending = set()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        if self._shutdown:
+            raise RuntimeError('cannot schedule new futures after shutdown')
+
+        fut = concurrent.futures.Future()
+        self.pending.add(fut)
+        fut.add_done_callback(self.pending.discard)
+        spawn_n(self._run, fut, fn, args, kwargs)
+        return fut
+
+    def _run(self, fut, fn, args, kwargs):
+        if self.slots is not None:
+            self.slots.acquire()
+
+        try:
+            if not fut.set_running_or_notify_cancel():
+                return
+
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                fut.set_exception(e)
+            else:
+                fut.set_result(result)
+        finally:
+            if self.slots is not None:
+                self.slots.release()
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        """Stop accepting new calls
+
+        :param bool wait: wait (cooperatively) until all pending calls have completed
+        :param bool cancel_futures: cancel all calls which have not started running
+        """
+        self._shutdown = True
+        if cancel_futures:
+            for fut in list(self.pending):
+                fut.cancel()
+
+        if wait:
+            for fut in as_completed(list(self.pending)):
+                pass
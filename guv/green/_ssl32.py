@@ -115,7 +115,7 @@ class SSLSocket(socket):
                             type=sock.type,
                             proto=sock.proto,
                             fileno=sock.fileno())
-            self.settimeout(sock.gettimeout())
+            self.settimeout(sock.gettimeout(), coarse=getattr(sock, 'coarse_timeout', False))
             # see if it's connected
             try:
                 sock.getpeername()
@@ -297,6 +297,18 @@ class SSLSocket(socket):
         else:
             return socket.sendall(self, data, flags)
 
+    def sendall_many(self, buffers, flags=0):
+        # sendmsg() is not allowed, so the buffers are sent one at a time
+        for data in buffers:
+            self.sendall(data, flags)
+
+    def sendfile(self, file, offset=0, count=None):
+        if self._sslobj:
+            # the data must be encrypted, so it cannot be sent with os.sendfile()
+            return self._sendfile_use_send(file, offset, count)
+        else:
+            return socket.sendfile(self, file, offset, count)
+
     def recv(self, buflen=1024, flags=0):
         self._checkClosed()
         if self._sslobj:
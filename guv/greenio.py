@@ -1,12 +1,12 @@
 import io
-import time
 import os
+import stat
 import _socket
 import errno
 from errno import EWOULDBLOCK, EBADF
 
 from . import patcher
-from .hubs import trampoline
+from .hubs import trampoline, notify_opened, notify_close, get_hub
 from .exceptions import IOClosed, SOCKET_BLOCKING, SOCKET_CLOSED, CONNECT_ERR, CONNECT_SUCCESS
 from .const import READ, WRITE
 
@@ -19,6 +19,17 @@ SOL_SOCKET = socket_orig.SOL_SOCKET
 SO_ERROR = socket_orig.SO_ERROR
 O_NONBLOCK = getattr(os, 'O_NONBLOCK', 0)  # Windows doesn't have this
 
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 16  # the minimum allowed by POSIX
+
+#: maximum number of bytes requested from `os.sendfile()` at once
+SENDFILE_BLOCKSIZE = 1 << 30
+
+#: size of the buffer used to send files which `os.sendfile()` cannot send
+SENDFILE_FALLBACK_BLOCKSIZE = 65536
+
 # define some module attributes for convenience
 s_error = socket_orig.error
 s_timeout = socket_orig.timeout
@@ -33,14 +44,36 @@ SocketIO = socket_orig.SocketIO
 
 # noinspection PyPep8Naming
 class socket(_socket.socket):
-    __slots__ = ["__weakref__", "_io_refs", "_closed", "timeout"]
+    """Green socket
+
+    The socket remembers when a read or write would block: a short read (or write) on a stream
+    socket means that the receive buffer has been drained (or the send buffer is full). The next
+    read (or write) then waits for the hub to report readiness first, instead of making a syscall
+    which would fail with EWOULDBLOCK. As long as reads and writes are not short, they are made
+    back to back without polling.
+    """
+    __slots__ = ["__weakref__", "_io_refs", "_closed", "timeout", "coarse_timeout", "_stream",
+                 "_read_blocked", "_write_blocked"]
 
     def __init__(self, family=AF_INET, type=SOCK_STREAM, proto=0, fileno=None):
         super().__init__(family, type, proto, fileno)
+
+        # the file descriptor may be a recycled one, whose previous socket was closed without
+        # notifying the hub (for example, by the garbage collector)
+        notify_opened(self.fileno())
+
         self._io_refs = 0
         self._closed = False
         super().setblocking(False)
         self.timeout = _socket.getdefaulttimeout()
+        self.coarse_timeout = False
+
+        # readiness is only inferred from short reads and writes on stream sockets
+        self._stream = self.type == SOCK_STREAM
+
+        #: True if a read (write) is known to block until the hub reports readiness
+        self._read_blocked = False
+        self._write_blocked = False
 
     def _trampoline(self, fd, evtype, timeout=None, timeout_exc=None):
         """
@@ -53,11 +86,29 @@ class socket(_socket.socket):
             # socket here would be useful.
             raise IOClosed()
         try:
-            return trampoline(fd, evtype, timeout=timeout, timeout_exc=timeout_exc)
+            return trampoline(fd, evtype, timeout=timeout, timeout_exc=timeout_exc,
+                              coarse=self.coarse_timeout)
         except IOClosed:
             self._closed = True
             raise
 
+    def _wait_read(self):
+        """Wait until the socket is readable, with the socket's timeout
+        """
+        # if the wait times out, the socket is still known not to be readable
+        self._read_blocked = True
+        self._trampoline(self.fileno(), READ, timeout=self.gettimeout(),
+                         timeout_exc=s_timeout('timed out'))
+        self._read_blocked = False
+
+    def _wait_write(self):
+        """Wait until the socket is writable, with the socket's timeout
+        """
+        self._write_blocked = True
+        self._trampoline(self.fileno(), WRITE, timeout=self.gettimeout(),
+                         timeout_exc=s_timeout('timed out'))
+        self._write_blocked = False
+
     @property
     def type(self):
         return _socket.socket.type.__get__(self) & ~O_NONBLOCK
@@ -65,10 +116,14 @@ class socket(_socket.socket):
     def dup(self):
         fd = s_dup(self.fileno())
         sock = socket(self.family, self.type, self.proto, fileno=fd)
-        sock.settimeout(self.gettimeout())
+        sock.settimeout(self.gettimeout(), coarse=self.coarse_timeout)
         return sock
 
     def accept(self):
+        if self._read_blocked and self.timeout != 0.0 and not self._closed:
+            # the last wait for a connection timed out
+            self._wait_read()
+
         while True:
             res = self._socket_accept()
 
@@ -79,8 +134,7 @@ class socket(_socket.socket):
                 return client_sock, addr
 
             # else: EWOULDBLOCK
-            self._trampoline(self.fileno(), READ, timeout=self.gettimeout(),
-                             timeout_exc=s_timeout('timed out'))
+            self._wait_read()
 
     def _real_close(self, _ss=_socket.socket):
         # This function should not reference any globals. See Python issue #808164.
@@ -90,6 +144,9 @@ class socket(_socket.socket):
     def close(self):
         self._closed = True
         if self._io_refs <= 0:
+            fd = self.fileno()
+            if fd >= 0:
+                notify_close(fd)
             self._real_close()
 
     @property
@@ -112,15 +169,17 @@ class socket(_socket.socket):
                 self._socket_checkerr()
         else:
             # blocking mode, with timeout
-            end = time.time() + self.gettimeout()
+            hub = get_hub()
+            end = hub.now() + self.gettimeout()
             while True:
                 if self._socket_connect(address):
                     return
 
-                if time.time() >= end:
+                now = hub.now()
+                if now >= end:
                     raise s_timeout("timed out")
 
-                self._trampoline(self.fileno(), WRITE, timeout=end - time.time(),
+                self._trampoline(self.fileno(), WRITE, timeout=end - now,
                                  timeout_exc=s_timeout("timed out"))
                 self._socket_checkerr()
 
@@ -140,23 +199,29 @@ class socket(_socket.socket):
             return 0
         else:
             # blocking mode, with timeout
-            end = time.time() + self.gettimeout()
+            hub = get_hub()
+            end = hub.now() + self.gettimeout()
             while True:
                 try:
                     if self._socket_connect(address):
                         return 0
-                    if time.time() >= end:
+                    now = hub.now()
+                    if now >= end:
                         raise s_timeout(errno.EAGAIN)
-                    self._trampoline(self.fileno(), WRITE, timeout=end - time.time(),
+                    self._trampoline(self.fileno(), WRITE, timeout=end - now,
                                      timeout_exc=s_timeout(errno.EAGAIN))
                     self._socket_checkerr()
                 except s_error as ex:
                     return ex.args[0]
 
-    def recv(self, *args):
+    def recv(self, bufsize, flags=0):
+        if self._read_blocked and self.timeout != 0.0 and not self._closed:
+            # the last read drained the receive buffer; skip the doomed syscall
+            self._wait_read()
+
         while True:
             try:
-                return super().recv(*args)
+                data = super().recv(bufsize, flags)
             except s_error as e:
                 err = e.args[0]
                 if err in SOCKET_BLOCKING:
@@ -165,9 +230,11 @@ class socket(_socket.socket):
                     return b''
                 else:
                     raise
+            else:
+                self._read_blocked = self._stream and not flags and 0 < len(data) < bufsize
+                return data
 
-            self._trampoline(self.fileno(), READ, timeout=self.gettimeout(),
-                             timeout_exc=s_timeout("timed out"))
+            self._wait_read()
 
     def recvfrom(self, *args):
         while True:
@@ -189,39 +256,215 @@ class socket(_socket.socket):
             self._trampoline(self.fileno(), READ, timeout=self.gettimeout(),
                              timeout_exc=s_timeout("timed out"))
 
-    def recv_into(self, *args):
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        if self._read_blocked and self.timeout != 0.0 and not self._closed:
+            self._wait_read()
+
         while True:
             try:
-                return super().recv_into(*args)
+                n = super().recv_into(buffer, nbytes, flags)
             except s_error as ex:
                 if ex.args[0] != EWOULDBLOCK or self.timeout == 0.0:
                     raise
-            self._trampoline(self.fileno(), READ, timeout=self.gettimeout(),
-                             timeout_exc=s_timeout("timed out"))
+            else:
+                # `len(buffer)` may count items rather than bytes, which can only hide a short read
+                self._read_blocked = self._stream and not flags and 0 < n < (nbytes or len(buffer))
+                return n
+
+            self._wait_read()
 
     def send(self, data, flags=0):
+        if self._write_blocked and self.timeout != 0.0 and not self._closed:
+            # the last write filled the send buffer; skip the doomed syscall
+            self._wait_write()
+
         try:
-            return super().send(data, flags)
+            n = super().send(data, flags)
         except s_error as e:
             if e.args[0] != EWOULDBLOCK:
                 raise
 
-            self._trampoline(self.fileno(), WRITE, timeout=self.gettimeout(),
-                             timeout_exc=s_timeout("timed out"))
+            self._wait_write()
 
             try:
-                return super().send(data, flags)
+                n = super().send(data, flags)
             except s_error as e2:
                 if e2.args[0] == EWOULDBLOCK:
+                    self._write_blocked = True
                     return 0
                 raise
 
+        self._write_blocked = self._stream and n < len(data)
+        return n
+
     def sendall(self, data, flags=0):
         mv = memoryview(data)
         while mv:
             b_sent = self.send(mv, flags)
             mv = mv[b_sent:]
 
+    if hasattr(_socket.socket, 'sendmsg'):
+        def sendmsg(self, buffers, ancdata=(), flags=0, address=None):
+            if self._write_blocked and self.timeout != 0.0 and not self._closed:
+                self._wait_write()
+
+            buffers = list(buffers)
+            args = (buffers, ancdata, flags) if address is None else (buffers, ancdata, flags,
+                                                                       address)
+            try:
+                n = super().sendmsg(*args)
+            except s_error as e:
+                if e.args[0] != EWOULDBLOCK:
+                    raise
+
+                self._wait_write()
+
+                try:
+                    n = super().sendmsg(*args)
+                except s_error as e2:
+                    if e2.args[0] == EWOULDBLOCK:
+                        self._write_blocked = True
+                        return 0
+                    raise
+
+            if self._stream:
+                self._write_blocked = n < sum(memoryview(buf).nbytes for buf in buffers)
+            return n
+
+    def sendall_many(self, buffers, flags=0):
+        """Send several buffers, in order, as if they had been concatenated
+
+        The buffers are sent with :meth:`sendmsg` (scatter/gather I/O), so they are neither copied
+        nor sent with one syscall each. Partial writes are resumed from the first unsent byte.
+
+        :param buffers: bytes-like objects to send
+        :type buffers: Iterable[bytes]
+        :param int flags: (optional) flags for :meth:`sendmsg`
+        """
+        if not hasattr(self, 'sendmsg'):
+            for buf in buffers:
+                self.sendall(buf, flags)
+            return
+
+        views = [mv for mv in (memoryview(buf).cast('B') for buf in buffers) if mv]
+        i = 0
+        while i < len(views):
+            end = min(i + IOV_MAX, len(views))
+            n = self.sendmsg(views[i:end], (), flags)
+
+            # skip the buffers which have been sent
+            while i < end and n >= len(views[i]):
+                n -= len(views[i])
+                i += 1
+
+            if i < end:
+                views[i] = views[i][n:]
+
+    def sendfile(self, file, offset=0, count=None):
+        """Send the contents of a file, from `offset` until EOF (or until `count` bytes are sent)
+
+        Regular files are sent with `os.sendfile()`, which copies the data from the page cache to
+        the socket within the kernel, waiting for the hub whenever the send buffer is full. Other
+        files (pipes, `io.BytesIO`, ...) are read into one buffer and sent with :meth:`sendall`.
+
+        As with :meth:`socket.socket.sendfile`, the file position is updated to the end of the
+        data sent.
+
+        :param file: file object opened in binary mode
+        :param int offset: (optional) position in the file to start sending from
+        :param int count: (optional) maximum number of bytes to send
+        :return: number of bytes sent
+        :rtype: int
+        """
+        self._check_sendfile_params(file, offset, count)
+        try:
+            fileno = file.fileno()
+            fsize = os.fstat(fileno)
+        except (AttributeError, io.UnsupportedOperation, OSError):
+            return self._sendfile_use_send(file, offset, count)
+
+        if not hasattr(os, 'sendfile') or not stat.S_ISREG(fsize.st_mode):
+            return self._sendfile_use_send(file, offset, count)
+
+        remaining = fsize.st_size - offset
+        if count is not None:
+            remaining = min(remaining, count)
+
+        sockno = self.fileno()
+        total_sent = 0
+        try:
+            while remaining > 0:
+                if self._write_blocked and self.timeout != 0.0 and not self._closed:
+                    self._wait_write()
+
+                blocksize = min(remaining, SENDFILE_BLOCKSIZE)
+                try:
+                    sent = os.sendfile(sockno, fileno, offset, blocksize)
+                except BlockingIOError:
+                    if self.timeout == 0.0:
+                        raise
+                    self._wait_write()
+                    continue
+                except OSError:
+                    if total_sent == 0:
+                        # the file does not support `os.sendfile()`
+                        return self._sendfile_use_send(file, offset, count)
+                    raise
+
+                if sent == 0:
+                    break  # EOF; the file was truncated
+
+                self._write_blocked = sent < blocksize
+                offset += sent
+                total_sent += sent
+                remaining -= sent
+            return total_sent
+        finally:
+            if total_sent > 0 and hasattr(file, 'seek'):
+                file.seek(offset)
+
+    def _sendfile_use_send(self, file, offset=0, count=None):
+        """Send a file by reading it into one buffer and sending that buffer with :meth:`sendall`
+        """
+        self._check_sendfile_params(file, offset, count)
+        if offset:
+            file.seek(offset)
+
+        buf = bytearray(min(count, SENDFILE_FALLBACK_BLOCKSIZE) if count
+                        else SENDFILE_FALLBACK_BLOCKSIZE)
+        view = memoryview(buf)
+        total_sent = 0
+        try:
+            while count is None or total_sent < count:
+                blocksize = len(buf) if count is None else min(len(buf), count - total_sent)
+                if hasattr(file, 'readinto'):
+                    n = file.readinto(view[:blocksize])
+                    data = view[:n]
+                else:
+                    data = file.read(blocksize)
+                    n = len(data)
+                if not n:
+                    break
+
+                self.sendall(data)
+                total_sent += n
+            return total_sent
+        finally:
+            view.release()
+            if total_sent > 0 and hasattr(file, 'seek'):
+                file.seek(offset + total_sent)
+
+    def _check_sendfile_params(self, file, offset, count):
+        if 'b' not in getattr(file, 'mode', 'b'):
+            raise ValueError('file should be opened in binary mode')
+        if not self._stream:
+            raise ValueError('only SOCK_STREAM type sockets are supported')
+        if count is not None:
+            if not isinstance(count, int):
+                raise TypeError('count must be a positive integer (got {!r})'.format(count))
+            if count <= 0:
+                raise ValueError('count must be a positive integer (got {!r})'.format(count))
+
     def sendto(self, *args):
         try:
             return super().sendto(*args)
@@ -245,7 +488,14 @@ class socket(_socket.socket):
         else:
             self.timeout = 0.0
 
-    def settimeout(self, t):
+    def settimeout(self, t, coarse=False):
+        """Set the timeout for blocking socket operations
+
+        :param float t: timeout in seconds, or None for no timeout
+        :param bool coarse: schedule timeouts with coarse resolution (see
+            :meth:`~guv.hubs.abc.AbstractHub.schedule_call_coarse`); this is much cheaper for idle
+            timeouts which are re-armed on every operation and rarely expire
+        """
         if t is not None:
             try:
                 f = t.__float__
@@ -255,6 +505,7 @@ class socket(_socket.socket):
             if t < 0.0:
                 raise ValueError('Timeout value out of range')
         self.timeout = t
+        self.coarse_timeout = coarse
 
     def gettimeout(self):
         return self.timeout
@@ -1,11 +1,13 @@
 from collections import deque
+import functools
 import sys
 import greenlet
 
 from . import event, hubs
+from .const import PRIORITY_NORMAL
 from .support import reraise
 
-__all__ = ['sleep', 'spawn', 'spawn_n', 'kill', 'spawn_after', 'GreenThread']
+__all__ = ['sleep', 'spawn', 'spawn_n', 'spawn_priority', 'kill', 'spawn_after', 'GreenThread']
 
 
 def sleep(seconds=0):
@@ -27,8 +29,8 @@ def spawn_n(func, *args, **kwargs):
     """Spawn a greenlet
 
     Execution control returns immediately to the caller; the created greenlet is scheduled to be run
-    at the start of the next event loop iteration, after other scheduled greenlets, but before
-    greenlets waiting for I/O events.
+    at the start of the next event loop iteration, after other scheduled greenlets with the same or
+    a higher priority, but before greenlets waiting for I/O events.
 
     This is faster than :func:`spawn`, but it is not possible to retrieve the return value of
     the greenlet, or whether it raised any exceptions. It is fastest if there are no keyword
@@ -42,7 +44,7 @@ def spawn_n(func, *args, **kwargs):
     """
     hub = hubs.get_hub()
     g = greenlet.greenlet(func, parent=hub)
-    hub.schedule_call_now(g.switch, *args, **kwargs)
+    _schedule_switch(hub, g, args, kwargs, PRIORITY_NORMAL)
     return g
 
 
@@ -50,18 +52,44 @@ def spawn(func, *args, **kwargs):
     """Spawn a GreenThread
 
     Execution control returns immediately to the caller; the created GreenThread is scheduled to
-    be run at the start of the next event loop iteration, after other scheduled greenlets,
-    but before greenlets waiting for I/O events.
+    be run at the start of the next event loop iteration, after other scheduled greenlets with the
+    same or a higher priority, but before greenlets waiting for I/O events.
 
     :return: GreenThread object which can be used to retrieve the return value of the function
     :rtype: GreenThread
     """
     hub = hubs.get_hub()
     g = GreenThread(hub)
-    hub.schedule_call_now(g.switch, func, *args, **kwargs)
+    _schedule_switch(hub, g, (func,) + args, kwargs, PRIORITY_NORMAL)
     return g
 
 
+def spawn_priority(priority, func, *args, **kwargs):
+    """Spawn a GreenThread with the specified priority
+
+    This is like :func:`spawn`, but the GreenThread is started before scheduled greenlets and
+    callbacks with a lower priority. Keyword arguments named `priority` or `func` cannot be passed
+    to the function.
+
+    :param int priority: :data:`~guv.const.PRIORITY_HIGH`, :data:`~guv.const.PRIORITY_NORMAL` or
+        :data:`~guv.const.PRIORITY_LOW`; the priority only applies to starting the GreenThread
+    :return: GreenThread object which can be used to retrieve the return value of the function
+    :rtype: GreenThread
+    """
+    hub = hubs.get_hub()
+    g = GreenThread(hub)
+    _schedule_switch(hub, g, (func,) + args, kwargs, priority)
+    return g
+
+
+def _schedule_switch(hub, g, args, kwargs, priority):
+    if 'priority' in kwargs:
+        # the keyword argument is meant for the function, not for `schedule_call_now()`
+        hub.schedule_call_now(functools.partial(g.switch, *args, **kwargs), priority=priority)
+    else:
+        hub.schedule_call_now(g.switch, *args, priority=priority, **kwargs)
+
+
 def spawn_after(seconds, func, *args, **kwargs):
     """Spawn a GreenThread after `seconds` have elapsed
 
@@ -1,10 +1,12 @@
 from abc import ABCMeta, abstractmethod
+import collections
 import greenlet
 import sys
+import time
 import traceback
 from greenlet import GreenletExit
 
-from ..const import READ, WRITE
+from ..const import READ, WRITE, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
 from ..exceptions import SYSTEM_ERROR
 
 NOT_ERROR = (GreenletExit, SystemExit)
@@ -26,10 +28,10 @@ class AbstractTimer(metaclass=ABCMeta):
 class AbstractListener(metaclass=ABCMeta):
     def __init__(self, evtype, fd):
         """
-        :param str evtype: the constant hubs.READ or hubs.WRITE
+        :param int evtype: the constant hubs.READ or hubs.WRITE, or READ | WRITE to wait for either
         :param int fd: fileno
         """
-        assert evtype in [READ, WRITE]
+        assert evtype in [READ, WRITE, READ | WRITE]
         self.evtype = evtype
         self.fd = fd
         self.greenlet = greenlet.getcurrent()
@@ -40,13 +42,90 @@ class AbstractListener(metaclass=ABCMeta):
     __str__ = __repr__
 
 
+class RunQueue:
+    """Run queue of `(cb, args, kwargs)` tuples with one FIFO queue per priority class
+    """
+
+    def __init__(self):
+        #: one queue per priority, indexed by :data:`~guv.const.PRIORITY_HIGH`,
+        #: :data:`~guv.const.PRIORITY_NORMAL` and :data:`~guv.const.PRIORITY_LOW`
+        #: :type: list[collections.deque]
+        self.queues = [collections.deque() for _ in (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)]
+
+    def __len__(self):
+        return sum(map(len, self.queues))
+
+    def __bool__(self):
+        return any(self.queues)
+
+
 class AbstractHub(greenlet.greenlet, metaclass=ABCMeta):
+    #: timers scheduled with :meth:`schedule_call_global` may be fired up to this many seconds early
+    #: (the resolution of the underlying event loop's timers)
+    timer_resolution = 0.0
+
+    #: maximum number of callbacks scheduled with :meth:`schedule_call_now` to call per event loop
+    #: iteration; the remaining callbacks are called after the loop has polled for I/O
+    callback_budget = 1000
+
+    #: (optional) maximum time (seconds) to spend calling scheduled callbacks per event loop
+    #: iteration
+    callback_time_budget = None
+
+    #: fraction of :attr:`callback_budget` reserved for each lower priority class with callbacks
+    #: waiting, so that a steady stream of higher priority callbacks cannot starve them
+    callback_min_share = 0.1
+
     def __init__(self):
+        from . import stats, timer  # guv.hubs.timer depends on this module
+
         super().__init__()
         self.listeners = {READ: {}, WRITE: {}}
         self.Listener = AbstractListener
         self.stopping = False
 
+        #: Run queue of callbacks scheduled by :meth:`schedule_call_now`
+        self.callbacks = RunQueue()
+        self.callbacks_deferred = 0  # callbacks deferred by the budget in the last loop iteration
+        self.callbacks_deferred_total = 0
+
+        #: Timing wheel for timers scheduled by :meth:`schedule_call_coarse`. The wheel is advanced
+        #: by a single timer scheduled with :meth:`schedule_call_global`, which is only scheduled
+        #: while the wheel is not empty.
+        self.wheel = timer.TimerWheel(on_empty=self._wheel_empty, clock=self.now)
+        self.wheel_timer = None
+
+        # event loop statistics (see `stats()`)
+        self.iterations = 0  # loop iterations (calls to `_run_callbacks()`)
+        self.switches = 0  # switches to the hub greenlet
+        self.callbacks_called = 0
+        self.callbacks_histogram = stats.Histogram(stats.CALLBACKS_BUCKETS)  # per loop iteration
+        self.lag_histogram = stats.Histogram(stats.LAG_BUCKETS)  # lateness of fired timers
+        self.poll_time = 0.0  # time spent polling for I/O (seconds)
+        self.run_time = 0.0  # time spent in `run()` (seconds), excluding the current run
+        self.run_started = None  # monotonic time the current run started, if running
+
+        #: True while the loop is polling for I/O (that is, while the hub is idle or blocked in
+        #: the kernel rather than running code)
+        self.polling = False
+
+        #: :class:`~guv.hubs.watchdog.BlockingWatchdog` watching this hub, if any (see
+        #: :func:`guv.util.debug.hub_blocking_detection`)
+        self.watchdog = None
+
+        #: Time slice (seconds) after which :func:`~guv.hubs.switch.maybe_yield` yields, or None if
+        #: time slices are not tracked (see :meth:`set_time_slice`)
+        self.time_slice = None
+        self.slice_started = 0.0  # monotonic time of the last greenlet switch in this thread
+        self._previous_trace = None
+
+        #: Callbacks scheduled by :meth:`schedule_call_threadsafe`, waiting to be moved to the run
+        #: queue by the hub's thread. Appending to and popping from a deque are atomic, so no lock
+        #: is needed.
+        self.threadsafe_callbacks = collections.deque()
+        self.threadsafe_refs = 0  # see `ref_threadsafe()`
+        self._wakeup_pending = False
+
         self._debug_exceptions = True
 
     @abstractmethod
@@ -61,17 +140,182 @@ class AbstractHub(greenlet.greenlet, metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def schedule_call_now(self, cb, *args, **kwargs):
+    def schedule_call_now(self, cb, *args, priority=PRIORITY_NORMAL, **kwargs):
         """Schedule a callable to be called on the next event loop iteration
 
-        This is faster than calling :meth:`schedule_call_global(0, ...)`
+        This is faster than calling :meth:`schedule_call_global(0, ...)`. Callbacks with a higher
+        priority are called before callbacks with a lower priority; callbacks with the same priority
+        are called in the order they were scheduled.
 
         :param Callable cb: callback to call after timer fires
         :param args: positional arguments to pass to the callback
+        :param int priority: (optional) :data:`~guv.const.PRIORITY_HIGH`,
+            :data:`~guv.const.PRIORITY_NORMAL` or :data:`~guv.const.PRIORITY_LOW`
         :param kwargs: keyword arguments to pass to the callback
         """
         pass
 
+    def schedule_call_threadsafe(self, cb, *args, **kwargs):
+        """Schedule a callable to be called by the hub, from any thread
+
+        This is the only method of the hub which is safe to call from another OS thread (or from a
+        signal handler). The callback is added to the run queue of the hub's thread (as if
+        :meth:`schedule_call_now` had been called in that thread), and the hub is woken up if it is
+        waiting for I/O. Wakeups are coalesced: the hub is only woken up once for all the callbacks
+        scheduled while it is busy.
+
+        Note that a loop with nothing else to wait for exits even if another thread is expected to
+        schedule callbacks; see :meth:`ref_threadsafe`.
+
+        :param Callable cb: callback to call
+        :param args: positional arguments to pass to the callback
+        :param kwargs: keyword arguments to pass to the callback
+        """
+        self.threadsafe_callbacks.append((cb, args, kwargs))
+        if not self._wakeup_pending:
+            self._wakeup_pending = True
+            self._wakeup()
+
+    @abstractmethod
+    def _wakeup(self):
+        """Wake up the hub's thread (called from any thread)
+
+        The hub must call :meth:`_run_threadsafe_callbacks` in its own thread after this has been
+        called.
+        """
+
+    def _run_threadsafe_callbacks(self):
+        """Move callbacks scheduled by :meth:`schedule_call_threadsafe` to the run queue
+        """
+        # clear the flag first: a callback scheduled after this point wakes the hub up again
+        self._wakeup_pending = False
+        pending = self.threadsafe_callbacks
+        append = self.callbacks.queues[PRIORITY_NORMAL].append
+        while pending:
+            append(pending.popleft())
+
+    def ref_threadsafe(self):
+        """Keep the event loop running while a callback is expected from another thread
+
+        Each call must be matched by a call to :meth:`unref_threadsafe` (for example, once the
+        expected callback has been called). Both methods must be called from the hub's thread.
+        """
+        self.threadsafe_refs += 1
+
+    def unref_threadsafe(self):
+        """Undo a call to :meth:`ref_threadsafe`
+        """
+        assert self.threadsafe_refs > 0, 'unref_threadsafe() called without ref_threadsafe()'
+        self.threadsafe_refs -= 1
+
+    def _run_callbacks(self):
+        """Call callbacks scheduled with :meth:`schedule_call_now`
+
+        Only callbacks which were scheduled before this method was called are called, up to
+        :attr:`callback_budget` callbacks or :attr:`callback_time_budget` seconds. The remaining
+        callbacks are deferred to the next loop iteration, so that a burst of callbacks (such as
+        calls to `gyield()` or `spawn_n()`) cannot delay polling for I/O indefinitely.
+
+        Higher priority callbacks are called first, but each lower priority class with callbacks
+        waiting is guaranteed :attr:`callback_min_share` of the budget (even once the time budget
+        has been used up).
+        """
+        budget = self.callback_budget
+        share = max(int(budget * self.callback_min_share), 1)
+
+        deadline = None
+        if self.callback_time_budget is not None:
+            deadline = time.monotonic() + self.callback_time_budget
+
+        queued = [(len(q), q) for q in self.callbacks.queues if q]
+        # number of callbacks guaranteed to the priority classes which have not been run yet
+        reserved = sum(min(n, share) for n, q in queued)
+
+        total = 0
+        deferred = 0
+        for queued_n, q in queued:
+            guaranteed = min(queued_n, share)
+            reserved -= guaranteed
+            n = min(queued_n, max(budget - total - reserved, guaranteed))
+
+            popleft = q.popleft
+            called = 0
+            for called in range(1, n + 1):
+                cb, args, kwargs = popleft()
+                try:
+                    cb(*args, **kwargs)
+                except:
+                    self._squelch_exception(sys.exc_info())
+
+                if (deadline is not None and called >= guaranteed
+                        and time.monotonic() >= deadline):
+                    break
+
+            total += called
+            deferred += queued_n - called
+
+        self.callbacks_deferred = deferred
+        self.callbacks_deferred_total += deferred
+        self.iterations += 1
+        self.callbacks_called += total
+        self.callbacks_histogram.add(total)
+
+    def _record_lag(self, expiry):
+        """Record how late the earliest expired timer is being fired
+
+        :param float expiry: expiry time (see :meth:`now`) of the timer, or None if there are no
+            pending timers
+        """
+        if expiry is not None:
+            self.lag_histogram.add(max(self.now() - expiry, 0.0))
+
+    def stats(self):
+        """Get a snapshot of the event loop's statistics
+
+        The snapshot contains:
+
+        - `iterations`: number of event loop iterations
+        - `run_time`: total time spent running the event loop (seconds)
+        - `poll_time`: time spent polling for I/O, which includes time spent idle (seconds)
+        - `busy_time`: `run_time - poll_time`
+        - `switches`: number of switches to the hub greenlet
+        - `callbacks`: number of callbacks scheduled with :meth:`schedule_call_now` which have been
+          called
+        - `callbacks_pending`: number of callbacks currently scheduled
+        - `callbacks_deferred`: number of times a callback was deferred by the callback budget
+        - `callbacks_per_iteration`: histogram of the number of callbacks called per loop iteration
+        - `lag`: histogram of the lateness of timers when they were fired (seconds); a large lag
+          means the loop has been blocked
+        - `readers`, `writers`: number of greenlets waiting for I/O
+        - `coarse_timers`: number of pending timers scheduled with :meth:`schedule_call_coarse`
+        - `blocked`: number of times the hub was reported as blocked by :attr:`watchdog`
+
+        Histograms are dicts; see :meth:`guv.hubs.stats.Histogram.snapshot`. Hubs may add
+        implementation-specific entries.
+
+        :rtype: dict
+        """
+        run_time = self.run_time
+        if self.run_started is not None:
+            run_time += time.monotonic() - self.run_started
+
+        return {
+            'iterations': self.iterations,
+            'run_time': run_time,
+            'poll_time': self.poll_time,
+            'busy_time': max(run_time - self.poll_time, 0.0),
+            'switches': self.switches,
+            'callbacks': self.callbacks_called,
+            'callbacks_pending': len(self.callbacks),
+            'callbacks_deferred': self.callbacks_deferred_total,
+            'callbacks_per_iteration': self.callbacks_histogram.snapshot(),
+            'lag': self.lag_histogram.snapshot(),
+            'readers': len(self.listeners[READ]),
+            'writers': len(self.listeners[WRITE]),
+            'coarse_timers': len(self.wheel),
+            'blocked': self.watchdog.count if self.watchdog is not None else 0,
+        }
+
     @abstractmethod
     def schedule_call_global(self, seconds, cb, *args, **kwargs):
         """Schedule a callable to be called after 'seconds' seconds have elapsed. The timer will NOT
@@ -86,6 +330,56 @@ class AbstractHub(greenlet.greenlet, metaclass=ABCMeta):
         """
         pass
 
+    def schedule_call_coarse(self, seconds, cb, *args, **kwargs):
+        """Schedule a callable to be called after at least 'seconds' seconds have elapsed, with
+        coarse (10ms) resolution
+
+        Timers are kept in a timing wheel, where scheduling and cancelling are O(1). This is
+        intended for large numbers of timeouts which rarely expire, such as idle connection
+        timeouts.
+
+        :param float seconds: number of seconds to wait
+        :param Callable cb: callback to call after timer fires
+        :param args: positional arguments to pass to the callback
+        :param kwargs: keyword arguments to pass to the callback
+        :return: timer object that can be cancelled
+        :rtype: hubs.abc.Timer
+        """
+        t = self.wheel.add(seconds, cb, *args, **kwargs)
+
+        expiry = t.tick * self.wheel.resolution
+        if self.wheel_timer is None:
+            self._arm_wheel(self.wheel.next_expiry())
+        elif expiry < self.wheel_timer.absolute_time:
+            self._arm_wheel(expiry)
+
+        return t
+
+    def _arm_wheel(self, expiry):
+        """Schedule `self.wheel_timer` to advance the timing wheel at the specified monotonic time
+
+        :param float expiry: monotonic time
+        """
+        if self.wheel_timer is not None:
+            self.wheel_timer.cancel()
+
+        self.wheel_timer = self.schedule_call_global(max(expiry - self.now(), 0),
+                                                     self._advance_wheel)
+
+    def _advance_wheel(self):
+        self.wheel_timer = None
+        # use the same tolerance as the global timers, which may fire `wheel_timer` slightly early
+        for exc_info in self.wheel.advance(self.now() + self.timer_resolution):
+            self._squelch_exception(exc_info)
+
+        if self.wheel_timer is None and self.wheel:
+            self._arm_wheel(self.wheel.next_expiry())
+
+    def _wheel_empty(self):
+        if self.wheel_timer is not None:
+            self.wheel_timer.cancel()
+            self.wheel_timer = None
+
     @abstractmethod
     def add(self, evtype, fd, cb, tb, cb_args=()):
         """Signal the hub to watch the given file descriptor for an I/O event
@@ -93,7 +387,9 @@ class AbstractHub(greenlet.greenlet, metaclass=ABCMeta):
         When the file descriptor is ready for the specified I/O event type, `cb` is called with
         the specified `cb_args`.
 
-        :param int evtype: either the constant READ or WRITE
+        :param int evtype: the constant READ or WRITE, or READ | WRITE to be notified when the file
+            is ready for either; a READ listener and a WRITE listener may be added for the same file
+            descriptor at the same time
         :param int fd: file number of the file of interest
         :param cb: callback which will be called when the file is ready for reading/writing
         :param tb: throwback used to signal (into the greenlet) that the file was closed
@@ -115,12 +411,58 @@ class AbstractHub(greenlet.greenlet, metaclass=ABCMeta):
         """
         pass
 
+    def now(self):
+        """Get the current monotonic time (seconds)
+
+        Hubs may cache this value once per event loop iteration (like libuv's ``uv_now()``), so it
+        is cheap to call in hot paths, but does not advance while callbacks are running. All
+        timers are scheduled relative to this time. Call :meth:`update_time` to refresh it.
+
+        :rtype: float
+        """
+        return time.monotonic()
+
+    def update_time(self):
+        """Refresh the time returned by :meth:`now`
+        """
+        pass
+
     def switch(self):
         """Switch to the hub greenlet
         """
         assert greenlet.getcurrent() is not self, 'Cannot switch to the hub from the hub'
+        self.switches += 1
         return super().switch()
 
+    def set_time_slice(self, seconds):
+        """Enable or disable tracking how long the current greenlet has been running
+
+        When enabled, a greenlet trace function (see :func:`greenlet.settrace`) records the time of
+        every greenlet switch in the hub's thread, and :func:`~guv.hubs.switch.maybe_yield` only
+        yields once the current greenlet has been running for at least `seconds`. Tracing adds a
+        small cost to every switch, so this is disabled by default.
+
+        This must be called from the hub's thread.
+
+        :param seconds: time slice in seconds, or None to disable
+        :type seconds: float or None
+        """
+        if seconds is not None and self.time_slice is None:
+            self._previous_trace = greenlet.settrace(self._trace_switch)
+        elif seconds is None and self.time_slice is not None:
+            greenlet.settrace(self._previous_trace)
+            self._previous_trace = None
+
+        self.time_slice = seconds
+        self.slice_started = time.monotonic()
+
+    def _trace_switch(self, event, args):
+        """Greenlet trace function which starts a new time slice on every switch
+        """
+        self.slice_started = time.monotonic()
+        if self._previous_trace is not None:
+            self._previous_trace(event, args)
+
     def notify_opened(self, fd):
         """Mark the specified file descriptor as recently opened
 
@@ -143,21 +485,37 @@ class AbstractHub(greenlet.greenlet, metaclass=ABCMeta):
 
         return found
 
+    def notify_close(self, fd):
+        """Mark the specified file descriptor as about to be closed
+
+        Any listeners for the file descriptor are removed, and any resources the hub keeps alive for
+        it (such as a long-lived poll handle) are released before the file descriptor can be
+        recycled by the OS.
+
+        :param int fd: file descriptor
+        :return: True if found else false
+        """
+        return self.notify_opened(fd)
+
     def _add_listener(self, listener):
         """Add listener to internal dictionary
 
+        A listener for READ | WRITE is added to both the READ and the WRITE buckets.
+
         :type listener: abc.AbstractListener
-        :raise RuntimeError: if attempting to add multiple listeners with the same `evtype` and `fd`
+        :raise RuntimeError: if attempting to add multiple listeners for the same event type and
+            `fd`
         """
-        evtype = listener.evtype
         fd = listener.fd
 
-        bucket = self.listeners[evtype]
-        if fd in bucket:
-            raise RuntimeError('Multiple {evtype} on {fd} not supported'
-                               .format(evtype=evtype, fd=fd))
-        else:
-            bucket[fd] = listener
+        evtypes = [evtype for evtype in (READ, WRITE) if listener.evtype & evtype]
+        for evtype in evtypes:
+            if fd in self.listeners[evtype]:
+                raise RuntimeError('Multiple {evtype} on {fd} not supported'
+                                   .format(evtype=evtype, fd=fd))
+
+        for evtype in evtypes:
+            self.listeners[evtype][fd] = listener
 
     def _remove_listener(self, listener):
         """Remove listener
@@ -165,8 +523,9 @@ class AbstractHub(greenlet.greenlet, metaclass=ABCMeta):
         :param listener: listener to remove
         :type listener: self.Listener
         """
-        self.listeners[listener.evtype][listener.fd] = None
-        del self.listeners[listener.evtype][listener.fd]
+        for evtype, bucket in self.listeners.items():
+            if listener.evtype & evtype and bucket.get(listener.fd) is listener:
+                del bucket[listener.fd]
 
     def _squelch_exception(self, exc_info):
         if self._debug_exceptions and not issubclass(exc_info[0], NOT_ERROR):
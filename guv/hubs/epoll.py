@@ -0,0 +1,395 @@
+"""Loop implementation using :func:`select.epoll`
+
+This hub has no dependencies outside of the standard library (it does not require libuv or a cffi
+compile step), and does less work per wakeup than the libuv hubs. It is only available on Linux.
+
+Notes:
+
+- Like the libuv hubs, the loop exits (:meth:`Hub.run` returns) when there is nothing left to wait
+  for: no listeners, no pending timers and no scheduled callbacks.
+- Each loop iteration fires expired timers, then callbacks scheduled with
+  :meth:`Hub.schedule_call_now` (up to the hub's callback budget), then polls for I/O with a
+  timeout of zero (if callbacks are scheduled) or until the earliest pending timer expires, and
+  finally dispatches I/O events.
+- Timers scheduled with :meth:`Hub.schedule_call_global` are kept in a heap; the epoll timeout is
+  derived from the earliest pending timer, so no extra file descriptor is needed for timers.
+- File descriptors are unregistered from the epoll object when their last listener is removed,
+  since they may be closed (and their numbers reused) without the hub being notified. While a
+  file descriptor has listeners in level-triggered mode, the registration is only modified when the
+  hub needs to wait for an event which is not already registered, or when it receives an event
+  nobody is waiting for.
+- Callbacks scheduled from other threads with :meth:`Hub.schedule_call_threadsafe` wake up the
+  loop through an eventfd (or a pipe on Python < 3.10), which is registered with the epoll object
+  for the lifetime of the hub.
+- In edge-triggered mode (``GUV_EPOLL_EDGE=1``), each file descriptor is registered once for both
+  reading and writing and never modified. Readiness reported while nobody is waiting for it is
+  remembered and delivered to the next listener, which may therefore be woken up spuriously; every
+  caller of :func:`~guv.hubs.switch.trampoline` already retries the operation and waits again if it
+  would still block.
+"""
+import logging
+import os
+import select
+import greenlet
+import sys
+import time
+
+from . import abc, timer
+from ..const import READ, WRITE, PRIORITY_NORMAL
+
+log = logging.getLogger('guv')
+
+#: use edge-triggered notifications by default
+EDGE_TRIGGERED = os.environ.get('GUV_EPOLL_EDGE', '') not in ('', '0')
+
+#: events which wake up readers and writers
+READ_MASK = select.EPOLLIN | select.EPOLLPRI | select.EPOLLRDHUP | select.EPOLLERR | select.EPOLLHUP
+WRITE_MASK = select.EPOLLOUT | select.EPOLLERR | select.EPOLLHUP
+
+#: event mask of file descriptors registered in edge-triggered mode
+EDGE_EVENTS = (select.EPOLLIN | select.EPOLLPRI | select.EPOLLRDHUP | select.EPOLLOUT |
+               select.EPOLLET)
+
+
+def _epoll_events(evtype):
+    """Convert a READ/WRITE event type to an epoll event mask
+
+    :rtype: int
+    """
+    events = 0
+    if evtype & READ:
+        events |= select.EPOLLIN | select.EPOLLPRI | select.EPOLLRDHUP
+    if evtype & WRITE:
+        events |= select.EPOLLOUT
+    return events
+
+
+class EpollListener(abc.AbstractListener):
+    def __init__(self, evtype, fd, cb, cb_args=()):
+        """
+        :param cb: callback which will be called when the file is ready for reading/writing
+        :param tuple cb_args: callback positional arguments
+        """
+        super().__init__(evtype, fd)
+        self.cb = cb
+        self.cb_args = cb_args
+
+
+class Hub(abc.AbstractHub):
+    def __init__(self, edge_triggered=None):
+        """
+        :param bool edge_triggered: (optional) use edge-triggered notifications; defaults to
+            :data:`EDGE_TRIGGERED`
+        """
+        self.running = False
+
+        # cached monotonic time, refreshed after polling for I/O (it is not cached at all while the
+        # loop is not running)
+        self._time = 0.0
+
+        super().__init__()
+        self.Listener = EpollListener
+
+        self.edge_triggered = EDGE_TRIGGERED if edge_triggered is None else edge_triggered
+        self.epoll = select.epoll()
+
+        #: Event mask each file descriptor is currently registered with
+        #: :type: dict[int, int]
+        self.registered = {}
+
+        #: Edge-triggered mode only: events reported for each file descriptor while nobody was
+        #: waiting for them
+        #: :type: dict[int, int]
+        self.ready = {}
+
+        #: Heap of timers scheduled by :meth:`schedule_call_global`
+        self.timers = timer.TimerHeap(clock=self.now)
+
+        # file descriptors used to wake up the loop from other threads
+        if hasattr(os, 'eventfd'):
+            self._wakeup_r = self._wakeup_w = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+        else:
+            self._wakeup_r, self._wakeup_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        self.epoll.register(self._wakeup_r, select.EPOLLIN)
+
+    def now(self):
+        if not self.running:
+            return time.monotonic()
+
+        return self._time
+
+    def update_time(self):
+        self._time = time.monotonic()
+
+    def run(self):
+        assert self is greenlet.getcurrent()
+
+        if self.stopping:
+            return
+
+        if self.running:
+            raise RuntimeError("The hub's runloop is already running")
+
+        log.debug('Start runloop')
+        try:
+            self.running = True
+            self.stopping = False
+            self.run_started = time.monotonic()
+            self.update_time()
+            while not self.stopping:
+                self._fire_timers()
+                self._run_callbacks()
+                if self.stopping:
+                    break
+
+                if self.callbacks:
+                    timeout = 0
+                else:
+                    expiry = self.timers.next_expiry()
+                    if expiry is not None:
+                        timeout = max(expiry - self.now(), 0)
+                    elif (self.listeners[READ] or self.listeners[WRITE] or self.threadsafe_refs
+                          or self.threadsafe_callbacks):
+                        timeout = -1
+                    else:
+                        # nothing left to wait for
+                        break
+
+                self._poll(timeout)
+        finally:
+            self.run_time += time.monotonic() - self.run_started
+            self.run_started = None
+            self.running = False
+            self.stopping = False
+
+    def abort(self):
+        log.debug('Abort loop')
+        if self.running:
+            self.stopping = True
+
+    def _fire_timers(self):
+        now = self.now()
+        expiry = self.timers.next_expiry()
+        if expiry is not None and expiry <= now:
+            self._record_lag(expiry)
+
+        for exc_info in self.timers.advance(now):
+            self._squelch_exception(exc_info)
+
+    def _poll(self, timeout):
+        """Poll for I/O and dispatch events
+
+        :param float timeout: maximum time to wait in seconds, or -1 to wait indefinitely
+        """
+        started = time.monotonic()
+        self.polling = True
+        try:
+            events = self.epoll.poll(timeout)
+        except InterruptedError:
+            # a signal handler was called; start the next loop iteration
+            events = ()
+        finally:
+            self.polling = False
+            self.update_time()
+            self.poll_time += self._time - started
+
+        for fd, epoll_events in events:
+            if fd == self._wakeup_r:
+                self._read_wakeup()
+                continue
+
+            evtype = 0
+            if epoll_events & READ_MASK:
+                evtype |= READ
+            if epoll_events & WRITE_MASK:
+                evtype |= WRITE
+
+            self._dispatch(fd, evtype)
+
+    def _wakeup(self):
+        try:
+            # an eventfd requires an 8-byte integer
+            os.write(self._wakeup_w, b'\x01\x00\x00\x00\x00\x00\x00\x00')
+        except BlockingIOError:
+            # the counter or pipe is full, so the loop will wake up anyway
+            pass
+
+    def _read_wakeup(self):
+        """Reset the wakeup file descriptor and run callbacks scheduled from other threads
+        """
+        try:
+            os.read(self._wakeup_r, 4096)
+        except BlockingIOError:
+            pass
+
+        self._run_threadsafe_callbacks()
+
+    def _dispatch(self, fd, evtype):
+        """Dispatch readiness to the listener registered for each event type
+
+        A reader and a writer can wait on the same file descriptor at the same time; a READ | WRITE
+        listener is only called once.
+
+        :param int fd: file descriptor
+        :param int evtype: READ, WRITE, or READ | WRITE
+        """
+        called = None
+        unwanted = 0
+        for t in (READ, WRITE):
+            if not evtype & t:
+                continue
+
+            # look the listener up each time: calling the previous listener's callback may have
+            # removed or replaced this one
+            listener = self.listeners[t].get(fd)
+            if listener is None:
+                unwanted |= t
+                continue
+
+            if self.edge_triggered:
+                ready = self.ready.get(fd, 0) & ~listener.evtype
+                if ready:
+                    self.ready[fd] = ready
+                else:
+                    self.ready.pop(fd, None)
+
+            if listener is called:
+                continue
+
+            called = listener
+
+            try:
+                listener.cb(*listener.cb_args)
+            except:
+                self._squelch_exception(sys.exc_info())
+
+                try:
+                    self.remove(listener)
+                except Exception as e:
+                    sys.stderr.write('Exception while removing listener: {}\n'.format(e))
+                    sys.stderr.flush()
+
+        if unwanted and fd in self.registered:
+            if self.edge_triggered:
+                # the edge will not be reported again, so remember it for the next listener
+                self.ready[fd] = self.ready.get(fd, 0) | unwanted
+            else:
+                # stop level-triggered events nobody is waiting for from being reported repeatedly
+                self._register(fd, self._wanted_events(fd))
+
+    def stats(self):
+        """Get a snapshot of the event loop's statistics
+
+        In addition to the entries documented in :meth:`AbstractHub.stats`, the snapshot contains
+        `timers` (number of pending timers scheduled with :meth:`schedule_call_global`) and
+        `registered_fds` (number of file descriptors registered with the epoll object).
+
+        :rtype: dict
+        """
+        stats = super().stats()
+        stats['timers'] = len(self.timers)
+        stats['registered_fds'] = len(self.registered)
+        return stats
+
+    def schedule_call_now(self, cb, *args, priority=PRIORITY_NORMAL, **kwargs):
+        self.callbacks.queues[priority].append((cb, args, kwargs))
+
+    def schedule_call_global(self, seconds, cb, *args, **kwargs):
+        return self.timers.add(seconds, cb, *args, **kwargs)
+
+    def add(self, evtype, fd, cb, tb, cb_args=()):
+        listener = EpollListener(evtype, fd, cb, cb_args)
+        self._add_listener(listener)
+
+        try:
+            if self.edge_triggered:
+                if fd not in self.registered:
+                    self._register(fd, EDGE_EVENTS)
+                elif self.ready.get(fd, 0) & evtype:
+                    # readiness was reported while nobody was waiting for it
+                    self.schedule_call_now(self._dispatch, fd, self.ready[fd] & evtype)
+            else:
+                events = self._wanted_events(fd)
+                if events & ~self.registered.get(fd, 0):
+                    self._register(fd, events)
+        except:
+            self._remove_listener(listener)
+            raise
+
+        return listener
+
+    def remove(self, listener):
+        """Remove listener
+
+        The file descriptor is unregistered if this was its last listener: the file may be closed
+        without :meth:`notify_close` being called, and a stale registration would prevent a new file
+        with the same file descriptor number from being registered.
+
+        :param listener: listener to remove
+        :type listener: self.Listener
+        """
+        self._remove_listener(listener)
+
+        fd = listener.fd
+        if fd not in self.listeners[READ] and fd not in self.listeners[WRITE]:
+            self.ready.pop(fd, None)
+            self._register(fd, 0)
+
+    def notify_opened(self, fd):
+        found = super().notify_opened(fd)
+        self.ready.pop(fd, None)
+        if self.registered.pop(fd, None) is not None:
+            try:
+                self.epoll.unregister(fd)
+            except (OSError, ValueError):
+                # already closed (and therefore removed from the epoll set by the OS)
+                pass
+
+        return found
+
+    def _wanted_events(self, fd):
+        """Get the combined epoll event mask of all listeners for the specified file descriptor
+
+        :rtype: int
+        """
+        evtype = 0
+        for t, bucket in self.listeners.items():
+            if fd in bucket:
+                evtype |= t
+
+        return _epoll_events(evtype)
+
+    def _register(self, fd, events):
+        """Register (or re-register) the file descriptor with the specified epoll event mask
+
+        The file descriptor is unregistered if `events` is 0, since EPOLLHUP and EPOLLERR are
+        always reported.
+
+        :param int fd: file descriptor
+        :param int events: epoll event mask
+        """
+        registered = self.registered.get(fd)
+        if not events:
+            if registered is not None:
+                del self.registered[fd]
+                try:
+                    self.epoll.unregister(fd)
+                except OSError:
+                    # already closed (and therefore removed from the epoll set by the OS)
+                    pass
+            return
+
+        if registered is None:
+            try:
+                self.epoll.register(fd, events)
+            except FileExistsError:
+                # registered by a previous owner of this file descriptor number
+                self.epoll.modify(fd, events)
+        else:
+            try:
+                self.epoll.modify(fd, events)
+            except FileNotFoundError:
+                # the previous file with this file descriptor number was closed
+                self.epoll.register(fd, events)
+
+        self.registered[fd] = events
@@ -20,12 +20,27 @@ def notify_opened(fd):
     external library, etc. When the OS returns a file descriptor from an `open()` (or something
     similar), this may be the only indication we have that the FD has been closed and then recycled.
     We let the hub know that the old file descriptor is dead; any stuck listeners will be disabled
-    and notified in turn.
+    and notified in turn. Nothing is done if no hub has been created for the current thread.
 
     :param int fd: file descriptor
     """
-    hub = get_hub()
-    hub.notify_opened(fd)
+    hub = getattr(_threadlocal, 'hub', None)
+    if hub is not None:
+        hub.notify_opened(fd)
+
+
+def notify_close(fd):
+    """Mark the specified file descriptor as about to be closed
+
+    This gives the hub a chance to release any resources it keeps alive for the file descriptor
+    (such as a long-lived poll handle) before the OS can recycle it. Nothing is done if no hub has
+    been created for the current thread.
+
+    :param int fd: file descriptor
+    """
+    hub = getattr(_threadlocal, 'hub', None)
+    if hub is not None:
+        hub.notify_close(fd)
 
 
 def get_default_hub():
@@ -0,0 +1,12 @@
+"""Loop implementation using the pyuv C extension
+
+Handle callbacks are called directly by pyuv's C code, without going through cffi callbacks. See
+:mod:`guv.hubs.uv` for details.
+"""
+import pyuv
+
+from . import uv
+
+
+class Hub(uv.Hub):
+    pyuv = pyuv
@@ -0,0 +1,47 @@
+"""Event loop statistics
+
+See :meth:`guv.hubs.abc.AbstractHub.stats`.
+"""
+import bisect
+
+#: upper bounds of the buckets of the callbacks per loop iteration histogram
+CALLBACKS_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+#: upper bounds of the buckets of the loop lag histogram (seconds)
+LAG_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+
+class Histogram:
+    """Histogram with fixed buckets
+    """
+
+    def __init__(self, bounds):
+        """
+        :param bounds: sorted upper bounds (inclusive) of the buckets; values above the highest
+            bound are counted in an additional bucket
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        """
+        :return: dict with the number of values, their sum and maximum, and a list of `(upper bound,
+            count)` tuples
+        :rtype: dict
+        """
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'buckets': list(zip(self.bounds + (float('inf'),), self.counts)),
+        }
@@ -1,9 +1,10 @@
 import greenlet
+import time
 
 from .hub import get_hub
 from ..timeout import Timeout
 
-__all__ = ['gyield', 'trampoline']
+__all__ = ['gyield', 'maybe_yield', 'trampoline']
 
 
 def gyield(switch_back=True):
@@ -29,7 +30,21 @@ def gyield(switch_back=True):
     hub.switch()
 
 
-def trampoline(fd, evtype, timeout=None, timeout_exc=Timeout):
+def maybe_yield():
+    """Yield to other greenlets if the current greenlet's time slice is exhausted
+
+    This is meant to be called frequently from CPU-heavy loops (such as encoding a large result or
+    rendering a template). If time slices are tracked (see
+    :meth:`~guv.hubs.abc.AbstractHub.set_time_slice`), it only calls :func:`gyield` once the current
+    greenlet has been running without switching for at least the hub's time slice, and is
+    otherwise cheap. If time slices are not tracked, it always calls :func:`gyield`.
+    """
+    hub = get_hub()
+    if hub.time_slice is None or time.monotonic() - hub.slice_started >= hub.time_slice:
+        gyield()
+
+
+def trampoline(fd, evtype, timeout=None, timeout_exc=Timeout, coarse=False):
     """Jump from the current greenlet to the hub and wait until the given file descriptor is ready
     for I/O, or the specified timeout elapses
 
@@ -42,13 +57,18 @@ def trampoline(fd, evtype, timeout=None, timeout_exc=Timeout):
     Conditions:
 
     - must not be called from the hub greenlet (can be called from any other greenlet)
-    - `evtype` must be either :attr:`~guv.const.READ` or :attr:`~guv.const.WRITE` (not possible to
-      watch for  both  simultaneously)
+    - `evtype` must be :attr:`~guv.const.READ`, :attr:`~guv.const.WRITE`, or ``READ | WRITE`` to
+      wait until the file descriptor is ready for either
+    - only one greenlet may wait for each event type on a file descriptor, but one greenlet may wait
+      for READ while another waits for WRITE on the same file descriptor (for example, separate
+      reader and writer greenlets on a full-duplex connection)
 
     :param int fd: file descriptor
-    :param int evtype: either the constant :attr:`~guv.const.READ` or :attr:`~guv.const.WRITE`
+    :param int evtype: :attr:`~guv.const.READ`, :attr:`~guv.const.WRITE`, or ``READ | WRITE``
     :param float timeout: (optional) maximum time to wait in seconds
     :param Exception timeout_exc: (optional) timeout Exception class
+    :param bool coarse: (optional) schedule the timeout with coarse resolution (see
+        :meth:`~guv.hubs.abc.AbstractHub.schedule_call_coarse`)
     """
     #: :type: AbstractHub
     hub = get_hub()
@@ -63,7 +83,10 @@ def trampoline(fd, evtype, timeout=None, timeout_exc=Timeout):
             # timeout has passed
             current.throw(exc)
 
-        timer = hub.schedule_call_global(timeout, _timeout, timeout_exc)
+        if coarse:
+            timer = hub.schedule_call_coarse(timeout, _timeout, timeout_exc)
+        else:
+            timer = hub.schedule_call_global(timeout, _timeout, timeout_exc)
 
     try:
         # add a watcher for this file descriptor
@@ -3,6 +3,8 @@ import io
 import greenlet
 import time
 import functools
+import heapq
+import sys
 
 from . import abc
 from guv import compat
@@ -31,7 +33,7 @@ class Timer(abc.AbstractTimer):
         This timer will not be run unless it is scheduled calling :meth:`schedule`.
         """
         self.seconds = seconds
-        self.absolute_time = time.monotonic() + seconds  # absolute time to fire the timer
+        self.absolute_time = self.now() + seconds  # absolute time to fire the timer
         self.tpl = cb, args, kwargs
 
         self.called = False
@@ -40,6 +42,14 @@ class Timer(abc.AbstractTimer):
             self.traceback = io.StringIO()
             traceback.print_stack(file=self.traceback)
 
+    def now(self):
+        """Get the current monotonic time
+
+        Subclasses may override this to use a cached time source, such as :meth:`Hub.now()
+        <guv.hubs.abc.AbstractHub.now>`.
+        """
+        return time.monotonic()
+
     @property
     def pending(self):
         return not self.called
@@ -106,3 +116,359 @@ class LocalTimer(Timer):
     def cancel(self):
         self.greenlet = None
         super().cancel()
+
+
+class HeapTimer(Timer):
+    """Timer scheduled on a :class:`TimerHeap`
+
+    Cancellation is lazy: a cancelled timer stays in the heap until it reaches the top of the heap
+    or the heap is compacted. The heap is notified so that it can keep track of the number of timers
+    which are still pending.
+    """
+
+    def __init__(self, heap, seconds, cb, *args, **kwargs):
+        """
+        :param TimerHeap heap: heap this timer is scheduled on
+        """
+        self.heap = heap
+        super().__init__(seconds, cb, *args, **kwargs)
+
+    def now(self):
+        return self.heap.clock()
+
+    def cancel(self):
+        if not self.called:
+            self.called = True
+            del self.tpl  # don't keep the callback (and its greenlet) alive until the timer expires
+            self.heap.remove(self)
+
+
+class TimerHeap:
+    """Heap of timers ordered by expiry time
+
+    Like :class:`TimerWheel`, the heap does not run by itself: the owner (usually the hub) must call
+    :meth:`advance` at the time returned by :meth:`next_expiry`.
+    """
+
+    #: minimum number of cancelled timers allowed to accumulate in the heap before it is compacted
+    compact_threshold = 1024
+
+    def __init__(self, on_empty=None, clock=time.monotonic):
+        """
+        :param Callable on_empty: (optional) called when the last pending timer is cancelled
+        :param Callable clock: (optional) function returning the current monotonic time
+        """
+        self.on_empty = on_empty
+        self.clock = clock
+
+        #: :type: list[HeapTimer]
+        self.heap = []
+        self.count = 0  # number of timers in the heap which have not been cancelled
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return (t for t in self.heap if not t.called)
+
+    def add(self, seconds, cb, *args, **kwargs):
+        """Schedule `cb` to be called after `seconds` have elapsed
+
+        :return: timer object that can be cancelled
+        :rtype: HeapTimer
+        """
+        t = HeapTimer(self, seconds, cb, *args, **kwargs)
+        heapq.heappush(self.heap, t)
+        self.count += 1
+        return t
+
+    def remove(self, t):
+        """Called by :meth:`HeapTimer.cancel`
+
+        When no timers are pending, the heap is emptied. Otherwise, the heap is compacted once
+        cancelled timers make up most of it.
+
+        :type t: HeapTimer
+        """
+        self.count -= 1
+        if not self.count:
+            self.heap.clear()
+            if self.on_empty is not None:
+                self.on_empty()
+        elif len(self.heap) > 2 * self.count + self.compact_threshold:
+            self.heap[:] = [t for t in self.heap if not t.called]
+            heapq.heapify(self.heap)
+
+    def advance(self, now=None):
+        """Call the callbacks of all expired timers
+
+        Only timers which expired before this method was called are fired; timers scheduled by the
+        callbacks are left for the next call, even if they have already expired.
+
+        :param float now: (optional) current monotonic time
+        :return: exceptions raised by timer callbacks, as :func:`sys.exc_info` tuples
+        :rtype: list[tuple]
+        """
+        if now is None:
+            now = self.clock()
+
+        heap = self.heap
+        expired = []
+        while heap and heap[0].absolute_time <= now:
+            t = heapq.heappop(heap)
+            if not t.called:  # else lazily cancelled
+                expired.append(t)
+
+        errors = []
+        for t in expired:
+            if t.called:
+                # cancelled by a previous callback
+                continue
+
+            self.count -= 1
+            try:
+                t()
+            except:
+                errors.append(sys.exc_info())
+
+        return errors
+
+    def next_expiry(self):
+        """Get the expiry time of the earliest pending timer
+
+        :return: monotonic time, or None if no timers are scheduled
+        :rtype: float or None
+        """
+        heap = self.heap
+        while heap and heap[0].called:
+            heapq.heappop(heap)
+
+        return heap[0].absolute_time if heap else None
+
+
+class WheelTimer(abc.AbstractTimer):
+    """Timer scheduled on a :class:`TimerWheel`
+
+    Calling the timer object will call the callback
+    """
+
+    def __init__(self, wheel, tick, cb, *args, **kwargs):
+        """
+        :param TimerWheel wheel: wheel this timer is scheduled on
+        :param int tick: wheel tick at which the timer expires
+        :param Callable cb: callback to call when the timer has expired
+        :param args: positional arguments to pass to cb
+        :param kwargs: keyword arguments to pass to cb
+        """
+        self.wheel = wheel
+        self.tick = tick
+        self.tpl = cb, args, kwargs
+        self.called = False
+        self.slot = None  # set containing this timer in the wheel
+
+    @property
+    def pending(self):
+        return not self.called
+
+    def __repr__(self):
+        cb, args, kw = getattr(self, 'tpl', (None, None, None))
+        return "WheelTimer(tick=%s, %s, *%s, **%s)" % (self.tick, cb, args, kw)
+
+    def cancel(self):
+        if not self.called:
+            self.called = True
+            del self.tpl
+            self.wheel.remove(self)
+
+    def __call__(self):
+        if not self.called:
+            self.called = True
+            cb, args, kw = self.tpl
+            del self.tpl
+            cb(*args, **kw)
+
+
+class TimerWheel:
+    """Hierarchical timing wheel for coarse-grained timers
+
+    Expiry times are rounded up to a multiple of `resolution` (a tick) and each timer is placed into
+    a slot of one of several wheels, so inserting and cancelling a timer are O(1). This makes the
+    wheel suitable for very large numbers of timers which are usually cancelled before they expire,
+    such as idle timeouts.
+
+    The wheel does not run by itself: the owner (usually the hub) must call :meth:`advance` at the
+    time returned by :meth:`next_expiry`.
+    """
+
+    def __init__(self, resolution=0.01, slot_bits=6, levels=4, on_empty=None, clock=time.monotonic):
+        """
+        :param float resolution: duration of a tick (seconds)
+        :param int slot_bits: log2 of the number of slots per wheel
+        :param int levels: number of wheels (at least 1); timers further in the future than the
+            outer wheel can hold are kept in an overflow set until the outer wheel wraps around
+        :param Callable on_empty: (optional) called when the last timer is cancelled
+        :param Callable clock: (optional) function returning the current monotonic time
+        """
+        if levels < 1:
+            raise ValueError('levels must be at least 1')
+
+        self.resolution = resolution
+        self.slot_bits = slot_bits
+        self.slot_mask = (1 << slot_bits) - 1
+        self.wheels = [[set() for _ in range(1 << slot_bits)] for _ in range(levels)]
+        self.overflow = set()
+        self.on_empty = on_empty
+        self.clock = clock
+
+        self.tick = 0  # caught up with the clock when a timer is added to the empty wheel
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _to_tick(self, t):
+        # allow for floating point error, so that tick boundaries returned by `next_expiry()` map
+        # back to the same tick
+        return int(t / self.resolution + 1e-6)
+
+    def _index(self, level):
+        return (self.tick >> (self.slot_bits * level)) & self.slot_mask
+
+    def add(self, seconds, cb, *args, **kwargs):
+        """Schedule `cb` to be called after at least `seconds` have elapsed
+
+        :return: timer object that can be cancelled
+        :rtype: WheelTimer
+        """
+        now = self.clock()
+        if not self.count:
+            # nothing is scheduled, so there is nothing to catch up on
+            self.tick = max(self.tick, self._to_tick(now))
+
+        # round up to the next tick boundary after the expiry time; the wheel may already be
+        # ahead of the clock (the hub advances it slightly early), and timers must not be put into
+        # slots it has passed
+        tick = max(self._to_tick(now + seconds) + 1, self.tick + 1)
+        t = WheelTimer(self, tick, cb, *args, **kwargs)
+        self._insert(t)
+        self.count += 1
+        return t
+
+    def remove(self, t):
+        """Remove a timer from the wheel
+
+        :type t: WheelTimer
+        """
+        if t.slot is None:
+            # already taken out of the wheel by `advance()`
+            return
+
+        t.slot.discard(t)
+        t.slot = None
+        self.count -= 1
+        if not self.count and self.on_empty is not None:
+            self.on_empty()
+
+    def _insert(self, t):
+        """Insert a timer into the innermost wheel which shares all higher-order tick bits with the
+        current tick
+        """
+        level = 0
+        diff = (t.tick ^ self.tick) >> self.slot_bits
+        while diff:
+            diff >>= self.slot_bits
+            level += 1
+
+        if level < len(self.wheels):
+            slot = self.wheels[level][(t.tick >> (self.slot_bits * level)) & self.slot_mask]
+        else:
+            slot = self.overflow
+
+        slot.add(t)
+        t.slot = slot
+
+    def _cascade(self, level):
+        """Move the timers in the current slot of the wheel at `level` to the inner wheels
+        """
+        index = self._index(level)
+        wheel = self.wheels[level]
+        slot = wheel[index]
+        if slot:
+            wheel[index] = set()
+            for t in slot:
+                self._insert(t)
+
+    def advance(self, now=None):
+        """Call the callbacks of all expired timers
+
+        :param float now: (optional) current monotonic time
+        :return: exceptions raised by timer callbacks, as :func:`sys.exc_info` tuples
+        :rtype: list[tuple]
+        """
+        if now is None:
+            now = self.clock()
+
+        errors = []
+        target = self._to_tick(now)
+        wheel = self.wheels[0]
+        top = len(self.wheels) - 1
+        while self.tick < target and self.count:
+            self.tick += 1
+            index = self.tick & self.slot_mask
+
+            if index == 0:
+                # the inner wheel has wrapped around; cascade the outer wheels, starting with the
+                # outermost one which has moved, so that timers can move down several levels
+                level = 1
+                while level <= top and self._index(level) == 0:
+                    level += 1
+
+                if level > top and self.overflow:
+                    # the outer wheel has wrapped around too
+                    overflow = self.overflow
+                    self.overflow = set()
+                    for t in overflow:
+                        self._insert(t)
+
+                for l in range(min(level, top), 0, -1):
+                    self._cascade(l)
+
+            slot = wheel[index]
+            if not slot:
+                continue
+
+            wheel[index] = set()
+            self.count -= len(slot)
+            for t in slot:
+                t.slot = None
+
+            for t in slot:
+                try:
+                    t()
+                except:
+                    errors.append(sys.exc_info())
+
+        if not self.count:
+            self.tick = max(self.tick, target)
+
+        return errors
+
+    def next_expiry(self):
+        """Get the time at which :meth:`advance` must next be called
+
+        This is the expiry time of the earliest occupied slot of the inner wheel, or the time at
+        which the inner wheel wraps around and the outer wheels must be cascaded.
+
+        :return: monotonic time, or None if no timers are scheduled
+        :rtype: float or None
+        """
+        if not self.count:
+            return None
+
+        wheel = self.wheels[0]
+        index = self.tick & self.slot_mask
+        for i in range(index + 1, self.slot_mask + 1):
+            if wheel[i]:
+                return (self.tick - index + i) * self.resolution
+
+        return (self.tick - index + self.slot_mask + 1) * self.resolution
@@ -0,0 +1,412 @@
+"""Loop implementation using libuv through the pyuv interface
+
+The libuv handles are created using the module in :attr:`Hub.pyuv`, which is set by the
+:mod:`guv.hubs.pyuv_cffi` and :mod:`guv.hubs.pyuv` hubs. To ensure compatibility with pyuv, doing
+`import pyuv as pyuv_cffi` must cause the loop to behave in exactly the same way as with pyuv_cffi.
+
+Notes:
+
+- The loop is free to exit (:meth:`Loop.run` is free to return) when there are no non-internal
+  handles/callbacks remaining - that is, when there are no more Poll/Timer handles and no more
+  callbacks scheduled.
+- Timers scheduled with :meth:`Hub.schedule_call_global` are kept in a heap, and a single Timer
+  handle is armed for the earliest one. The Timer handle is stopped when no timers are pending, so
+  cancelled timers do not keep the loop alive.
+- The loop has five internal handles at all times: Signal (to watch for SIGINT), Prepare (to run
+  scheduled callbacks), Idle (to ensure a zero-timeout poll when callbacks are scheduled), Check
+  (to unref the Prepare handle if there are no remaining scheduled callbacks), and Async (to wake
+  up the loop from other threads). The Signal and Check handles are unreferenced since they are
+  static and will not keep the loop alive. The Idle handle is *only* active if callbacks are
+  scheduled and will not keep the loop alive. The Async handle is only referenced while callbacks
+  are expected from other threads (see :meth:`Hub.ref_threadsafe`). Otherwise, the Prepare handle
+  is the only remaining handle which has any control over whether or not the loop exits when no
+  other handles are active. Therefore, the Prepare handle must only be unreferenced when there are
+  no callbacks scheduled and *must* be referenced at all other times.
+"""
+import signal
+import logging
+import greenlet
+import sys
+import time
+
+from guv.hubs.abc import AbstractListener
+from . import abc, timer
+from ..const import READ, WRITE, PRIORITY_NORMAL
+
+log = logging.getLogger('guv')
+
+#: resolution of libuv timers (seconds)
+TIMER_RESOLUTION = 0.001
+
+
+class UvFdListener(AbstractListener):
+    def __init__(self, evtype, fd, handle, cb, cb_args=()):
+        """
+        :param handle: pyuv Handle object
+        :type handle: pyuv.Handle
+        :param cb: callback which will be called when the file is ready for reading/writing
+        :param tuple cb_args: callback positional arguments
+        """
+        super().__init__(evtype, fd)
+        self.handle = handle
+        self.cb = cb
+        self.cb_args = cb_args
+
+
+class Hub(abc.AbstractHub):
+    #: module implementing the pyuv interface, such as `pyuv_cffi` or `pyuv`
+    pyuv = None
+
+    # libuv timers have millisecond resolution; firing timers which expire within the next
+    # millisecond avoids re-arming the timer handle for a sub-millisecond (zero) timeout
+    timer_resolution = TIMER_RESOLUTION
+
+    def __init__(self):
+        super().__init__()
+        self.Listener = UvFdListener
+        self.stopping = False
+        self.running = False
+
+        # cached monotonic time; refreshed lazily by `now()` after it is marked as stale at the
+        # start of each loop iteration and just before polling for I/O (it is not cached at all
+        # while the loop is not running)
+        self._time = 0.0
+        self._time_stale = True
+
+        #: Long-lived poll handles, one per file descriptor. A handle is created the first time a
+        #: file descriptor is waited on, disarmed (stopped) when there is nothing left to wait for,
+        #: and only closed when the file descriptor is closed or recycled.
+        #: :type: dict[int, pyuv.Poll]
+        self.poll_handles = {}
+
+        #: :type: pyuv.Loop
+        self.loop = self.pyuv.Loop.default_loop()
+
+        #: Heap of timers scheduled by :meth:`schedule_call_global`. A single libuv timer handle is
+        #: armed for the earliest timer in the heap, and stopped when no timers are pending, so
+        #: that cancelled timers do not keep the loop alive.
+        self.timer_h = self.pyuv.Timer(self.loop)
+        self.timers = timer.TimerHeap(on_empty=self.timer_h.stop, clock=self.now)
+
+        # create a signal handle to listen for SIGINT
+        self.sig_h = self.pyuv.Signal(self.loop)
+        self.sig_h.start(self.signal_received, signal.SIGINT)
+        self.sig_h.ref = False  # don't keep loop alive just for this handle
+
+        # create a uv_idle handle to allow non-I/O callbacks to get called quickly
+        self.idle_h = self.pyuv.Idle(self.loop)
+
+        # create a prepare handle to fire immediate callbacks every loop iteration
+        self.prepare_h = self.pyuv.Prepare(self.loop)
+        self.prepare_h.start(self._fire_callbacks)
+
+        # create a check handle to unref the prepare handle and allow the loop to exit if necessary
+        self.check_h = self.pyuv.Check(self.loop)
+        self.check_h.start(self._check_cb)
+        self.check_h.ref = False
+
+        # create an async handle to wake up the loop from other threads; it only keeps the loop
+        # alive while callbacks are expected from other threads (see `ref_threadsafe()`)
+        self.async_h = self.pyuv.Async(self.loop, self._async_cb)
+        self.async_h.ref = False
+
+        # libuv measures the time the loop spends blocked polling for I/O if the pyuv module
+        # supports it (pyuv_cffi with libuv >= 1.39); otherwise, the hub measures the time from the
+        # end of the Prepare callback to the first I/O callback (or the Check callback)
+        enable_metrics = getattr(self.loop, 'enable_metrics', None)
+        self.idle_metrics = enable_metrics is not None and enable_metrics()
+        if self.idle_metrics:
+            self._idle_time_base = self.loop.metrics_idle_time()
+        self._poll_started = None
+
+    def _idle_cb(self, idle_h):
+        idle_h.stop()
+
+    def _async_cb(self, async_h):
+        if self.polling:
+            self._end_poll()
+
+        self._run_threadsafe_callbacks()
+
+    def _wakeup(self):
+        self.async_h.send()
+
+    def ref_threadsafe(self):
+        super().ref_threadsafe()
+        self.async_h.ref = True
+
+    def unref_threadsafe(self):
+        super().unref_threadsafe()
+        self.async_h.ref = self.threadsafe_refs > 0
+
+    def _check_cb(self, check_h):
+        """
+        The Prepare handle's only purpose is to run scheduled callbacks. If there are no
+        remaining scheduled callbacks, then it must be unreferenced so it does not keep the loop
+        alive after all handles and callbacks have been completed.
+
+        This is the last callback of each loop iteration, so the cached time is marked as stale.
+        """
+        self.prepare_h.ref = bool(self.callbacks)
+        self._time_stale = True
+        if self.polling:
+            self._end_poll()
+
+    def _end_poll(self):
+        """Record that the loop has finished polling for I/O
+
+        This is called by the first callback after polling (an I/O or async callback, or the Check
+        callback).
+        """
+        self.polling = False
+        if self._poll_started is not None:
+            self.poll_time += time.monotonic() - self._poll_started
+            self._poll_started = None
+
+    def now(self):
+        if self._time_stale or not self.running:
+            self._time = time.monotonic()
+            self._time_stale = False
+
+        return self._time
+
+    def update_time(self):
+        self.loop.update_time()
+        self._time = time.monotonic()
+        self._time_stale = False
+
+    def run(self):
+        assert self is greenlet.getcurrent()
+
+        if self.stopping:
+            return
+
+        if self.running:
+            raise RuntimeError("The hub's runloop is already running")
+
+        log.debug('Start runloop')
+        try:
+            self.running = True
+            self.stopping = False
+            self.run_started = time.monotonic()
+            self.loop.run(self.pyuv.UV_RUN_DEFAULT)
+        finally:
+            self.run_time += time.monotonic() - self.run_started
+            self.run_started = None
+            self.running = False
+            self.stopping = False
+
+    def abort(self):
+        print()
+        log.debug('Abort loop')
+        if self.running:
+            self.stopping = True
+
+        self.loop.stop()
+
+    def _fire_callbacks(self, prepare_h):
+        """Fire immediate callbacks
+
+        This is called by `self.prepare_h` and calls callbacks scheduled by methods such as
+        :meth:`schedule_call_now()` or `gyield()`.
+        """
+        self._run_callbacks()
+
+        # Check if callbacks were deferred, or more callbacks have been scheduled by the callbacks
+        # that were just executed. Since these may be non-I/O callbacks (such as calls to
+        # `gyield()` or `schedule_call_now()`, start a uv_idle_t handle so that libuv can do a
+        # zero-timeout poll and quickly start another loop iteration.
+        if self.callbacks:
+            self.idle_h.start(self._idle_cb)
+
+        # If no callbacks are scheduled, unref the prepare_h to allow the loop to automatically
+        # exit safely.
+        prepare_h.ref = bool(self.callbacks)
+
+        # the loop is about to poll for I/O, which may block
+        self._time_stale = True
+        self.polling = True
+        if not self.idle_metrics:
+            self._poll_started = time.monotonic()
+
+    def stats(self):
+        """Get a snapshot of the event loop's statistics
+
+        In addition to the entries documented in :meth:`AbstractHub.stats`, the snapshot contains
+        `timers` (number of pending timers scheduled with :meth:`schedule_call_global`),
+        `poll_handles` (number of open poll handles), and, with pyuv_cffi, `handles` (number of
+        live libuv handles per type).
+
+        :rtype: dict
+        """
+        if self.idle_metrics:
+            self.poll_time = self.loop.metrics_idle_time() - self._idle_time_base
+
+        stats = super().stats()
+        stats['timers'] = len(self.timers)
+        stats['poll_handles'] = len(self.poll_handles)
+        alive_counts = getattr(self.pyuv, 'alive_counts', None)
+        if alive_counts is not None:
+            stats['handles'] = dict(alive_counts)
+
+        return stats
+
+    def schedule_call_now(self, cb, *args, priority=PRIORITY_NORMAL, **kwargs):
+        self.callbacks.queues[priority].append((cb, args, kwargs))
+
+    def schedule_call_global(self, seconds, cb, *args, **kwargs):
+        t = self.timers.add(seconds, cb, *args, **kwargs)
+
+        if self.timers.heap[0] is t:
+            # the new timer expires first
+            self.timer_h.start(self._fire_timers, seconds, 0)
+
+        return t
+
+    def _fire_timers(self, timer_h):
+        """Fire expired timers
+
+        This is called by `self.timer_h`, which is always armed for the earliest pending timer.
+        """
+        self._record_lag(self.timers.next_expiry())
+        for exc_info in self.timers.advance(self.now() + self.timer_resolution):
+            self._squelch_exception(exc_info)
+
+        self._arm_timer()
+
+    def _arm_timer(self):
+        """Arm `self.timer_h` for the earliest pending timer, or stop it if there are none
+        """
+        expiry = self.timers.next_expiry()
+        if expiry is not None:
+            self.timer_h.start(self._fire_timers, max(expiry - self.now(), 0), 0)
+        else:
+            self.timer_h.stop()
+
+    def add(self, evtype, fd, cb, tb, cb_args=()):
+        poll_h = self.poll_handles.get(fd)
+        if poll_h is None:
+            poll_h = self.pyuv.Poll(self.loop, fd)
+            self.poll_handles[fd] = poll_h
+
+        listener = UvFdListener(evtype, fd, poll_h, cb, cb_args)
+        self._add_listener(listener)
+
+        # (re-)arm the poll handle with the combined interest of all listeners for this fd
+        # note that UV_READABLE and UV_WRITABLE correspond to const.READ and const.WRITE
+        poll_h.start(self._poll_events(fd), self._poll_cb)
+
+        return listener
+
+    def remove(self, listener):
+        """Remove listener
+
+        The poll handle for the listener's file descriptor is disarmed rather than closed, so that
+        it can be re-armed cheaply the next time a greenlet waits on the same file descriptor.
+
+        :param listener: listener to remove
+        :type listener: self.Listener
+        """
+        poll_h = listener.handle
+        if poll_h is None:
+            # already removed, for example by `notify_opened()`
+            return
+
+        listener.handle = None
+        super()._remove_listener(listener)
+
+        if poll_h.closed:
+            return
+
+        events = self._poll_events(listener.fd)
+        if events:
+            poll_h.start(events, self._poll_cb)
+        else:
+            poll_h.stop()
+
+    def notify_opened(self, fd):
+        found = super().notify_opened(fd)
+        self._close_poll(fd)
+        return found
+
+    def _poll_events(self, fd):
+        """Get the combined event mask of all listeners for the specified file descriptor
+
+        :rtype: int
+        """
+        events = 0
+        for evtype, bucket in self.listeners.items():
+            if fd in bucket:
+                events |= evtype
+
+        return events
+
+    def _poll_cb(self, poll_h, events, errorno):
+        """Poll callback for pyuv
+
+        pyuv requires a callback with this signature. Readiness is dispatched to the listener
+        registered for each event type, so a reader and a writer can wait on the same file
+        descriptor at the same time; a READ | WRITE listener is only called once. If libuv reports
+        an error, all listeners for the file descriptor are woken up so that they can retry the
+        operation and see the error.
+
+        :type poll_h: pyuv.Poll
+        :type events: int or None
+        :type errorno: int or None
+        """
+        if self.polling:
+            self._end_poll()
+
+        if errorno is not None:
+            events = READ | WRITE
+
+        called = None
+        for evtype in (READ, WRITE):
+            if not events & evtype:
+                continue
+
+            # look the listener up each time: calling the previous listener's callback may have
+            # removed or replaced this one
+            listener = self.listeners[evtype].get(poll_h.fileno())
+            if listener is None or listener is called:
+                continue
+
+            called = listener
+
+            try:
+                listener.cb(*listener.cb_args)
+            except:
+                self._squelch_exception(sys.exc_info())
+
+                try:
+                    self.remove(listener)
+                except Exception as e:
+                    sys.stderr.write('Exception while removing listener: {}\n'.format(e))
+                    sys.stderr.flush()
+
+    def _close_poll(self, fd):
+        """Close the poll handle for the specified file descriptor, if any
+
+        :param int fd: file descriptor
+        """
+        poll_h = self.poll_handles.pop(fd, None)
+        if poll_h is not None and not poll_h.closed:
+            # initiate correct cleanup sequence
+            poll_h.ref = False
+            poll_h.stop()
+            poll_h.close()
+
+    def signal_received(self, sig_handle, signo):
+        """Signal handler for pyuv.Signal
+
+        pyuv.Signal requies a callback with the following signature::
+
+            Callable(signal_handle, signal_num)
+
+        :type sig_handle: pyuv.Signal
+        :type signo: int
+        """
+        if signo == signal.SIGINT:
+            sig_handle.stop()
+            self.abort()
+            self.parent.throw(KeyboardInterrupt)
@@ -0,0 +1,94 @@
+"""Detection of code blocking the event loop
+
+A greenlet which runs for a long time without yielding to the hub (for example, by making a
+blocking call which has not been monkey-patched) stalls every other greenlet in the same thread.
+:class:`BlockingWatchdog` detects this from a separate OS thread, without signals, so it is cheap
+enough to be left enabled in production.
+
+See :func:`guv.util.debug.hub_blocking_detection`.
+"""
+import logging
+import sys
+import time
+import traceback
+
+from .. import patcher
+
+_threading = patcher.original('threading')
+
+log = logging.getLogger('guv')
+
+
+class BlockingWatchdog:
+    """Watchdog thread which reports when the hub has not returned to the event loop for too long
+
+    The watchdog samples the hub's state every :attr:`interval` seconds. The hub is considered
+    blocked when it is running, is not polling for I/O, and has not started a new loop iteration
+    for at least :attr:`threshold` seconds. Each time this is detected, the stack of the hub's
+    thread (that is, of the greenlet which is blocking the hub) is logged and :attr:`count` is
+    incremented. A blocked hub is only reported once until it returns to the event loop.
+
+    The watchdog must be created in the hub's thread.
+    """
+
+    def __init__(self, hub, threshold=0.1, interval=None):
+        """
+        :param hub: hub to watch
+        :type hub: guv.hubs.abc.AbstractHub
+        :param float threshold: report the hub as blocked after this many seconds
+        :param float interval: (optional) sampling interval (seconds); defaults to a quarter of
+            `threshold`
+        """
+        self.hub = hub
+        self.threshold = threshold
+        self.interval = interval if interval is not None else threshold / 4
+
+        #: number of times the hub was reported as blocked
+        self.count = 0
+
+        self.thread_id = _threading.get_ident()  # the hub's thread
+        self._stopped = _threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the watchdog thread
+        """
+        assert self._thread is None, 'The watchdog is already running'
+        self._stopped.clear()
+        self._thread = _threading.Thread(target=self._run, name='guv-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the watchdog thread
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        hub = self.hub
+        iteration = hub.iterations
+        since = time.monotonic()
+        reported = False
+
+        while not self._stopped.wait(self.interval):
+            now = time.monotonic()
+            if hub.polling or not hub.running or hub.iterations != iteration:
+                # the hub has returned to the event loop since the last sample
+                iteration = hub.iterations
+                since = now
+                reported = False
+            elif not reported and now - since >= self.threshold:
+                reported = True
+                self._report(now - since)
+
+    def _report(self, duration):
+        """Log the stack of the hub's thread
+
+        :param float duration: time the hub has been blocked for (seconds)
+        """
+        self.count += 1
+        frame = sys._current_frames().get(self.thread_id)
+        stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+        log.warning('Hub blocked for at least {:.0f} ms:\n{}'.format(duration * 1000, stack))
@@ -0,0 +1,351 @@
+"""Run CPU-bound functions in a pool of worker processes
+
+CPU-bound work (image resizing, compression, cryptography) blocks the hub for as long as it runs,
+even in a thread pool, as long as it holds the GIL. :func:`apply` runs a function in a worker
+process and only suspends the calling greenlet until the result is available::
+
+    thumbnail = procpool.apply(resize, (image, 128, 128))
+
+Each worker process is connected to the pool by a socket pair. The pool's end is a green socket, so
+waiting for a result goes through :func:`~guv.hubs.switch.trampoline` like any other socket I/O.
+Calls and results are pickled with pickle protocol 5: objects which support out-of-band buffers
+(such as `bytearray`, `memoryview`-backed objects or NumPy arrays) are sent without being copied
+into the pickle.
+
+As with :mod:`multiprocessing`, the function, its arguments and its result must be picklable, and
+the function must be importable by the worker processes.
+"""
+import concurrent.futures
+import multiprocessing
+import multiprocessing.connection
+import os
+import pickle
+import struct
+import traceback
+import weakref
+
+import greenlet
+
+from . import greenio, patcher, tpool
+from .const import READ
+from .greenthread import spawn_n
+from .hubs import notify_close, trampoline
+from .semaphore import Semaphore
+from .timeout import Timeout
+
+socket_orig = patcher.original('socket')
+_threading = patcher.original('threading')
+
+__all__ = ['ProcessPool', 'WorkerExited', 'RemoteTraceback', 'apply', 'apply_async']
+
+# message header: length of the pickle, number of out-of-band buffers (followed by the length of
+# each buffer)
+_HEADER = struct.Struct('!QI')
+_BUFFER_LEN = struct.Struct('!Q')
+
+#: time to wait for a closed worker process to exit before it is terminated (seconds)
+EXIT_TIMEOUT = 1
+
+
+class WorkerExited(Exception):
+    """The worker process running a call exited before returning a result
+    """
+
+
+class RemoteTraceback(Exception):
+    """Traceback of an exception raised in a worker process
+
+    This is set as the `__cause__` of exceptions re-raised by the pool.
+    """
+
+    def __init__(self, tb):
+        super().__init__(tb)
+        self.tb = tb
+
+    def __str__(self):
+        return '\n\n"""\n{}"""'.format(self.tb)
+
+
+def _send(sock, obj):
+    """Send a pickled object, with out-of-band buffers sent separately
+
+    :param sock: green socket in the pool, blocking socket in worker processes
+    """
+    buffers = []
+    data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    views = [buf.raw() for buf in buffers]
+
+    header = _HEADER.pack(len(data), len(views))
+    header += b''.join(_BUFFER_LEN.pack(view.nbytes) for view in views)
+    sock.sendall(header)
+    sock.sendall(data)
+    for view in views:
+        sock.sendall(view)
+
+
+def _recv_exactly(sock, n):
+    """Receive exactly `n` bytes
+
+    :rtype: bytearray
+    :raises EOFError: if the connection is closed before `n` bytes are received
+    """
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        received = sock.recv_into(view[pos:])
+        if not received:
+            raise EOFError()
+        pos += received
+
+    return buf
+
+
+def _recv(sock):
+    """Receive an object sent by :func:`_send`
+    """
+    data_len, n_buffers = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    lengths = struct.unpack('!{}Q'.format(n_buffers), _recv_exactly(sock, 8 * n_buffers))
+    data = _recv_exactly(sock, data_len)
+    buffers = [_recv_exactly(sock, n) for n in lengths]
+    return pickle.loads(data, buffers=buffers)
+
+
+def _worker_main(conn):
+    """Main loop of worker processes: run calls until the pool closes the connection
+
+    :param conn: connection to the pool (only used to pass the file descriptor of its socket)
+    :type conn: multiprocessing.connection.Connection
+    """
+    fd = os.dup(conn.fileno())
+    conn.close()
+    sock = socket_orig.socket(fileno=fd)
+
+    while True:
+        try:
+            fn, args, kwargs = _recv(sock)
+        except EOFError:
+            return
+
+        try:
+            result = (True, fn(*args, **kwargs))
+        except BaseException as e:
+            result = (False, e, traceback.format_exc())
+
+        try:
+            _send(sock, result)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            # the result or exception cannot be pickled
+            _send(sock, (False, e, traceback.format_exc()))
+
+
+class _Worker:
+    def __init__(self, context):
+        pool_sock, worker_sock = socket_orig.socketpair()
+
+        # sockets of the unpatched socket module cannot be pickled, but connections can
+        worker_conn = multiprocessing.connection.Connection(worker_sock.detach())
+        self.process = context.Process(target=_worker_main, args=(worker_conn,), daemon=True,
+                                       name='guv-procpool')
+        try:
+            # starting a process (and, with "spawn" or "forkserver", waiting for it) blocks
+            tpool.execute(self.process.start)
+        finally:
+            worker_conn.close()
+
+        #: :type: greenio.socket
+        self.sock = greenio.socket(pool_sock.family, pool_sock.type, pool_sock.proto,
+                                   pool_sock.detach())
+
+    def call(self, fn, args, kwargs):
+        _send(self.sock, (fn, args, kwargs))
+        try:
+            return _recv(self.sock)
+        except EOFError:
+            raise WorkerExited('worker process {} exited'.format(self.process.pid))
+
+    def close(self, terminate=False):
+        """Close the connection to the worker process and reap the process in a new greenthread
+
+        :param bool terminate: terminate the process right away, instead of letting it exit when
+            it reads the end of the connection (a busy worker only does so after its call)
+        """
+        self.sock.close()
+        if terminate:
+            self.process.terminate()
+        spawn_n(self._reap)
+
+    def _reap(self):
+        """Wait (cooperatively) for the process to exit, and release its resources
+
+        The process is terminated if it has not exited after :data:`EXIT_TIMEOUT` seconds.
+        """
+        sentinel = self.process.sentinel
+        try:
+            trampoline(sentinel, READ, timeout=EXIT_TIMEOUT)
+        except Timeout:
+            self.process.terminate()
+            trampoline(sentinel, READ)
+
+        # the process has exited, so this does not block
+        self.process.join()
+        notify_close(sentinel)
+        self.process.close()
+
+
+class ProcessPool:
+    """Pool of worker processes
+
+    Worker processes are started as needed, up to `processes` workers. Each worker runs one call
+    at a time; callers wait (cooperatively) for a worker to become available.
+    """
+
+    def __init__(self, processes=None, max_in_flight=None, context=None):
+        """
+        :param int processes: (optional) maximum number of worker processes; defaults to
+            :func:`os.cpu_count`
+        :param int max_in_flight: (optional) maximum number of calls each greenlet may have
+            submitted with :meth:`apply_async` which have not completed; further calls wait
+        :param context: (optional) :mod:`multiprocessing` context used to start worker processes;
+            defaults to the "forkserver" context where available, so that workers do not inherit
+            the hub's state
+        """
+        if context is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+
+        self.processes = processes or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight
+        self.context = context
+
+        self.workers = []  # all live workers
+        self.idle = []  # workers not running a call
+        self.slots = Semaphore(self.processes)
+
+        # calls submitted with `apply_async()` by each greenlet
+        self._in_flight = weakref.WeakKeyDictionary()
+        self._closed = False
+
+    def apply(self, fn, args=(), kwargs=None):
+        """Call a function in a worker process and wait for its result
+
+        If the function raises an exception, it is re-raised in the calling greenlet, with the
+        traceback from the worker process as its `__cause__`.
+
+        :param Callable fn: function to call
+        :param tuple args: positional arguments
+        :param dict kwargs: (optional) keyword arguments
+        :return: the function's return value
+        :raises WorkerExited: if the worker process exited before returning a result
+        """
+        if self._closed:
+            raise RuntimeError('the pool is closed')
+
+        self.slots.acquire()
+        try:
+            worker = self.idle.pop() if self.idle else self._start_worker()
+            try:
+                result = worker.call(fn, args, kwargs or {})
+            except BaseException:
+                # the worker's connection may be left in the middle of a message
+                self._discard(worker, terminate=True)
+                raise
+
+            if self._closed:
+                self._discard(worker)
+            else:
+                self.idle.append(worker)
+        finally:
+            self.slots.release()
+
+        if not result[0]:
+            _, exc, tb = result
+            raise exc from RemoteTraceback(tb)
+
+        return result[1]
+
+    def apply_async(self, fn, args=(), kwargs=None):
+        """Call a function in a worker process without waiting for its result
+
+        If `max_in_flight` is set and the calling greenlet already has that many calls in flight,
+        this waits until one of them has completed.
+
+        :return: future which can be waited for with :func:`guv.futures.wait_future`
+        :rtype: concurrent.futures.Future
+        """
+        caller = greenlet.getcurrent()
+        in_flight = None
+        if self.max_in_flight:
+            in_flight = self._in_flight.get(caller)
+            if in_flight is None:
+                in_flight = self._in_flight[caller] = Semaphore(self.max_in_flight)
+            in_flight.acquire()
+
+        fut = concurrent.futures.Future()
+        fut.set_running_or_notify_cancel()
+        spawn_n(self._run_async, fut, in_flight, fn, args, kwargs)
+        return fut
+
+    def _run_async(self, fut, in_flight, fn, args, kwargs):
+        try:
+            result = self.apply(fn, args, kwargs)
+        except BaseException as e:
+            fut.set_exception(e)
+        else:
+            fut.set_result(result)
+        finally:
+            if in_flight is not None:
+                in_flight.release()
+
+    def close(self):
+        """Stop all worker processes
+
+        Idle workers are stopped immediately, and workers running a call are stopped once the call
+        has completed. Worker processes are reaped in the background.
+        """
+        self._closed = True
+        idle, self.idle = self.idle, []
+        for worker in idle:
+            self._discard(worker)
+
+    def _start_worker(self):
+        worker = _Worker(self.context)
+        self.workers.append(worker)
+        return worker
+
+    def _discard(self, worker, terminate=False):
+        self.workers.remove(worker)
+        worker.close(terminate)
+
+
+_local = _threading.local()
+
+
+def _default_pool():
+    """Get the current thread's default pool
+
+    :rtype: ProcessPool
+    """
+    pool = getattr(_local, 'pool', None)
+    if pool is None:
+        pool = _local.pool = ProcessPool()
+
+    return pool
+
+
+def apply(fn, args=(), kwargs=None):
+    """Call a function in a process of the default pool and wait for its result
+
+    See :meth:`ProcessPool.apply`.
+    """
+    return _default_pool().apply(fn, args, kwargs)
+
+
+def apply_async(fn, args=(), kwargs=None):
+    """Call a function in a process of the default pool without waiting for its result
+
+    See :meth:`ProcessPool.apply_async`.
+
+    :rtype: concurrent.futures.Future
+    """
+    return _default_pool().apply_async(fn, args, kwargs)
@@ -0,0 +1,170 @@
+"""Forward data between sockets
+
+:func:`pipe` copies data from one socket to another until the end of the stream, and :func:`relay`
+does so in both directions at once, which is all a TCP proxy needs once both connections are
+established::
+
+    def handle(client, addr):
+        upstream = guv.connect(('10.0.0.2', 80))
+        try:
+            relay(client, upstream)
+        finally:
+            upstream.close()
+            client.close()
+
+On Linux, data is moved with `os.splice()` through an intermediate pipe: it goes from one socket's
+receive buffer to the other socket's send buffer within the kernel, without ever being copied into a
+Python object. Elsewhere (and for SSL sockets, whose data must be decrypted and encrypted), data is
+received into one reused buffer with `recv_into()` and sent from it.
+
+In both cases, the calling greenlet waits on the hub whenever the source has no data or the
+destination's send buffer is full.
+"""
+import errno
+import os
+
+from . import patcher
+from .const import READ, WRITE
+from .greenthread import spawn
+from .hubs import trampoline
+
+socket_orig = patcher.original('socket')
+
+__all__ = ['pipe', 'relay']
+
+#: number of bytes moved per `os.splice()` call (the default capacity of a pipe on Linux)
+SPLICE_SIZE = 65536
+
+#: size of the buffer used when `os.splice()` is not available
+BUFFER_SIZE = 65536
+
+_splice = getattr(os, 'splice', None)
+if _splice is not None:
+    _SPLICE_FLAGS = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+
+
+def _can_splice(sock):
+    # SSL sockets have an `_sslobj`; their data must go through Python
+    return _splice is not None and getattr(sock, '_sslobj', None) is None
+
+
+def _wait(sock, evtype):
+    trampoline(sock.fileno(), evtype, timeout=sock.gettimeout(),
+               timeout_exc=socket_orig.timeout('timed out'))
+
+
+def _pipe_splice(src_sock, dst_sock):
+    """Copy data with `os.splice()`
+
+    :return: number of bytes copied, or None if the sockets do not support `os.splice()`
+    """
+    src, dst = src_sock.fileno(), dst_sock.fileno()
+    pipe_r, pipe_w = os.pipe()
+    total = 0
+    try:
+        read_blocked = False
+        while True:
+            # move data from the source socket into the (empty) pipe
+            if read_blocked:
+                _wait(src_sock, READ)
+            try:
+                n = _splice(src, pipe_w, SPLICE_SIZE, flags=_SPLICE_FLAGS)
+            except BlockingIOError:
+                _wait(src_sock, READ)
+                continue
+            except OSError as e:
+                if total == 0 and e.errno in (errno.EINVAL, errno.ENOSYS):
+                    # the source does not support splicing (any socket can be spliced to)
+                    return None
+                raise
+
+            if not n:
+                return total  # EOF
+
+            # a short splice means that the receive buffer has been drained
+            read_blocked = n < SPLICE_SIZE
+
+            # move all of it from the pipe to the destination socket
+            while n:
+                try:
+                    sent = _splice(pipe_r, dst, n, flags=_SPLICE_FLAGS)
+                except BlockingIOError:
+                    _wait(dst_sock, WRITE)
+                    continue
+
+                n -= sent
+                total += sent
+                if n:
+                    # the send buffer is full
+                    _wait(dst_sock, WRITE)
+    finally:
+        os.close(pipe_r)
+        os.close(pipe_w)
+
+
+def _pipe_copy(src_sock, dst_sock):
+    """Copy data through one reused buffer
+
+    :return: number of bytes copied
+    """
+    buf = bytearray(BUFFER_SIZE)
+    view = memoryview(buf)
+    total = 0
+    try:
+        while True:
+            n = src_sock.recv_into(buf)
+            if not n:
+                return total
+            dst_sock.sendall(view[:n])
+            total += n
+    finally:
+        view.release()
+
+
+def pipe(src_sock, dst_sock, shutdown=True):
+    """Copy data from `src_sock` to `dst_sock` until the end of the stream is reached
+
+    The sockets must be green sockets; their timeouts apply to each wait for data or for room in the
+    send buffer.
+
+    :param src_sock: socket to read from
+    :param dst_sock: socket to write to
+    :param bool shutdown: (optional) shut down `dst_sock` for writing at the end of the stream, so
+        that the peer of `dst_sock` sees the end of the stream too
+    :return: number of bytes copied
+    :rtype: int
+    """
+    total = None
+    if _can_splice(src_sock) and _can_splice(dst_sock):
+        total = _pipe_splice(src_sock, dst_sock)
+    if total is None:
+        total = _pipe_copy(src_sock, dst_sock)
+
+    if shutdown:
+        try:
+            dst_sock.shutdown(socket_orig.SHUT_WR)
+        except OSError:
+            # the peer has closed the connection already
+            pass
+
+    return total
+
+
+def relay(sock1, sock2):
+    """Copy data between two sockets in both directions, until the end of both streams
+
+    Data from `sock2` to `sock1` is copied by a new greenthread, while the calling greenthread
+    copies data from `sock1` to `sock2`. If copying from `sock1` fails, the other direction is
+    stopped; if copying from `sock2` fails, the exception is raised once the stream from `sock1`
+    has ended. The sockets are not closed.
+
+    :return: number of bytes copied from `sock1` to `sock2`, and from `sock2` to `sock1`
+    :rtype: tuple[int, int]
+    """
+    gt = spawn(pipe, sock2, sock1)
+    try:
+        sent = pipe(sock1, sock2)
+    except BaseException:
+        gt.kill()
+        raise
+    return sent, gt.wait()
@@ -0,0 +1,368 @@
+"""Buffered reading from green sockets
+
+:class:`BufferedSocketReader` reads from a socket into one reusable :class:`bytearray` with
+`recv_into()`, so protocol parsers (HTTP request lines and headers, websocket frames) do not
+allocate an intermediate bytes object per `recv()` or concatenate partial reads. It provides
+file-like :meth:`~BufferedSocketReader.read` and :meth:`~BufferedSocketReader.readline`, which makes
+it usable as the ``rfile`` of :mod:`guv.wsgi`, as well as the stream methods
+:meth:`~BufferedSocketReader.readexactly` and :meth:`~BufferedSocketReader.readuntil`::
+
+    reader = BufferedSocketReader(sock, pool=get_buffer_pool())
+    try:
+        header = reader.readexactly(2)
+        ...
+    finally:
+        reader.close()  # return the buffer to the pool
+
+Buffers can be drawn from a :class:`BufferPool` and returned to it when the reader is closed, so
+that short-lived connections do not allocate a new buffer each.
+"""
+from . import patcher
+
+_threading = patcher.original('threading')
+
+__all__ = ['BufferedSocketReader', 'BufferPool', 'get_buffer_pool', 'IncompleteReadError',
+           'LimitOverrunError']
+
+#: default size of read buffers (bytes)
+DEFAULT_BUFFER_SIZE = 8192
+
+#: default maximum length of data returned by :meth:`BufferedSocketReader.readuntil`
+DEFAULT_LIMIT = 65536
+
+_local = _threading.local()  # the buffer pool of each hub thread
+
+
+class IncompleteReadError(EOFError):
+    """The end of the stream was reached before the expected data was read
+    """
+
+    def __init__(self, partial, expected):
+        """
+        :param bytes partial: data read before the end of the stream
+        :param expected: number of bytes expected, or None if the expected length is not known
+        """
+        super().__init__('{} bytes read on a total of {} expected bytes'
+                         .format(len(partial), 'undefined' if expected is None else expected))
+        self.partial = partial
+        self.expected = expected
+
+
+class LimitOverrunError(ValueError):
+    """The separator was not found within the limit
+    """
+
+    def __init__(self, message, consumed):
+        """
+        :param str message: error message
+        :param int consumed: number of bytes buffered (but not consumed) without finding the
+            separator
+        """
+        super().__init__(message)
+        self.consumed = consumed
+
+
+class BufferPool:
+    """Free list of equally sized read buffers
+    """
+
+    def __init__(self, size=DEFAULT_BUFFER_SIZE, max_free=256):
+        """
+        :param int size: size of the buffers (bytes)
+        :param int max_free: maximum number of free buffers kept for reuse
+        """
+        self.size = size
+        self.max_free = max_free
+
+        #: :type: list[bytearray]
+        self.free = []
+
+    def __len__(self):
+        return len(self.free)
+
+    def acquire(self):
+        """Get a free buffer, or allocate a new one
+
+        :rtype: bytearray
+        """
+        return self.free.pop() if self.free else bytearray(self.size)
+
+    def release(self, buf):
+        """Return a buffer to the pool
+
+        Buffers of a different size, or in excess of :attr:`max_free`, are discarded.
+
+        :type buf: bytearray
+        """
+        if len(buf) == self.size and len(self.free) < self.max_free:
+            self.free.append(buf)
+
+
+def get_buffer_pool():
+    """Get the buffer pool of the current thread's hub
+
+    :rtype: BufferPool
+    """
+    pool = getattr(_local, 'pool', None)
+    if pool is None:
+        pool = _local.pool = BufferPool()
+    return pool
+
+
+class BufferedSocketReader:
+    """Buffered reader for a socket, filled with `recv_into()`
+
+    Unread data is kept in ``buf[start:end]``. Data is copied out of the buffer once, into the
+    bytes objects which are returned; the buffer itself is only compacted when there is no room
+    left at its end.
+
+    The reader does not own the socket: closing the reader does not close the socket, and closing
+    the socket does not close the reader.
+
+    The reader may be closed by another greenthread while one is waiting for data; the buffer is
+    then only released when the waiting greenthread resumes, and its read raises
+    :class:`ValueError`.
+    """
+
+    def __init__(self, sock, buffer_size=DEFAULT_BUFFER_SIZE, pool=None, limit=DEFAULT_LIMIT):
+        """
+        :param sock: socket (or any object with a `recv_into()` method) to read from
+        :param int buffer_size: (optional) size of the buffer, if `pool` is not specified
+        :param pool: (optional) pool to draw the buffer from; the buffer is returned to the pool by
+            :meth:`close`
+        :type pool: BufferPool
+        :param int limit: (optional) maximum length of data returned by :meth:`readuntil`; the
+            buffer grows up to this size if necessary
+        """
+        self.sock = sock
+        self.pool = pool
+        self.limit = limit
+
+        #: :type: bytearray
+        self.buf = pool.acquire() if pool is not None else bytearray(buffer_size)
+        self._view = memoryview(self.buf)
+        self.start = 0
+        self.end = 0
+        self.eof = False
+        self._closed = False
+        self._reading = False  # a greenthread is waiting for data to be received into the buffer
+
+    def __len__(self):
+        """Number of buffered bytes which have not been read
+        """
+        return self.end - self.start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        """Close the reader and return its buffer to the pool
+
+        Buffered data which has not been read is discarded.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        if not self._reading:
+            self._release()
+
+    def _release(self):
+        """Return the buffer to the pool
+        """
+        self._view.release()
+        if self.pool is not None:
+            self.pool.release(self.buf)
+        self.buf = self._view = None
+        self.start = self.end = 0
+
+    def _consume(self, n):
+        """Remove `n` buffered bytes and return them
+
+        :rtype: bytes
+        """
+        start = self.start
+        data = bytes(self._view[start:start + n])
+        self.start = start = start + n
+        if start == self.end:
+            self.start = self.end = 0
+        return data
+
+    def _fill(self):
+        """Receive more data into the buffer with one `recv_into()` call
+
+        The unread data is moved to the start of the buffer first if there is no room left at its
+        end. The buffer must not be full.
+
+        :return: number of bytes received; 0 at the end of the stream
+        :rtype: int
+        """
+        if self._closed:
+            raise ValueError('I/O operation on closed reader')
+        if self.eof:
+            return 0
+
+        if self.end == len(self.buf):
+            # compact
+            n = self.end - self.start
+            self._view[:n] = self._view[self.start:self.end]
+            self.start, self.end = 0, n
+
+        view = self._view[self.end:]
+        self._reading = True
+        try:
+            n = self.sock.recv_into(view)
+        finally:
+            self._reading = False
+            view.release()
+            if self._closed:
+                # closed while waiting for data; nothing writes into the buffer any more
+                self._release()
+
+        if self._closed:
+            raise ValueError('I/O operation on closed reader')
+        if not n:
+            self.eof = True
+        self.end += n
+        return n
+
+    def _grow(self):
+        """Double the size of the buffer, up to :attr:`limit`
+        """
+        size = min(len(self.buf) * 2, max(self.limit, len(self.buf)))
+        buf = bytearray(size)
+        n = self.end - self.start
+        buf[:n] = self._view[self.start:self.end]
+
+        self._view.release()
+        if self.pool is not None:
+            self.pool.release(self.buf)
+            self.pool = None  # the new buffer is not returned to the pool
+
+        self.buf = buf
+        self._view = memoryview(buf)
+        self.start, self.end = 0, n
+
+    def peek(self, n=1):
+        """Return up to `n` buffered bytes without consuming them
+
+        The socket is read from (once) if fewer than `n` bytes are buffered. Fewer than `n` bytes
+        are returned if no more data was available; an empty bytes object means the end of the
+        stream.
+
+        :rtype: bytes
+        """
+        if self.end - self.start < n and self.end - self.start < len(self.buf):
+            self._fill()
+        return bytes(self._view[self.start:min(self.start + n, self.end)])
+
+    def read1(self, n=-1):
+        """Read up to `n` bytes with at most one `recv_into()` call (like `socket.recv()`)
+
+        :return: data read; an empty bytes object at the end of the stream
+        :rtype: bytes
+        """
+        if self.start == self.end:
+            self._fill()
+        avail = self.end - self.start
+        return self._consume(avail if n < 0 else min(n, avail))
+
+    def read(self, n=-1):
+        """Read `n` bytes, or until the end of the stream if `n` is negative
+
+        Fewer than `n` bytes are returned only at the end of the stream.
+
+        :rtype: bytes
+        """
+        chunks = []
+        while n:
+            data = self.read1(n)
+            if not data:
+                break
+            chunks.append(data)
+            if n > 0:
+                n -= len(data)
+        return b''.join(chunks)
+
+    def readexactly(self, n):
+        """Read exactly `n` bytes
+
+        :rtype: bytes
+        :raises IncompleteReadError: if the end of the stream is reached first
+        """
+        if self.end - self.start >= n:
+            # fast path: the data is already buffered
+            return self._consume(n)
+
+        data = self.read(n)
+        if len(data) < n:
+            raise IncompleteReadError(data, n)
+        return data
+
+    def readline(self, size=-1):
+        """Read until a newline (which is included), up to `size` bytes if `size` is not negative
+
+        The line is returned without a newline at the end of the stream.
+
+        :rtype: bytes
+        """
+        chunks = []
+        while size:
+            start, end = self.start, self.end
+            if size > 0:
+                end = min(end, start + size)
+
+            i = self.buf.find(b'\n', start, end)
+            if i >= 0:
+                chunks.append(self._consume(i + 1 - start))
+                break
+
+            if end > start:
+                chunks.append(self._consume(end - start))
+                if size > 0:
+                    size -= end - start
+                    continue
+
+            if not self._fill():
+                break
+
+        return b''.join(chunks)
+
+    def readuntil(self, separator=b'\n'):
+        """Read until `separator` is found (it is included in the returned data)
+
+        :rtype: bytes
+        :raises IncompleteReadError: if the end of the stream is reached first
+        :raises LimitOverrunError: if the separator is not found within :attr:`limit` bytes; the
+            data is left in the buffer
+        """
+        seplen = len(separator)
+        if not seplen:
+            raise ValueError('Separator should be at least one-byte string')
+
+        offset = self.start  # where to search from
+        while True:
+            i = self.buf.find(separator, offset, self.end)
+            if i >= 0:
+                return self._consume(i + seplen - self.start)
+
+            buffered = self.end - self.start
+            if buffered >= self.limit:
+                raise LimitOverrunError('Separator is not found, and chunk exceed the limit',
+                                        buffered)
+
+            # the separator may start in the data already searched
+            offset = max(self.end - seplen + 1, self.start) - self.start
+            if buffered == len(self.buf):
+                self._grow()
+            if not self._fill():
+                data = self._consume(self.end - self.start)
+                raise IncompleteReadError(data, None)
+            offset += self.start
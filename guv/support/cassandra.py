@@ -121,6 +121,9 @@ class GuvConnection(Connection):
                 return  # leave the write loop
 
     def handle_read(self):
+        # receive into one reused buffer instead of allocating a bytes object per recv()
+        buf = bytearray(self.in_buffer_size)
+        view = memoryview(buf)
         while True:
             # try:
             #     # log.debug('Trampoline with fd: {}, READ'.format(self._socket.fileno()))
@@ -134,9 +137,9 @@ class GuvConnection(Connection):
 
             try:
                 while True:
-                    buf = self._socket.recv(self.in_buffer_size)
-                    self._iobuf.write(buf)
-                    if len(buf) < self.in_buffer_size:
+                    n = self._socket.recv_into(buf)
+                    self._iobuf.write(view[:n])
+                    if n < self.in_buffer_size:
                         break
             except socket.error as err:
                 if not get_errno(err) in CONNECT_ERR:
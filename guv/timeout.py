@@ -20,15 +20,22 @@ class Timeout(BaseException):
     Timeout objects are context managers, and so can be used in with statements. When used in a with
     statement, if `exception` is ``False``, the timeout is still raised, but the context manager
     suppresses it, so the code outside the with-block won't see it.
+
+    If `coarse` is True, the timeout is scheduled with :meth:`schedule_call_coarse()
+    <guv.hubs.abc.AbstractHub.schedule_call_coarse>`, which has coarse resolution, but is much
+    cheaper to schedule and cancel. This is useful for timeouts which are started and cancelled very
+    often and rarely expire, such as idle connection timeouts.
     """
 
-    def __init__(self, seconds=None, exception=None):
+    def __init__(self, seconds=None, exception=None, coarse=False):
         """
         :param float seconds: timeout seconds
         :param exception: exception to raise when timeout occurs
+        :param bool coarse: schedule the timeout with coarse resolution
         """
         self.seconds = seconds
         self.exception = exception
+        self.coarse = coarse
         self.timer = None
         self.start()
 
@@ -40,12 +47,14 @@ class Timeout(BaseException):
             '%r is already started; to restart it, cancel it first' % self
         if self.seconds is None:  # "fake" timeout (never expires)
             self.timer = None
-        elif self.exception is None or isinstance(self.exception, bool):  # timeout that raises self
-            self.timer = get_hub().schedule_call_global(
-                self.seconds, greenlet.getcurrent().throw, self)
+            return self
+
+        hub = get_hub()
+        schedule = hub.schedule_call_coarse if self.coarse else hub.schedule_call_global
+        if self.exception is None or isinstance(self.exception, bool):  # timeout that raises self
+            self.timer = schedule(self.seconds, greenlet.getcurrent().throw, self)
         else:  # regular timeout with user-provided exception
-            self.timer = get_hub().schedule_call_global(
-                self.seconds, greenlet.getcurrent().throw, self.exception)
+            self.timer = schedule(self.seconds, greenlet.getcurrent().throw, self.exception)
         return self
 
     @property
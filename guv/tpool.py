@@ -0,0 +1,291 @@
+"""Run blocking functions in a pool of OS threads
+
+Calls which block the OS thread, such as reading files, C extensions without green support or
+CPU-heavy functions which release the GIL (like bcrypt), stall every greenlet running on the hub.
+:func:`execute` runs such a function in a worker thread and only suspends the calling greenlet
+until the result is available::
+
+    data = tpool.execute(read_file, path)
+
+With the libuv hubs, functions are run in libuv's thread pool (see `Loop.queue_work()`). Other
+hubs use a pool of threads started by this module, or the :class:`concurrent.futures.Executor`
+passed to :func:`configure`.
+"""
+import functools
+import os
+import sys
+import time
+
+import greenlet
+
+from . import patcher
+from .hubs import get_hub
+from .hubs.stats import Histogram, LAG_BUCKETS
+from .semaphore import Semaphore
+
+_threading = patcher.original('threading')
+_queue = patcher.original('queue')
+
+__all__ = ['execute', 'configure', 'stats']
+
+#: default number of worker threads (the same as libuv's default)
+DEFAULT_POOL_SIZE = 4
+
+#: number of worker threads, or None for the default
+pool_size = None
+
+#: maximum number of calls waiting for or running in a worker thread per hub, or None for
+#: unlimited; further calls to :func:`execute` wait (cooperatively) until a call has completed
+max_queued = None
+
+#: :class:`concurrent.futures.Executor` to run functions with instead of the default pool
+executor = None
+
+_local = _threading.local()  # the pool of each hub thread, or a flag in worker threads
+_threads = None  # worker threads shared by all hubs which cannot use libuv's pool
+_threads_lock = _threading.Lock()
+
+
+def configure(pool_size=None, max_queued=None, executor=None):
+    """Configure the thread pool
+
+    This must be called before the first call to :func:`execute`. libuv's thread pool is global
+    and is only sized once, when it is first used (by guv or by anything else using libuv's
+    default loop).
+
+    :param int pool_size: (optional) number of worker threads; for libuv's pool, this sets the
+        ``UV_THREADPOOL_SIZE`` environment variable
+    :param int max_queued: (optional) maximum number of calls waiting for or running in a worker
+        thread per hub
+    :param executor: (optional) executor to run functions with instead of libuv's pool or the
+        default pool
+    :type executor: concurrent.futures.Executor
+    """
+    g = globals()
+    g['pool_size'] = pool_size
+    g['max_queued'] = max_queued
+    g['executor'] = executor
+
+    if pool_size is not None:
+        os.environ['UV_THREADPOOL_SIZE'] = str(pool_size)
+
+
+def execute(fn, *args, **kwargs):
+    """Call a function in a worker thread and wait for its result
+
+    Only the calling greenlet is suspended; the hub and other greenlets keep running. If the
+    function raises an exception, it is re-raised in the calling greenlet. If the calling greenlet
+    is interrupted (for example, by a :class:`~guv.timeout.Timeout`), the function keeps running
+    and its result is discarded.
+
+    The function must not use guv: greenlets, green sockets and the rest of the monkey-patched
+    standard library need a hub, and worker threads do not run one (with the libuv hubs, a hub
+    created in a worker thread would share libuv's default loop with the hub of the calling
+    thread). Calling :func:`execute` from a worker thread raises :exc:`RuntimeError`.
+
+    :param Callable fn: function to call
+    :param args: positional arguments to pass to the function
+    :param kwargs: keyword arguments to pass to the function
+    :return: the function's return value
+    """
+    if getattr(_local, 'worker', False):
+        raise RuntimeError('tpool.execute() cannot be called from a worker thread')
+    return _get_pool().execute(fn, *args, **kwargs)
+
+
+def stats():
+    """Get a snapshot of the statistics of the current thread's pool
+
+    The snapshot contains:
+
+    - `submitted`: number of calls submitted to worker threads
+    - `completed`: number of calls which have completed
+    - `pending`: number of calls waiting for or running in a worker thread
+    - `queue_wait`: histogram of the time calls waited for a worker thread (seconds); see
+      :meth:`guv.hubs.stats.Histogram.snapshot`
+
+    :rtype: dict
+    """
+    return _get_pool().stats()
+
+
+def _get_pool():
+    """Get the pool of the current thread's hub
+
+    :rtype: Pool
+    """
+    hub = get_hub()
+    pool = getattr(_local, 'pool', None)
+    if pool is None or pool.hub is not hub:
+        pool = _local.pool = Pool(hub)
+
+    return pool
+
+
+class _Job:
+    def __init__(self, fn, args, kwargs, waiter):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.waiter = waiter  # greenlet to switch to once done, None if it is no longer waiting
+
+        self.result = None
+        self.exc_info = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.done = False  # set by the hub once the job is done
+        self.notify = None  # (optional) called by the worker thread once done
+
+    def run(self):
+        """Call the function (in a worker thread)
+        """
+        self.started = time.monotonic()
+        _local.worker = True
+        try:
+            self.result = self.fn(*self.args, **self.kwargs)
+        except BaseException:
+            self.exc_info = sys.exc_info()
+
+        if self.notify is not None:
+            self.notify()
+
+
+class _WorkerThreads:
+    """Pool of OS threads used when libuv's thread pool is not available
+
+    Threads are started as needed, up to `size` threads, and run until the process exits.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.jobs = _queue.SimpleQueue()
+        self.threads = []
+        self.lock = _threading.Lock()
+
+    def submit(self, fn):
+        self.jobs.put(fn)
+        if len(self.threads) < self.size:
+            with self.lock:
+                if len(self.threads) < self.size:
+                    thread = _threading.Thread(target=self._work, name='guv-tpool', daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+
+    def _work(self):
+        while True:
+            self.jobs.get()()
+
+
+class Pool:
+    """Thread pool state of a hub
+
+    Each hub (that is, each thread running greenlets) has its own pool, which submits calls to
+    libuv's thread pool, to the configured executor, or to worker threads shared by all hubs.
+    """
+
+    def __init__(self, hub):
+        """
+        :type hub: guv.hubs.abc.AbstractHub
+        """
+        self.hub = hub
+
+        loop = getattr(hub, 'loop', None)
+        if executor is None and hasattr(loop, 'queue_work'):
+            self._submit = self._submit_uv
+        else:
+            self._submit = self._submit_threads
+
+        #: limits the number of pending calls, if :data:`max_queued` is set
+        self.slots = Semaphore(max_queued) if max_queued else None
+
+        self.submitted = 0
+        self.completed = 0
+        self.wait_histogram = Histogram(LAG_BUCKETS)
+
+    def execute(self, fn, *args, **kwargs):
+        current = greenlet.getcurrent()
+        assert current is not self.hub, 'do not call blocking functions from the mainloop'
+
+        if self.slots is not None:
+            self.slots.acquire()
+
+        job = _Job(fn, args, kwargs, current)
+        try:
+            self._submit(job)
+        except:
+            if self.slots is not None:
+                self.slots.release()
+            raise
+
+        self.submitted += 1
+        try:
+            while not job.done:
+                self.hub.switch()
+        finally:
+            job.waiter = None
+
+        if job.exc_info is not None:
+            exc_type, exc, tb = job.exc_info
+            raise exc.with_traceback(tb)
+
+        return job.result
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'pending': self.submitted - self.completed,
+            'queue_wait': self.wait_histogram.snapshot(),
+        }
+
+    def _submit_uv(self, job):
+        """Submit the job to libuv's thread pool, which keeps the loop alive until it is done
+        """
+        self.hub.loop.queue_work(job.run, functools.partial(self._done, job))
+
+    def _submit_threads(self, job):
+        """Submit the job to the configured executor or to the shared worker threads
+        """
+        global _threads
+
+        if executor is not None:
+            submit = executor.submit
+        else:
+            with _threads_lock:
+                if _threads is None:
+                    _threads = _WorkerThreads(pool_size or DEFAULT_POOL_SIZE)
+            submit = _threads.submit
+
+        hub = self.hub
+        job.notify = functools.partial(hub.schedule_call_threadsafe, self._done_threadsafe, job)
+        hub.ref_threadsafe()
+        try:
+            submit(job.run)
+        except:
+            hub.unref_threadsafe()
+            raise
+
+    def _done_threadsafe(self, job):
+        self.hub.unref_threadsafe()
+        self._done(job)
+
+    def _done(self, job, errorno=None):
+        """Record statistics, release the job's slot and resume the waiting greenlet
+
+        This is called by the hub once the job is done.
+
+        :param int errorno: (optional) libuv error code if the job was not run
+        """
+        job.done = True
+        self.completed += 1
+        if self.slots is not None:
+            self.slots.release()
+
+        if job.started is not None:
+            self.wait_histogram.add(job.started - job.submitted)
+        elif errorno is not None:
+            job.exc_info = (OSError, OSError('work request failed: {}'.format(errorno)), None)
+
+        waiter = job.waiter
+        if waiter is not None:
+            waiter.switch()
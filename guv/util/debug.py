@@ -169,25 +169,27 @@ def hub_exceptions(state=True):
 
 
 def hub_blocking_detection(state=False, resolution=1):
-    """Toggles whether Eventlet makes an effort to detect blocking
-    behavior in an application.
-
-    It does this by telling the kernel to raise a SIGALARM after a
-    short timeout, and clearing the timeout every time the hub
-    greenlet is resumed.  Therefore, any code that runs for a long
-    time without yielding to the hub will get interrupted by the
-    blocking detector (don't use it in production!).
-
-    The *resolution* argument governs how long the SIGALARM timeout
-    waits in seconds.  The implementation uses :func:`signal.setitimer`
-    and can be specified as a floating-point value.
-    The shorter the resolution, the greater the chance of false
-    positives.
+    """Toggle detection of code blocking the current thread's hub
+
+    When enabled, a watchdog thread (see :class:`guv.hubs.watchdog.BlockingWatchdog`) reports
+    each time the hub has not returned to the event loop for more than `resolution` seconds: the
+    stack of the greenlet which is blocking the hub is logged as a warning on the ``guv`` logger,
+    and the hub's ``blocked`` statistic (see :meth:`guv.hubs.abc.AbstractHub.stats`) is
+    incremented. No signals are used and the blocking code is not interrupted, so this is safe to
+    use in production.
+
+    :param bool state: enable or disable detection
+    :param float resolution: report the hub as blocked after this many seconds
     """
     from guv import hubs
+    from guv.hubs.watchdog import BlockingWatchdog
 
     assert resolution > 0
-    hubs.get_hub().debug_blocking = state
-    hubs.get_hub().debug_blocking_resolution = resolution
-    if not state:
-        hubs.get_hub().block_detect_post()
+    hub = hubs.get_hub()
+    if hub.watchdog is not None:
+        hub.watchdog.stop()
+        hub.watchdog = None
+
+    if state:
+        hub.watchdog = BlockingWatchdog(hub, resolution)
+        hub.watchdog.start()
@@ -11,6 +11,7 @@ import time
 from hashlib import md5, sha1
 
 from . import semaphore, wsgi
+from .streams import BufferedSocketReader, IncompleteReadError, get_buffer_pool
 from .green import socket
 
 
@@ -410,6 +411,7 @@ class ProtocolError(ValueError):
 class RFC6455WebSocket(WebSocket):
     def __init__(self, sock, environ, version=13, protocol=None, client=False):
         super(RFC6455WebSocket, self).__init__(sock, environ, version)
+        self.reader = BufferedSocketReader(sock, pool=get_buffer_pool())
         self.iterator = self._iter_frames()
         self.client = client
         self.protocol = protocol
@@ -436,12 +438,25 @@ class RFC6455WebSocket(WebSocket):
             return self.decoder.decode(data, final)
 
     def _get_bytes(self, numbytes):
-        data = b''
-        while len(data) < numbytes:
-            d = self.socket.recv(numbytes - len(data))
-            if not d:
+        try:
+            return self.reader.readexactly(numbytes)
+        except IncompleteReadError:
+            raise ConnectionClosedError()
+        except ValueError:
+            if self.reader.closed:
+                # closed by another greenthread
+                raise ConnectionClosedError()
+            raise
+
+    def _get_some_bytes(self, numbytes):
+        try:
+            data = self.reader.read1(numbytes)
+        except ValueError:
+            if self.reader.closed:
                 raise ConnectionClosedError()
-            data = data + d
+            raise
+        if not data:
+            raise ConnectionClosedError()
         return data
 
     class Message(object):
@@ -573,9 +588,7 @@ class RFC6455WebSocket(WebSocket):
             message.push('', final=finished)
         else:
             while received < length:
-                d = self.socket.recv(length - received)
-                if not d:
-                    raise ConnectionClosedError()
+                d = self._get_some_bytes(length - received)
                 dlen = len(d)
                 if masked:
                     d = self._apply_mask(d, mask, length=dlen, offset=received)
@@ -668,3 +681,4 @@ class RFC6455WebSocket(WebSocket):
         self._send_closing_frame(close_data=close_data)
         self.socket.shutdown(socket.SHUT_WR)
         self.socket.close()
+        self.reader.close()
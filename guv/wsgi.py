@@ -1,3 +1,5 @@
+import io
+import os
 import sys
 import time
 import traceback
@@ -8,7 +10,9 @@ from urllib.parse import unquote
 import socket
 
 from . import version_info, gyield
+from .hubs import get_hub
 from .server import Server
+from .streams import BufferedSocketReader, get_buffer_pool
 from .exceptions import BROKEN_SOCK
 from .support import reraise
 
@@ -22,7 +26,7 @@ MAX_HEADER_LINE = 8192
 MAX_TOTAL_HEADER_SIZE = 65536
 MINIMUM_CHUNK_SIZE = 4096
 
-__all__ = ['serve', 'format_date_time']
+__all__ = ['serve', 'format_date_time', 'FileWrapper']
 
 # weekday and month names for HTTP date/time formatting; always English!
 _weekdayname = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
@@ -53,6 +57,47 @@ def format_date_time(timestamp):
            (_weekdayname[wd], day, _monthname[month], year, hh, mm, ss)
 
 
+_date_cache = [None, None]  # [unix time (whole seconds), formatted date]
+
+
+def _current_date():
+    """Get the current date formatted for the ``Date`` header
+
+    The formatted date is cached and only recomputed when the wall clock moves on to the next
+    second.
+    """
+    now = time.time()
+    second = int(now)
+    if _date_cache[0] != second:
+        _date_cache[:] = second, format_date_time(now)
+    return _date_cache[1]
+
+
+class FileWrapper:
+    """``wsgi.file_wrapper``: a response body read from a file
+
+    If the application returns the wrapper itself as the response, the file is sent with
+    :meth:`guv.greenio.socket.sendfile`: regular files are copied from the page cache to the socket
+    by the kernel, without being read into Python buffers. Otherwise (e.g. if middleware iterates
+    over the response), the wrapper iterates over blocks of `blksize` bytes read from the file.
+    """
+
+    def __init__(self, filelike, blksize=8192):
+        self.filelike = filelike
+        self.blksize = blksize
+        if hasattr(filelike, 'close'):
+            self.close = filelike.close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        data = self.filelike.read(self.blksize)
+        if data:
+            return data
+        raise StopIteration
+
+
 class Input:
     def __init__(self, rfile, content_length, socket=None, chunked_input=False):
         self.rfile = rfile
@@ -217,7 +262,8 @@ class WSGIHandler:
         self.client_address = address
         self.server = server
         self.application = self.server.application
-        self.rfile = client_sock.makefile('rb', MINIMUM_CHUNK_SIZE)
+        self.rfile = BufferedSocketReader(client_sock, pool=get_buffer_pool())
+        self.hub = get_hub()
 
         # set up instance attributes
         self.requestline = None
@@ -240,7 +286,7 @@ class WSGIHandler:
     def handle(self):
         try:
             while self.socket is not None:
-                self.time_start = time.time()
+                self.time_start = self.hub.now()
                 self.time_finish = 0
                 result = self.handle_one_request()
 
@@ -254,7 +300,7 @@ class WSGIHandler:
                 self.status, response_body = result
                 self.socket.sendall(response_body)
                 if self.time_finish == 0:
-                    self.time_finish = time.time()
+                    self.time_finish = self.hub.now()
                 self.log_request()
                 break
         finally:
@@ -268,6 +314,7 @@ class WSGIHandler:
                 except socket.error:
                     pass
             self.socket = None
+            self.rfile.close()
             self.rfile = None
 
         return self.time_finish - self.time_start
@@ -399,7 +446,7 @@ class WSGIHandler:
 
     def finalize_headers(self):
         if self.provided_date is None:
-            self.response_headers.append(('Date', format_date_time(time.time())))
+            self.response_headers.append(('Date', _current_date()))
 
         if self.code not in (304, 204):
             # the reply will include message-body; make sure we have either Content-Length or
@@ -423,13 +470,24 @@ class WSGIHandler:
             raise
         self.response_length += len(data)
 
+    def _sendall_many(self, buffers):
+        try:
+            self.socket.sendall_many(buffers)
+        except socket.error as ex:
+            self.status = 'socket error: %s' % ex
+            if self.code > 0:
+                self.code = -self.code
+            raise
+        self.response_length += sum(len(data) for data in buffers)
+
     def _write(self, data):
         if not data:
             return
         if self.response_use_chunked:
             # write the chunked encoding
-            data = "%x\r\n%s\r\n" % (len(data), data)
-        self._sendall(data)
+            self._sendall_many([b'%x\r\n' % len(data), data, b'\r\n'])
+        else:
+            self._sendall(data)
 
     def write(self, data):
         if self.code in (304, 204) and data:
@@ -452,13 +510,16 @@ class WSGIHandler:
             towrite.extend(b('%s: %s\r\n' % header))
 
         towrite.extend(b('\r\n'))
-        if data:
-            if self.response_use_chunked:
-                # write the chunked encoding
-                towrite.extend(b("%x\r\n%s\r\n" % (len(data), data)))
-            else:
-                towrite.extend(data)
-        self._sendall(towrite)
+
+        # the headers and the body are sent together, without copying the body
+        if not data:
+            self._sendall(towrite)
+        elif self.response_use_chunked:
+            # write the chunked encoding
+            towrite.extend(b'%x\r\n' % len(data))
+            self._sendall_many([towrite, data, b'\r\n'])
+        else:
+            self._sendall_many([towrite, data])
 
     def start_response(self, status, headers, exc_info=None):
         if exc_info:
@@ -501,7 +562,8 @@ class WSGIHandler:
         return self.write
 
     def log_request(self):
-        log.debug(self.format_request())
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(self.format_request())
 
     def format_request(self):
         now = datetime.now().replace(microsecond=0)
@@ -516,14 +578,64 @@ class WSGIHandler:
             client_address or '-', now, getattr(self, 'requestline', ''),
             (getattr(self, 'status', None) or '000').split()[0], length, delta)
 
+    def _sendfile(self, wrapper):
+        """Send the headers and a :class:`FileWrapper` body with `sendfile()`
+
+        If the application did not provide a Content-Length, it is computed from the size of the
+        file, so that the body does not have to be sent with chunked encoding.
+
+        :type wrapper: FileWrapper
+        :return: False if the body must be sent by iterating over the wrapper instead
+        :rtype: bool
+        """
+        if self.headers_sent or not self.status or self.code in (304, 204):
+            return False
+
+        file = wrapper.filelike
+        try:
+            offset = file.tell()
+        except (AttributeError, io.UnsupportedOperation, OSError):
+            return False
+
+        if self.provided_content_length is None:
+            try:
+                length = os.fstat(file.fileno()).st_size - offset
+            except (AttributeError, io.UnsupportedOperation, OSError):
+                if self.request_version != 'HTTP/1.0':
+                    # the length is unknown, so the body must be chunked
+                    return False
+            else:
+                self.provided_content_length = str(length)
+                self.response_headers.append(('Content-Length', self.provided_content_length))
+
+        self.write(b'')
+
+        count = None
+        if self.provided_content_length is not None:
+            count = int(self.provided_content_length)
+            if not count:
+                return True
+
+        try:
+            self.response_length += self.socket.sendfile(file, offset, count)
+        except socket.error as ex:
+            self.status = 'socket error: %s' % ex
+            if self.code > 0:
+                self.code = -self.code
+            raise
+        return True
+
     def process_result(self):
+        if isinstance(self.result, FileWrapper) and self._sendfile(self.result):
+            return
+
         for data in self.result:
             if data:
                 self.write(data)
         if self.status and not self.headers_sent:
             self.write('')
         if self.response_use_chunked:
-            self.socket.sendall('0\r\n\r\n')
+            self.socket.sendall(b'0\r\n\r\n')
             self.response_length += 5
 
     def run_application(self):
@@ -531,7 +643,7 @@ class WSGIHandler:
         self.process_result()
 
     def handle_one_response(self):
-        self.time_start = time.time()
+        self.time_start = self.hub.now()
         self.status = None
         self.headers_sent = False
 
@@ -550,7 +662,7 @@ class WSGIHandler:
         except Exception as e:
             self.handle_error(*sys.exc_info())
         finally:
-            self.time_finish = time.time()
+            self.time_finish = self.hub.now()
             self.log_request()
 
     def handle_error(self, type, value, tb):
@@ -635,7 +747,8 @@ class WSGIServer(Server):
                 'wsgi.version': (1, 0),
                 'wsgi.multithread': False,
                 'wsgi.multiprocess': False,
-                'wsgi.run_once': False}
+                'wsgi.run_once': False,
+                'wsgi.file_wrapper': FileWrapper}
 
     def __init__(self, server_sock, application=None, environ=None):
         super().__init__(server_sock, self.handle_client)
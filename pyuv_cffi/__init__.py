@@ -2,32 +2,31 @@
 
 Compatible with CPython 3 and pypy3
 """
-import os
-import functools
-
-import cffi
-import cffi.verifier
-from cffi import VerificationError
+import collections
 
 __version__ = '0.1.0'
 version_info = tuple(map(int, __version__.split('.')))
 
-# clean up old compiled library binaries (not needed in production?)
-cffi.verifier.cleanup_tmpdir()
+try:
+    # extension module built ahead of time by setuptools (see pyuv_cffi/_build.py)
+    from ._pyuv_cffi import ffi, lib as libuv
+    _out_of_line = True
+except ImportError:
+    # not built (for example, when running from a source checkout): compile the C code at runtime
+    import cffi
+    from cffi import VerificationError
+
+    from . import _build
 
-thisdir = os.path.dirname(os.path.realpath(__file__))
+    ffi = cffi.FFI()
+    ffi.cdef(_build.cdef)
 
-# load FFI definitions and custom C code
-ffi = cffi.FFI()
-with open(os.path.join(thisdir, 'pyuv_cffi_cdef.c')) as f:
-    ffi.cdef(f.read())
+    try:
+        libuv = ffi.verify(_build.source, libraries=['uv'])
+    except VerificationError as e:
+        raise ImportError('Failed to build pyuv_cffi: {}'.format(e)) from e
 
-try:
-    with open(os.path.join(thisdir, 'pyuv_cffi.c')) as f:
-        libuv = ffi.verify(f.read(), libraries=['uv'])
-except VerificationError as e:
-    print(e)
-    exit(1)
+    _out_of_line = False
 
 UV_READABLE = libuv.UV_READABLE
 UV_WRITABLE = libuv.UV_WRITABLE
@@ -36,36 +35,141 @@ UV_RUN_DEFAULT = libuv.UV_RUN_DEFAULT
 UV_RUN_ONCE = libuv.UV_RUN_ONCE
 UV_RUN_NOWAIT = libuv.UV_RUN_NOWAIT
 
-alive = []
+UV_ECANCELED = libuv.UV_ECANCELED
 
+#: Handle objects which have not been closed yet; libuv may still call their callbacks, so they must
+#: be kept alive even if they are no longer referenced anywhere else
+#: :type: set[Handle]
+alive = set()
 
-class Loop:
-    def __init__(self):
-        self.loop_h = ffi.new('uv_loop_t *')
-        libuv.uv_loop_init(self.loop_h)
+#: number of handles in `alive` for each handle type name (such as 'Poll' or 'Timer')
+#: :type: collections.Counter
+alive_counts = collections.Counter()
 
-        self._handles = []  # temporary list of Handle objects
-        self._ffi_walk_cb = ffi.callback('void (*)(uv_handle_t *handle, void *arg)', self._walk_cb)
+#: Work requests queued by :meth:`Loop.queue_work` which have not completed yet
+#: :type: set[_WorkRequest]
+pending_work = set()
 
-    def _walk_cb(self, handle_p, arg):
-        """Callback passed to uv_walk()
 
-        Note: the handle_p cdata object is appended to `self._handles`, and the list is destroyed
-        afterwards, to prevent storing a reference to the handle.
+def _static_callback(name, ctype):
+    """Decorator to make a Python function into a static C callback which can be passed to libuv
+
+    If the extension was built ahead of time, the function implements the `extern "Python"`
+    function `name` declared in `_build.py`. Otherwise, a single FFI callback is created for it.
+    Either way, callbacks are not allocated per handle: the Python object which owns a handle is
+    found through the handle's `data` field.
+
+    :param str name: name of the `extern "Python"` function
+    :param str ctype: C function pointer type
+    :return: decorator returning the C function pointer
+    """
+
+    def decorator(func):
+        if _out_of_line:
+            ffi.def_extern(name)(func)
+            return getattr(libuv, name)
+        else:
+            return ffi.callback(ctype, func)
+
+    return decorator
+
+
+@_static_callback('_pyuv_cffi_walk_cb', 'uv_walk_cb')
+def _walk_cb(handle_p, arg):
+    """Callback passed to uv_walk()
+
+    :param cdata handle_p: underlying handle pointer
+    :param cdata arg: handle to the list to append the Handle object to
+    """
+    ffi.from_handle(arg).append(ffi.from_handle(handle_p.data))
+
+
+@_static_callback('_pyuv_cffi_close_cb', 'uv_close_cb')
+def _close_cb(handle_p):
+    """Call the handle's close callback, if any, and remove the extra reference to the Handle object
+    """
+    handle = ffi.from_handle(handle_p.data)
+    try:
+        if handle._close_callback is not None:
+            handle._close_callback(handle)
+    finally:
+        handle._callback = None
+        handle._close_callback = None
+        alive.remove(handle)  # now safe to free resources
+        alive_counts[type(handle).__name__] -= 1
+
+
+@_static_callback('_pyuv_cffi_idle_cb', 'uv_idle_cb')
+def _idle_cb(handle_p):
+    handle = ffi.from_handle(handle_p.data)
+    handle._callback(handle)
+
+
+@_static_callback('_pyuv_cffi_prepare_cb', 'uv_prepare_cb')
+def _prepare_cb(handle_p):
+    handle = ffi.from_handle(handle_p.data)
+    handle._callback(handle)
 
-        :param cdata handle_p: underlying handle pointer
-        :param cdata arg: user-defined argument (NULL for our purposes)
-        """
-        handle_obj = ffi.from_handle(handle_p.data)
-        self._handles.append(handle_obj)
+
+@_static_callback('_pyuv_cffi_check_cb', 'uv_check_cb')
+def _check_cb(handle_p):
+    handle = ffi.from_handle(handle_p.data)
+    handle._callback(handle)
+
+
+@_static_callback('_pyuv_cffi_timer_cb', 'uv_timer_cb')
+def _timer_cb(handle_p):
+    handle = ffi.from_handle(handle_p.data)
+    handle._callback(handle)
+
+
+@_static_callback('_pyuv_cffi_signal_cb', 'uv_signal_cb')
+def _signal_cb(handle_p, signum):
+    handle = ffi.from_handle(handle_p.data)
+    handle._callback(handle, signum)
+
+
+@_static_callback('_pyuv_cffi_poll_cb', 'uv_poll_cb')
+def _poll_cb(handle_p, status, events):
+    handle = ffi.from_handle(handle_p.data)
+    if status < 0:
+        handle._callback(handle, None, status)
+    else:
+        handle._callback(handle, events, None)
+
+
+@_static_callback('_pyuv_cffi_work_cb', 'uv_work_cb')
+def _work_cb(req_p):
+    """Call the work callback (in one of libuv's worker threads)
+    """
+    ffi.from_handle(req_p.data).work_callback()
+
+
+@_static_callback('_pyuv_cffi_after_work_cb', 'uv_after_work_cb')
+def _after_work_cb(req_p, status):
+    """Call the done callback (in the loop's thread) and release the request
+    """
+    req = ffi.from_handle(req_p.data)
+    pending_work.remove(req)
+    if req.done_callback is not None:
+        req.done_callback(status if status < 0 else None)
+
+
+@_static_callback('_pyuv_cffi_async_cb', 'uv_async_cb')
+def _async_cb(handle_p):
+    handle = ffi.from_handle(handle_p.data)
+    handle._callback(handle)
+
+
+class Loop:
+    def __init__(self):
+        self.loop_h = ffi.new('uv_loop_t *')
+        libuv.uv_loop_init(self.loop_h)
 
     @classmethod
     def default_loop(cls):
         loop = Loop.__new__(cls)
         loop.loop_h = libuv.uv_default_loop()
-
-        loop._handles = []  # temporary list of handle_t pointers
-        loop._ffi_walk_cb = ffi.callback('void (*)(uv_handle_t *handle, void *arg)', loop._walk_cb)
         return loop
 
     @property
@@ -79,11 +183,57 @@ class Loop:
         :return: list of specific pyuv_cffi Handle objects (Poll, Signal, etc.)
         :rtype: list[Handle]
         """
-        libuv.uv_walk(self.loop_h, self._ffi_walk_cb, ffi.NULL)
-        handles = self._handles
-        self._handles = []  # don't keep references to handles alive in this list
+        handles = []
+        libuv.uv_walk(self.loop_h, _walk_cb, ffi.new_handle(handles))
         return handles
 
+    def now(self):
+        """Get the cached loop time
+
+        :return: loop time in milliseconds
+        :rtype: int
+        """
+        return libuv.uv_now(self.loop_h)
+
+    def update_time(self):
+        """Update the cached loop time
+        """
+        libuv.uv_update_time(self.loop_h)
+
+    def enable_metrics(self):
+        """Enable collecting the loop's idle time (see :meth:`metrics_idle_time`)
+
+        This should be called before the loop is run. It requires libuv >= 1.39.
+
+        :return: True if enabled, False if not supported
+        :rtype: bool
+        """
+        return libuv.pyuv_cffi_metrics_enable(self.loop_h) == 0
+
+    def metrics_idle_time(self):
+        """Get the amount of time the loop has spent blocked waiting for I/O
+
+        :return: time in seconds; always 0 if metrics are not enabled
+        :rtype: float
+        """
+        return libuv.pyuv_cffi_metrics_idle_time(self.loop_h) / 1e9
+
+    def queue_work(self, work_callback, done_callback=None):
+        """Run a function in libuv's thread pool
+
+        The loop is kept alive until the done callback has been called.
+
+        :param work_callback: Callable(), called in one of libuv's worker threads
+        :param done_callback: (optional) Callable(errorno: int or None), called in the loop's thread
+            once `work_callback` has returned; `errorno` is UV_ECANCELED if the work was cancelled
+        """
+        req = _WorkRequest(work_callback, done_callback)
+        err = libuv.uv_queue_work(self.loop_h, req.req, _work_cb, _after_work_cb)
+        if err < 0:
+            raise Exception('uv_queue_work() failed: {}'.format(err))
+
+        pending_work.add(req)  # keep the request alive until the done callback has been called
+
     def run(self, mode=UV_RUN_DEFAULT):
         return libuv.uv_run(self.loop_h, mode)
 
@@ -91,19 +241,15 @@ class Loop:
         libuv.uv_stop(self.loop_h)
 
 
-def default_close_cb(uv_handle_t, handle):
-    """Remove extra reference to the Handle object when closed
-
-    This is the default handle-close callback that gets called if a callback is not supplied.
+class _WorkRequest:
+    def __init__(self, work_callback, done_callback):
+        self.work_callback = work_callback
+        self.done_callback = done_callback
 
-    :param uv_handle_t: pointer to the underlying uv_handle_t
-    :type: uv_handle_t: cdata
-    :param handle: Handle object that owns this callback
-    :type handle: Handle
-    """
-    alive.remove(handle)  # now safe to free resources
-    handle._ffi_cb = None
-    handle._ffi_close_cb = None
+        self.req = ffi.new('uv_work_t *')
+        self_h = ffi.new_handle(self)
+        self.req.data = self_h
+        self._self_h = self_h  # keep the cdata object alive as long as `self` is alive
 
 
 class Handle:
@@ -113,8 +259,8 @@ class Handle:
         """
         # uv_handle_t
         self.uv_handle = libuv.cast_handle(handle)
-        self._ffi_cb = None
-        self._ffi_close_cb = None
+        self._callback = None  # called by the static callback for the specific handle type
+        self._close_callback = None
         self._close_called = False
 
         # store a reference to `self` in the underlying `uv_handle_t.data`
@@ -122,7 +268,8 @@ class Handle:
         self.uv_handle.data = self_h
         self.__self_h = self_h  # keep the cdata object alive as long as `self` is alive
 
-        alive.append(self)  # store a reference to self in the global scope
+        alive.add(self)  # store a reference to self in the global scope
+        alive_counts[type(self).__name__] += 1
 
     def __repr__(self):
         cls = '{}.{}'.format(self.__module__, self.__class__.__name__)
@@ -168,18 +315,8 @@ class Handle:
         if self._close_called:
             return
 
-        if callback:
-            def cb_wrapper(uv_handle_t):
-                callback(self)
-
-                alive.remove(self)  # now safe to free resources
-                self._ffi_cb = None
-                self._ffi_close_cb = None
-        else:
-            cb_wrapper = functools.partial(default_close_cb, handle=self)
-
-        self._ffi_close_cb = ffi.callback('void (*)(uv_handle_t *)', cb_wrapper)
-        libuv.uv_close(self.uv_handle, self._ffi_close_cb)
+        self._close_callback = callback
+        libuv.uv_close(self.uv_handle, _close_cb)
 
         self._close_called = True
 
@@ -199,12 +336,8 @@ class Idle(Handle):
 
         :type callback: Callable(idle_handle: Idle)
         """
-
-        def cb_wrapper(idle_h):
-            callback(self)
-
-        self._ffi_cb = ffi.callback('void (*)(uv_idle_t *)', cb_wrapper)
-        libuv.uv_idle_start(self.handle, self._ffi_cb)
+        self._callback = callback
+        libuv.uv_idle_start(self.handle, _idle_cb)
 
     def stop(self):
         libuv.uv_idle_stop(self.handle)
@@ -224,12 +357,8 @@ class Prepare(Handle):
         """
         :type callback: Callable(prepare_handle: Prepare)
         """
-
-        def cb_wrapper(prepare_h):
-            callback(self)
-
-        self._ffi_cb = ffi.callback('void (*)(uv_prepare_t *)', cb_wrapper)
-        libuv.uv_prepare_start(self.handle, self._ffi_cb)
+        self._callback = callback
+        libuv.uv_prepare_start(self.handle, _prepare_cb)
 
     def stop(self):
         libuv.uv_prepare_stop(self.handle)
@@ -249,12 +378,8 @@ class Check(Handle):
         """
         :type callback: Callable(check_handle: check)
         """
-
-        def cb_wrapper(check_h):
-            callback(self)
-
-        self._ffi_cb = ffi.callback('void (*)(uv_check_t *)', cb_wrapper)
-        libuv.uv_check_start(self.handle, self._ffi_cb)
+        self._callback = callback
+        libuv.uv_check_start(self.handle, _check_cb)
 
     def stop(self):
         libuv.uv_check_stop(self.handle)
@@ -271,7 +396,6 @@ class Timer(Handle):
         super().__init__(self.handle)
 
         self._repeat = None
-        self._stop_called = False
 
     @property
     def repeat(self):
@@ -284,7 +408,10 @@ class Timer(Handle):
         raise NotImplementedError()
 
     def start(self, callback, timeout, repeat):
-        """
+        """Start the timer
+
+        The timer may be started again while it is active in order to reschedule it.
+
         :type callback: Callable(timer_handle: Timer)
         :param float timeout: initial timeout (seconds) before first alarm
         :param float repeat: repeat interval (seconds); 0 to disable
@@ -292,11 +419,8 @@ class Timer(Handle):
         timeout = int(timeout * 1000)
         repeat = int(repeat * 1000)
 
-        def cb_wrapper(timer_h):
-            callback(self)
-
-        self._ffi_cb = ffi.callback('void (*)(uv_timer_t *)', cb_wrapper)
-        libuv.uv_timer_start(self.handle, self._ffi_cb, timeout, repeat)
+        self._callback = callback
+        libuv.uv_timer_start(self.handle, _timer_cb, timeout, repeat)
 
     def stop(self):
         libuv.uv_timer_stop(self.handle)
@@ -320,13 +444,8 @@ class Signal(Handle):
         :type callback: Callable(sig_handle: Signal, sig_num: int)
         :type sig_num: int
         """
-
-        def cb_wrapper(uv_signal_t, signum):
-            callback(self, signum)
-
-        ffi_cb = ffi.callback('void (*)(uv_signal_t *, int)', cb_wrapper)
-        self._ffi_cb = ffi_cb  # keep the FFI cdata object alive as long as this instance is alive
-        libuv.uv_signal_start(self.handle, ffi_cb, sig_num)
+        self._callback = callback
+        libuv.uv_signal_start(self.handle, _signal_cb, sig_num)
 
     def stop(self):
         libuv.uv_signal_stop(self.handle)
@@ -349,23 +468,55 @@ class Poll(Handle):
     def start(self, events, callback):
         """Start the poll listener
 
-        :param events: UV_READABLE | UV_WRITEABLE
-        :param callback: Callable(poll_handle: Poll, status: int, events: int)
-        """
+        The poll handle may be started again after being stopped, or while it is active in order to
+        change the events being watched.
 
-        def cb_wrapper(uv_poll_t, status, events):
-            callback(self, status, events)
+        As with pyuv, the callback is called with the ready events and None if polling succeeded,
+        or with None and the (negative) libuv error code if it failed.
 
-        self._ffi_cb = ffi.callback('void (*)(uv_poll_t *, int, int)', cb_wrapper)
-        libuv.uv_poll_start(self.handle, events, self._ffi_cb)
+        :param events: UV_READABLE | UV_WRITEABLE
+        :param callback: Callable(poll_handle: Poll, events: int or None, errorno: int or None)
+        """
+        self._callback = callback
+        libuv.uv_poll_start(self.handle, events, _poll_cb)
+        self._stop_called = False
 
     def stop(self):
         if self._stop_called:
             return
 
         err = libuv.uv_poll_stop(self.handle)
-        self._ffi_cb = None
         if err < 0:
             raise Exception('uv_poll_stop() failed: {}'.format(err))
 
         self._stop_called = True
+
+    def fileno(self):
+        """File descriptor being monitored
+
+        :rtype: int
+        """
+        return self.fd
+
+
+class Async(Handle):
+    def __init__(self, loop, callback):
+        """
+        :type loop: Loop
+        :param callback: Callable(async_handle: Async), called in the loop's thread after
+            :meth:`send` has been called
+        """
+        self.loop = loop
+        self.handle = ffi.new('uv_async_t *')
+        libuv.uv_async_init(loop.loop_h, self.handle, _async_cb)
+        super().__init__(self.handle)
+
+        self._callback = callback
+
+    def send(self):
+        """Wake up the loop and call the callback
+
+        This is the only method which is safe to call from any thread. Calls made before the
+        callback is called may be coalesced into a single call.
+        """
+        libuv.uv_async_send(self.handle)
@@ -0,0 +1,44 @@
+"""Build script for the pyuv_cffi extension module
+
+The extension is normally built ahead of time by setuptools (see `cffi_modules` in setup.py). It can
+also be built in-place for development by running this script from the repository root::
+
+    python pyuv_cffi/_build.py
+"""
+import os
+
+import cffi
+
+thisdir = os.path.dirname(os.path.realpath(__file__))
+
+with open(os.path.join(thisdir, 'pyuv_cffi_cdef.c')) as f:
+    cdef = f.read()
+
+with open(os.path.join(thisdir, 'pyuv_cffi.c')) as f:
+    source = f.read()
+
+#: static callbacks passed to libuv, implemented in Python with `@ffi.def_extern()`; these are only
+#: available when the extension is built ahead of time
+callbacks_cdef = '''
+extern "Python" {
+    void _pyuv_cffi_walk_cb(uv_handle_t *handle, void *arg);
+    void _pyuv_cffi_close_cb(uv_handle_t *handle);
+    void _pyuv_cffi_idle_cb(uv_idle_t *handle);
+    void _pyuv_cffi_prepare_cb(uv_prepare_t *handle);
+    void _pyuv_cffi_check_cb(uv_check_t *handle);
+    void _pyuv_cffi_timer_cb(uv_timer_t *handle);
+    void _pyuv_cffi_signal_cb(uv_signal_t *handle, int signum);
+    void _pyuv_cffi_poll_cb(uv_poll_t *handle, int status, int events);
+    void _pyuv_cffi_async_cb(uv_async_t *handle);
+    void _pyuv_cffi_work_cb(uv_work_t *req);
+    void _pyuv_cffi_after_work_cb(uv_work_t *req, int status);
+}
+'''
+
+ffibuilder = cffi.FFI()
+ffibuilder.cdef(cdef)
+ffibuilder.cdef(callbacks_cdef)
+ffibuilder.set_source('pyuv_cffi._pyuv_cffi', source, libraries=['uv'])
+
+if __name__ == '__main__':
+    ffibuilder.compile(verbose=True)
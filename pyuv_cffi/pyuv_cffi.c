@@ -20,3 +20,29 @@
 uv_handle_t *cast_handle(void *handle) {
     return (uv_handle_t *)handle;
 }
+
+/**
+ * Enable collecting the idle time metric of the loop, if supported (libuv >= 1.39)
+ *
+ * @return 0 on success, -1 if not supported by this version of libuv
+ */
+int pyuv_cffi_metrics_enable(uv_loop_t *loop) {
+#if UV_VERSION_HEX >= 0x012700
+    return uv_loop_configure(loop, UV_METRICS_IDLE_TIME) == 0 ? 0 : -1;
+#else
+    return -1;
+#endif
+}
+
+/**
+ * Get the amount of time the loop has spent blocked in the kernel's event provider (nanoseconds)
+ *
+ * This is always 0 if the metric is not supported or was not enabled.
+ */
+uint64_t pyuv_cffi_metrics_idle_time(uv_loop_t *loop) {
+#if UV_VERSION_HEX >= 0x012700
+    return uv_metrics_idle_time(loop);
+#else
+    return 0;
+#endif
+}
@@ -1,3 +1,5 @@
+#define UV_ECANCELED ...
+
 typedef enum {
     UV_RUN_DEFAULT = 0,
     UV_RUN_ONCE,
@@ -10,14 +12,18 @@ enum uv_poll_event {
 };
 
 // handle structs and types
+// `data` is declared for every handle type so that callbacks can find the Python object which owns
+// the handle without casting to uv_handle_t first
 struct uv_loop_s {...;};
 struct uv_handle_s {void *data; ...;};
-struct uv_idle_s {...;};
-struct uv_prepare_s {...;};
-struct uv_timer_s {...;};
-struct uv_signal_s {...;};
-struct uv_poll_s {...;};
-struct uv_check_s {...;};
+struct uv_idle_s {void *data; ...;};
+struct uv_prepare_s {void *data; ...;};
+struct uv_timer_s {void *data; ...;};
+struct uv_signal_s {void *data; ...;};
+struct uv_poll_s {void *data; ...;};
+struct uv_check_s {void *data; ...;};
+struct uv_async_s {void *data; ...;};
+struct uv_work_s {void *data; ...;};
 
 typedef struct uv_loop_s uv_loop_t;
 typedef struct uv_handle_s uv_handle_t;
@@ -27,6 +33,8 @@ typedef struct uv_timer_s uv_timer_t;
 typedef struct uv_signal_s uv_signal_t;
 typedef struct uv_poll_s uv_poll_t;
 typedef struct uv_check_s uv_check_t;
+typedef struct uv_async_s uv_async_t;
+typedef struct uv_work_s uv_work_t;
 
 typedef void (*uv_walk_cb)(uv_handle_t *handle, void *arg);
 typedef void (*uv_close_cb)(uv_handle_t *handle);
@@ -36,6 +44,9 @@ typedef void (*uv_poll_cb)(uv_poll_t *handle, int status, int events);
 typedef void (*uv_timer_cb)(uv_timer_t *handle);
 typedef void (*uv_signal_cb)(uv_signal_t *handle, int signum);
 typedef void (*uv_check_cb)(uv_check_t* handle);
+typedef void (*uv_async_cb)(uv_async_t* handle);
+typedef void (*uv_work_cb)(uv_work_t* req);
+typedef void (*uv_after_work_cb)(uv_work_t* req, int status);
 
 // loop functions
 uv_loop_t *uv_default_loop();
@@ -44,6 +55,10 @@ int uv_loop_alive(const uv_loop_t *loop);
 int uv_run(uv_loop_t *, uv_run_mode mode);
 void uv_stop(uv_loop_t *);
 void uv_walk(uv_loop_t *loop, uv_walk_cb walk_cb, void *arg);
+uint64_t uv_now(const uv_loop_t *loop);
+void uv_update_time(uv_loop_t *loop);
+int pyuv_cffi_metrics_enable(uv_loop_t *loop);
+uint64_t pyuv_cffi_metrics_idle_time(uv_loop_t *loop);
 
 // handle functions
 // uv_handle_t is the base type for all libuv handle types.
@@ -103,3 +118,17 @@ int uv_signal_stop(uv_signal_t *handle);
 int uv_poll_init(uv_loop_t *loop, uv_poll_t *handle, int fd);
 int uv_poll_start(uv_poll_t *handle, int events, uv_poll_cb cb);
 int uv_poll_stop(uv_poll_t *handle);
+
+// async functions
+// Async handles allow the user to "wakeup" the event loop and get a callback called from another
+// thread. uv_async_send() is the only libuv function which is safe to call from any thread; calls
+// made before the callback is called may be coalesced into a single callback.
+int uv_async_init(uv_loop_t *loop, uv_async_t *async, uv_async_cb async_cb);
+int uv_async_send(uv_async_t *async);
+
+// thread pool work scheduling
+// work_cb is called in one of libuv's worker threads (the pool size is set by the
+// UV_THREADPOOL_SIZE environment variable when the pool is first used), and after_work_cb is then
+// called in the loop's thread, with status UV_ECANCELED if the request was cancelled.
+int uv_queue_work(uv_loop_t *loop, uv_work_t *req, uv_work_cb work_cb,
+                  uv_after_work_cb after_work_cb);
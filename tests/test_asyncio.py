@@ -0,0 +1,134 @@
+import asyncio
+import socket
+
+import pytest
+
+from guv import sleep, spawn
+from guv.asyncio import get_event_loop, wait_coroutine, run_in_greenlet
+
+
+async def add(a, b, delay=0.01):
+    await asyncio.sleep(delay)
+    return a + b
+
+
+class TestWaitCoroutine:
+    def test_wait_coroutine(self):
+        # the hub keeps running while this greenlet waits
+        ticks = []
+
+        def ticker():
+            for i in range(3):
+                ticks.append(i)
+                sleep(0.005)
+
+        gt = spawn(ticker)
+        assert wait_coroutine(add(1, 2, 0.05)) == 3
+        assert len(ticks) == 3
+        gt.wait()
+
+    def test_exception(self):
+        async def fail():
+            await asyncio.sleep(0)
+            raise ValueError()
+
+        with pytest.raises(ValueError):
+            wait_coroutine(fail())
+
+    def test_timeout(self):
+        task = get_event_loop().create_task(add(1, 2, 0.1))
+        with pytest.raises(asyncio.TimeoutError):
+            wait_coroutine(task, 0.01)
+
+        with pytest.raises(asyncio.CancelledError):
+            wait_coroutine(task)
+
+    def test_concurrent(self):
+        gts = [spawn(wait_coroutine, add(i, i)) for i in range(3)]
+        assert [gt.wait() for gt in gts] == [0, 2, 4]
+
+    def test_run_until_complete(self):
+        assert get_event_loop().run_until_complete(add(1, 2)) == 3
+
+
+class TestRunInGreenlet:
+    def test_run_in_greenlet(self):
+        def green_add(a, b):
+            sleep(0.01)
+            return a + b
+
+        async def main():
+            return await run_in_greenlet(green_add, 1, 2)
+
+        assert wait_coroutine(main()) == 3
+
+    def test_cancel(self):
+        finished = []
+
+        def slow():
+            sleep(0.1)
+            finished.append(True)
+
+        async def main():
+            fut = run_in_greenlet(slow)
+            await asyncio.sleep(0.01)
+            fut.cancel()
+
+        wait_coroutine(main())
+        sleep(0.15)
+        assert not finished
+
+
+class TestIO:
+    def test_add_reader(self):
+        loop = get_event_loop()
+        a, b = socket.socketpair()
+        received = loop.create_future()
+
+        def on_readable():
+            received.set_result(a.recv(16))
+            loop.remove_reader(a)
+
+        loop.add_reader(a, on_readable)
+        b.send(b'hello')
+        assert wait_coroutine(received) == b'hello'
+        a.close()
+        b.close()
+
+    def test_hub_state_kept(self, monkeypatch):
+        # removing the last listener of a file descriptor does not release the hub's state for it,
+        # and adding one again only discards that state if the file descriptor was recycled
+        loop = get_event_loop()
+        calls = []
+        for name in 'notify_opened', 'notify_close':
+            method = getattr(loop.hub, name)
+            monkeypatch.setattr(loop.hub, name,
+                                lambda fd, name=name, method=method: (calls.append(name), method(fd)))
+
+        a, b = socket.socketpair()
+        for i in range(2):
+            loop.add_writer(a, lambda: None)
+            loop.remove_writer(a)
+        assert calls == ['notify_opened']
+
+        a.close()
+        b.close()
+
+    def test_streams(self):
+        async def handle(reader, writer):
+            writer.write(await reader.readline())
+            await writer.drain()
+            writer.close()
+
+        async def main():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'hello\n')
+            line = await reader.readline()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return line
+
+        assert wait_coroutine(main()) == b'hello\n'
@@ -0,0 +1,90 @@
+import concurrent.futures
+import time
+
+import pytest
+
+from guv import sleep, spawn
+from guv.hubs import get_hub
+from guv.futures import as_completed, wait_future, GreenExecutor
+
+
+@pytest.fixture(scope='module')
+def executor():
+    executor = concurrent.futures.ThreadPoolExecutor(4)
+    yield executor
+    executor.shutdown()
+
+
+class TestWaitFuture:
+    def test_wait_future(self, executor):
+        # the hub keeps running while this greenlet waits
+        ticks = []
+
+        def ticker():
+            for i in range(3):
+                ticks.append(i)
+                sleep(0.005)
+
+        gt = spawn(ticker)
+        fut = executor.submit(time.sleep, 0.05)
+        assert wait_future(fut) is None
+        assert len(ticks) == 3
+        gt.wait()
+
+    def test_exception(self, executor):
+        fut = executor.submit(int, 'x')
+        with pytest.raises(ValueError):
+            wait_future(fut)
+
+    def test_timeout(self, executor):
+        fut = executor.submit(time.sleep, 0.1)
+        with pytest.raises(concurrent.futures.TimeoutError):
+            wait_future(fut, 0.01)
+
+        assert wait_future(fut) is None
+
+    def test_timeout_callback(self, monkeypatch):
+        # the callback left on the future after a timeout does nothing
+        fut = concurrent.futures.Future()
+        with pytest.raises(concurrent.futures.TimeoutError):
+            wait_future(fut, 0.01)
+
+        calls = []
+        monkeypatch.setattr(get_hub(), 'schedule_call_threadsafe', lambda *args: calls.append(args))
+        fut.set_result(None)
+        assert calls == []
+
+
+class TestAsCompleted:
+    def test_as_completed(self, executor):
+        fs = [executor.submit(time.sleep, delay) for delay in (0.06, 0.02, 0.04)]
+        assert list(as_completed(fs)) == [fs[1], fs[2], fs[0]]
+
+    def test_timeout(self, executor):
+        fs = [executor.submit(time.sleep, delay) for delay in (0.01, 0.1)]
+        completed = []
+        with pytest.raises(concurrent.futures.TimeoutError):
+            for fut in as_completed(fs, 0.05):
+                completed.append(fut)
+
+        assert completed == fs[:1]
+
+
+class TestGreenExecutor:
+    def test_submit(self):
+        executor = GreenExecutor(max_workers=2)
+        running = []
+
+        def work(i):
+            running.append(i)
+            sleep(0.01)
+            assert len(running) <= 2
+            running.remove(i)
+            return i * 2
+
+        fs = [executor.submit(work, i) for i in range(5)]
+        assert [wait_future(fut) for fut in fs] == [0, 2, 4, 6, 8]
+        executor.shutdown()
+
+        with pytest.raises(RuntimeError):
+            executor.submit(work, 0)
@@ -1,11 +1,13 @@
 import errno
 import gc
+import io
 import socket
 import sys
+import tempfile
 
 import pytest
 
-from guv import spawn
+from guv import greenio, sleep, spawn
 from guv.event import Event
 from guv.greenio import socket as green_socket
 from guv.green import socket as socket_patched
@@ -129,6 +131,150 @@ class TestGreenSocket:
         killer.wait()
 
 
+class TestReadiness:
+    def test_short_read(self):
+        a, b = greenio.socketpair()
+        b.sendall(b'hello')
+        assert a.recv(4) == b'hell'
+        assert not a._read_blocked
+
+        # the receive buffer has been drained
+        assert a.recv(4) == b'o'
+        assert a._read_blocked
+
+        def drip():
+            for c in b'world':
+                sleep(0.001)
+                b.send(bytes([c]))
+
+        gt = spawn(drip)
+        data = b''
+        while len(data) < 5:
+            data += a.recv(4)
+        assert data == b'world'
+        gt.wait()
+        a.close()
+        b.close()
+
+    def test_recv_into_timeout(self):
+        a, b = greenio.socketpair()
+        a.settimeout(TIMEOUT_SMALL)
+        b.send(b'hi')
+        buf = bytearray(4)
+        assert a.recv_into(buf) == 2
+        with pytest.raises(socket.timeout):
+            a.recv_into(buf)
+
+        b.send(b'!')
+        assert a.recv_into(buf) == 1
+        assert buf[:1] == b'!'
+        a.close()
+        b.close()
+
+    def test_short_write(self):
+        a, b = greenio.socketpair()
+        resize_buffer(a, 1)
+        data = bytes(1 << 20)
+
+        def receive():
+            n = 0
+            while n < len(data):
+                n += len(b.recv(65536))
+            return n
+
+        gt = spawn(receive)
+        a.sendall(data)
+        assert gt.wait() == len(data)
+        a.close()
+        b.close()
+
+    def test_short_sendmsg(self):
+        a, b = greenio.socketpair()
+        resize_buffer(a, 1)
+        assert a.sendmsg([b'x']) == 1
+        assert not a._write_blocked
+
+        # fill the send buffer
+        data = bytes(1 << 20)
+        n = a.sendmsg([data, data])
+        assert 0 < n < 2 * len(data)
+        assert a._write_blocked
+
+        # once the buffer has drained, a full send clears the flag
+        received = 0
+        while received < n + 1:
+            received += len(b.recv(1 << 20))
+        assert a.sendmsg([b'y']) == 1
+        assert not a._write_blocked
+        a.close()
+        b.close()
+
+
+class TestSendallMany:
+    def test_sendall_many(self):
+        a, b = greenio.socketpair()
+        resize_buffer(a, 1)
+        buffers = [b'head', b'', bytes(range(256)) * 4096, bytearray(b'tail')]
+        expected = b''.join(buffers)
+
+        def receive():
+            data = bytearray()
+            while len(data) < len(expected):
+                data += b.recv(65536)
+            return data
+
+        gt = spawn(receive)
+        a.sendall_many(buffers)
+        assert gt.wait() == expected
+        a.close()
+        b.close()
+
+    def test_many_buffers(self):
+        a, b = greenio.socketpair()
+        buffers = [bytes([i % 256]) for i in range(greenio.IOV_MAX * 2 + 1)]
+        a.sendall_many(buffers)
+        assert b.recv(len(buffers) + 1) == b''.join(buffers)
+        a.close()
+        b.close()
+
+
+class TestSendfile:
+    data = bytes(range(256)) * 4096
+
+    def _receive(self, sock, n):
+        data = bytearray()
+        while len(data) < n:
+            data += sock.recv(65536)
+        return data
+
+    def test_sendfile(self):
+        a, b = greenio.socketpair()
+        resize_buffer(a, 1)
+        with tempfile.TemporaryFile() as f:
+            f.write(self.data)
+            f.flush()
+
+            gt = spawn(self._receive, b, len(self.data))
+            assert a.sendfile(f) == len(self.data)
+            assert gt.wait() == self.data
+            assert f.tell() == len(self.data)
+
+            assert a.sendfile(f, 10, 5) == 5
+            assert b.recv(16) == self.data[10:15]
+            assert f.tell() == 15
+        a.close()
+        b.close()
+
+    def test_sendfile_fallback(self):
+        a, b = greenio.socketpair()
+        f = io.BytesIO(self.data)
+        gt = spawn(self._receive, b, len(self.data) - 100)
+        assert a.sendfile(f, 100) == len(self.data) - 100
+        assert gt.wait() == self.data[100:]
+        a.close()
+        b.close()
+
+
 class TestGreenSocketModule:
     def test_create_connection(self, pub_addr):
         sock = socket_patched.create_connection(pub_addr)
@@ -0,0 +1,458 @@
+import functools
+import os
+import select
+import socket
+import threading
+import time
+
+import greenlet
+import pytest
+
+from guv import gyield, maybe_yield, sleep, spawn, spawn_n, spawn_priority, Timeout
+from guv.const import READ, WRITE, PRIORITY_HIGH, PRIORITY_LOW
+from guv.greenio import socketpair
+from guv.hubs import get_hub, use_hub, trampoline
+from guv.hubs.timer import TimerWheel
+from guv.util.debug import hub_blocking_detection
+
+
+@pytest.mark.skipif(not hasattr(get_hub(), 'poll_handles'), reason='requires a libuv hub')
+class TestPollHandles:
+    def test_poll_handle_reused(self):
+        hub = get_hub()
+        a, b = socketpair()
+
+        def writer():
+            b.sendall(b'x')
+
+        spawn(writer)
+        trampoline(a.fileno(), READ)
+        poll_h = hub.poll_handles[a.fileno()]
+        assert not poll_h.active
+        assert a.recv(1) == b'x'
+
+        spawn(writer)
+        trampoline(a.fileno(), READ)
+        assert hub.poll_handles[a.fileno()] is poll_h
+
+        a.close()
+        b.close()
+
+    def test_poll_handle_closed_with_socket(self):
+        hub = get_hub()
+        a, b = socketpair()
+        fd = a.fileno()
+
+        spawn(b.sendall, b'x')
+        trampoline(fd, READ)
+        poll_h = hub.poll_handles[fd]
+
+        a.close()
+        assert fd not in hub.poll_handles
+        assert poll_h.closed
+        b.close()
+
+    def test_closed_poll_handle_released(self):
+        pyuv_cffi = pytest.importorskip('pyuv_cffi')
+        hub = get_hub()
+        if hub.pyuv is not pyuv_cffi:
+            pytest.skip('requires the pyuv_cffi hub')
+
+        sleep(0.01)  # let libuv call the close callbacks of handles closed by previous tests
+        a, b = socketpair()
+        count = pyuv_cffi.alive_counts['Poll']
+        trampoline(a.fileno(), WRITE)
+        assert pyuv_cffi.alive_counts['Poll'] == count + 1
+
+        a.close()
+        sleep(0.01)  # let libuv call the close callback
+        assert pyuv_cffi.alive_counts['Poll'] == count
+        b.close()
+
+
+class TestFullDuplex:
+    def test_reader_and_writer_on_same_fd(self):
+        hub = get_hub()
+        a, b = socketpair()
+        fd = a.fileno()
+        events = []
+
+        def reader():
+            trampoline(fd, READ)
+            events.append(READ)
+
+        def writer():
+            trampoline(fd, WRITE)
+            events.append(WRITE)
+
+        gr = spawn(reader)
+        gw = spawn(writer)
+        gw.wait()
+        assert events == [WRITE]
+        assert hub.listeners[READ][fd]
+
+        b.sendall(b'x')
+        gr.wait()
+        assert events == [WRITE, READ]
+        assert fd not in hub.listeners[READ]
+        assert fd not in hub.listeners[WRITE]
+
+        a.close()
+        b.close()
+
+    def test_read_or_write(self):
+        hub = get_hub()
+        a, b = socketpair()
+        fd = a.fileno()
+
+        trampoline(fd, READ | WRITE)
+        assert fd not in hub.listeners[READ]
+        assert fd not in hub.listeners[WRITE]
+
+        a.close()
+        b.close()
+
+
+class TestCallbacks:
+    def test_callback_budget(self):
+        hub = get_hub()
+        sleep(0)  # make sure the loop is running
+        called = []
+        for i in range(10):
+            hub.schedule_call_now(called.append, i)
+
+        deferred = hub.callbacks_deferred_total
+        hub.callback_budget = 4
+        try:
+            # the 10 callbacks and the switch back to this greenlet are called in batches of 4, so
+            # 7 and then 3 callbacks are deferred
+            gyield()
+        finally:
+            del hub.callback_budget
+
+        assert called == list(range(10))
+        assert hub.callbacks_deferred_total - deferred == 10
+
+    def test_priorities(self):
+        hub = get_hub()
+        sleep(0)  # make sure the loop is running
+        called = []
+        hub.schedule_call_now(called.append, 'low', priority=PRIORITY_LOW)
+        hub.schedule_call_now(called.append, 'normal')
+        spawn_priority(PRIORITY_HIGH, called.append, 'high')
+        gyield()  # this greenlet is resumed before the low priority callback is called
+        assert called == ['high', 'normal']
+        gyield()
+        assert called == ['high', 'normal', 'low']
+
+    def test_spawn_priority_kwarg(self):
+        # a keyword argument named `priority` is passed to the function
+        def f(priority):
+            return priority
+
+        assert spawn(f, priority='x').wait() == 'x'
+
+        called = []
+        spawn_n(lambda priority: called.append(priority), priority='z')
+        gyield()
+        assert called == ['z']
+
+    def test_low_priority_not_starved(self):
+        hub = get_hub()
+        sleep(0)  # make sure the loop is running
+        called = []
+        for i in range(20):
+            hub.schedule_call_now(called.append, 'high', priority=PRIORITY_HIGH)
+        hub.schedule_call_now(called.append, 'low', priority=PRIORITY_LOW)
+
+        hub.schedule_call_now(greenlet.getcurrent().switch, priority=PRIORITY_LOW)
+
+        hub.callback_budget = 10
+        try:
+            # one callback of the budget is reserved for the low priority callbacks in each loop
+            # iteration, so 9 high priority callbacks are called before each of them
+            hub.switch()
+        finally:
+            del hub.callback_budget
+
+        assert called == ['high'] * 9 + ['low'] + ['high'] * 9
+
+
+class TestThreadsafe:
+    def test_schedule_call_threadsafe(self):
+        hub = get_hub()
+        current = greenlet.getcurrent()
+
+        def run():
+            time.sleep(0.01)
+            hub.schedule_call_threadsafe(current.switch, 'done')
+
+        t = threading.Thread(target=run)
+        hub.ref_threadsafe()  # nothing else keeps the loop running
+        try:
+            t.start()
+            assert hub.switch() == 'done'
+        finally:
+            hub.unref_threadsafe()
+
+        t.join()
+        assert hub.threadsafe_refs == 0
+
+
+class TestTimeSlice:
+    def test_maybe_yield(self):
+        hub = get_hub()
+        sleep(0)  # make sure the loop is running
+        switches = hub.switches
+        calls = 0
+
+        hub.set_time_slice(0.01)
+        try:
+            deadline = time.monotonic() + 0.05
+            while time.monotonic() < deadline:
+                maybe_yield()
+                calls += 1
+        finally:
+            hub.set_time_slice(None)
+
+        # only yields about once every 10 ms
+        assert 0 < hub.switches - switches < 10 < calls
+        assert greenlet.gettrace() is None
+
+
+class TestTimers:
+    def test_timers_fire_in_order(self):
+        hub = get_hub()
+        fired = []
+
+        for delay in (0.03, 0.01, 0.02):
+            hub.schedule_call_global(delay, fired.append, delay)
+
+        sleep(0.05)
+        assert fired == [0.01, 0.02, 0.03]
+
+    def test_cancelled_timers_discarded(self):
+        hub = get_hub()
+        fired = []
+
+        # only the libuv hubs have a timer handle, which is stopped when no timers are left
+        timer_h = getattr(hub, 'timer_h', None)
+
+        timers = [hub.schedule_call_global(10, fired.append, i) for i in range(10)]
+        assert len(hub.timers) == 10
+        if timer_h is not None:
+            assert timer_h.active
+
+        for t in timers:
+            t.cancel()
+
+        assert len(hub.timers) == 0
+        assert not hub.timers
+        if timer_h is not None:
+            assert not timer_h.active
+        assert not fired
+
+
+class TestCoarseTimers:
+    def test_coarse_timers_fire(self):
+        hub = get_hub()
+        fired = []
+
+        for delay in (0.05, 0.01, 0.03, 0.2):
+            hub.schedule_call_coarse(delay, fired.append, delay)
+
+        sleep(0.1)
+        assert fired == [0.01, 0.03, 0.05]
+        assert len(hub.wheel) == 1
+
+        sleep(0.15)
+        assert fired == [0.01, 0.03, 0.05, 0.2]
+        assert not hub.wheel
+        assert hub.wheel_timer is None
+
+    def test_cancel_last_coarse_timer(self):
+        hub = get_hub()
+        timers = [hub.schedule_call_coarse(10, lambda: None) for _ in range(10)]
+        assert hub.wheel_timer is not None
+
+        for t in timers:
+            t.cancel()
+
+        assert not hub.wheel
+        assert hub.wheel_timer is None
+
+    def test_timer_added_after_early_advance(self):
+        now = [0.0]
+        wheel = TimerWheel(resolution=0.01, clock=lambda: now[0])
+        fired = []
+        wheel.add(10, fired.append, 'long')  # keeps the wheel non-empty
+
+        # the wheel is advanced to a time slightly ahead of the clock
+        now[0] = 1.0
+        wheel.advance(now[0] + 0.01)
+        wheel.add(0, fired.append, 'short')
+
+        # the timer fires within a tick, not after a revolution of the wheel
+        now[0] = 1.02
+        wheel.advance()
+        assert fired == ['short']
+
+    def test_single_level_wheel(self):
+        now = [0.0]
+        wheel = TimerWheel(resolution=1, slot_bits=2, levels=1, clock=lambda: now[0])
+        fired = []
+        wheel.add(0, fired.append, 'short')
+        wheel.add(10, fired.append, 'long')  # beyond one revolution of the wheel
+
+        while wheel.count:
+            now[0] = wheel.next_expiry()
+            wheel.advance()
+            fired.append(now[0])
+
+        assert fired == ['short', 1, 4, 8, 'long', 11]
+
+        with pytest.raises(ValueError):
+            TimerWheel(levels=0)
+
+    def test_coarse_timeout(self):
+        with pytest.raises(Timeout):
+            with Timeout(0.01, coarse=True):
+                sleep(1)
+
+    def test_coarse_socket_timeout(self):
+        a, b = socketpair()
+        a.settimeout(0.01, coarse=True)
+
+        with pytest.raises(socket.timeout):
+            a.recv(1)
+
+        a.close()
+        b.close()
+
+
+class TestTime:
+    def test_now_cached_while_running(self):
+        hub = get_hub()
+        sleep(0)  # make sure the loop is running
+        results = []
+
+        def cb():
+            t = hub.now()
+            time.sleep(0.01)
+            results.append(hub.now() == t)
+            hub.update_time()
+            results.append(hub.now() > t)
+
+        hub.schedule_call_now(cb)
+        gyield()
+        assert results == [True, True]
+
+
+class TestStats:
+    def test_stats(self):
+        hub = get_hub()
+        sleep(0)  # make sure the loop is running
+        before = hub.stats()
+        a, b = socketpair()
+
+        spawn(b.sendall, b'x')
+        trampoline(a.fileno(), READ)
+        sleep(0.01)
+        stats = hub.stats()
+
+        assert stats['iterations'] > before['iterations']
+        assert stats['switches'] > before['switches']
+        assert stats['callbacks'] > before['callbacks']
+        assert stats['lag']['count'] > before['lag']['count']
+        assert stats['poll_time'] > before['poll_time']
+        assert stats['run_time'] >= stats['poll_time']
+        assert stats['callbacks_per_iteration']['count'] == stats['iterations']
+        assert sum(n for bound, n in stats['lag']['buckets']) == stats['lag']['count']
+
+        a.close()
+        b.close()
+
+
+class TestBlockingDetection:
+    def test_blocking_detected(self, caplog):
+        hub = get_hub()
+        sleep(0)  # make sure the loop is running
+        hub_blocking_detection(True, 0.02)
+        try:
+            sleep(0.05)  # waiting for I/O (or timers) is not blocking
+            assert hub.watchdog.count == 0
+
+            time.sleep(0.1)
+            assert hub.watchdog.count == 1
+            assert hub.stats()['blocked'] == 1
+            assert 'test_blocking_detected' in caplog.text
+        finally:
+            hub_blocking_detection(False)
+
+        assert hub.watchdog is None
+
+
+class TestEpollHub:
+    @pytest.mark.skipif(not hasattr(select, 'epoll'), reason='requires epoll')
+    @pytest.mark.parametrize('edge_triggered', [False, True])
+    def test_epoll_hub(self, edge_triggered):
+        from guv.hubs import epoll
+
+        results = []
+
+        def run():
+            # hubs are thread-local, so the epoll hub does not replace this thread's hub
+            use_hub(functools.partial(epoll.Hub, edge_triggered=edge_triggered))
+            hub = get_hub()
+            a, b = socketpair()
+
+            for i in range(3):
+                spawn(b.sendall, b'x')
+                results.append(a.recv(1))
+
+            a.settimeout(0.01)
+            with pytest.raises(socket.timeout):
+                a.recv(1)
+
+            a.close()
+            b.close()
+            results.append(isinstance(hub, epoll.Hub))
+            results.append(hub.registered)
+
+        t = threading.Thread(target=run)
+        t.start()
+        t.join()
+        assert results == [b'x', b'x', b'x', True, {}]
+
+    @pytest.mark.skipif(not hasattr(select, 'epoll'), reason='requires epoll')
+    @pytest.mark.parametrize('edge_triggered', [False, True])
+    def test_fd_reused(self, edge_triggered):
+        # a file closed without notifying the hub does not prevent its file descriptor number from
+        # being waited on once it is reused
+        from guv.hubs import epoll
+
+        results = []
+
+        def run():
+            use_hub(functools.partial(epoll.Hub, edge_triggered=edge_triggered))
+            hub = get_hub()
+
+            r, w = os.pipe()
+            os.write(w, b'x')
+            trampoline(r, READ, timeout=1)
+            os.close(r)
+            os.close(w)
+
+            r2, w2 = os.pipe()
+            os.write(w2, b'x')
+            results.append(r2 == r)
+            trampoline(r2, READ, timeout=1, timeout_exc=AssertionError('timed out'))
+            results.append(os.read(r2, 1))
+            os.close(r2)
+            os.close(w2)
+            results.append(hub.registered)
+
+        t = threading.Thread(target=run)
+        t.start()
+        t.join()
+        assert results == [True, b'x', {}]
@@ -0,0 +1,80 @@
+import operator
+import os
+import time
+
+import pytest
+
+from guv import sleep, spawn
+from guv.futures import wait_future
+from guv.hubs import get_hub, use_hub
+from guv.procpool import ProcessPool, RemoteTraceback, WorkerExited
+from guv.timeout import Timeout
+
+
+@pytest.fixture(autouse=True)
+def running_hub():
+    # the hub greenlet finishes when its loop exits with nothing left to wait for (as in
+    # test_threads.py); start a new one
+    if get_hub().dead:
+        use_hub()
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = ProcessPool(2, max_in_flight=2)
+    yield pool
+    pool.close()
+
+
+class TestProcessPool:
+    def test_apply(self, pool):
+        assert pool.apply(operator.mul, (6, 7)) == 42
+        assert pool.apply(os.getpid) != os.getpid()
+
+    def test_exception(self, pool):
+        with pytest.raises(ValueError) as exc_info:
+            pool.apply(int, ('x',))
+
+        assert isinstance(exc_info.value.__cause__, RemoteTraceback)
+
+        # the worker is still usable
+        assert pool.apply(abs, (-1,)) == 1
+
+    def test_worker_exited(self, pool):
+        with pytest.raises(WorkerExited):
+            pool.apply(os._exit, (1,))
+
+        assert pool.apply(abs, (-1,)) == 1
+
+    def test_interrupted(self, pool):
+        start = time.monotonic()
+        with pytest.raises(Timeout):
+            with Timeout(0.01):
+                pool.apply(time.sleep, (10,))
+
+        # the busy worker is terminated right away, without waiting for it on the hub
+        assert time.monotonic() - start < 0.5
+        assert len(pool.workers) <= 1
+        assert pool.apply(abs, (-1,)) == 1
+
+    def test_out_of_band_buffers(self, pool):
+        data = bytearray(os.urandom(1024 * 1024))
+        assert pool.apply(bytearray, (data,)) == data
+
+    def test_hub_not_blocked(self, pool):
+        ticks = []
+
+        def ticker():
+            for i in range(3):
+                ticks.append(i)
+                sleep(0.005)
+
+        gt = spawn(ticker)
+        pool.apply(pow, (3, 200000))  # takes a while to compute
+        gt.wait()
+        assert ticks == [0, 1, 2]
+
+    def test_apply_async(self, pool):
+        fs = [pool.apply_async(operator.add, (i, 1)) for i in range(5)]
+        assert [wait_future(fut) for fut in fs] == [1, 2, 3, 4, 5]
+        assert len(pool.workers) <= 2
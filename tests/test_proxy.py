@@ -0,0 +1,62 @@
+import pytest
+
+from guv import greenio, proxy, spawn
+
+
+def receive_all(sock):
+    data = bytearray()
+    while True:
+        d = sock.recv(65536)
+        if not d:
+            return data
+        data += d
+
+
+@pytest.fixture(params=['splice', 'copy'])
+def splice(request, monkeypatch):
+    if request.param == 'copy':
+        monkeypatch.setattr(proxy, '_splice', None)
+    elif proxy._splice is None:
+        pytest.skip('os.splice() is not available')
+
+
+class TestProxy:
+    data = bytes(range(256)) * 8192
+
+    def test_pipe(self, splice):
+        client, src = greenio.socketpair()
+        dst, server = greenio.socketpair()
+
+        def request():
+            client.sendall(self.data)
+            client.shutdown(greenio.socket_orig.SHUT_WR)
+
+        spawn(request)
+        gt = spawn(receive_all, server)
+        assert proxy.pipe(src, dst) == len(self.data)
+        assert gt.wait() == self.data
+
+        for sock in client, src, dst, server:
+            sock.close()
+
+    def test_relay(self, splice):
+        client, proxy1 = greenio.socketpair()
+        proxy2, server = greenio.socketpair()
+
+        def echo():
+            data = receive_all(server)
+            server.sendall(data[::-1])
+            server.shutdown(greenio.socket_orig.SHUT_WR)
+
+        def request():
+            client.sendall(self.data)
+            client.shutdown(greenio.socket_orig.SHUT_WR)
+            return receive_all(client)
+
+        spawn(echo)
+        gt = spawn(request)
+        assert proxy.relay(proxy1, proxy2) == (len(self.data), len(self.data))
+        assert gt.wait() == self.data[::-1]
+
+        for sock in client, proxy1, proxy2, server:
+            sock.close()
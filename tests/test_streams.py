@@ -0,0 +1,90 @@
+import socket
+
+import pytest
+
+from guv import greenio, sleep, spawn
+from guv.streams import (BufferedSocketReader, BufferPool, IncompleteReadError,
+                         LimitOverrunError)
+
+
+@pytest.fixture
+def pair():
+    a, b = greenio.socketpair()
+    yield a, b
+    a.close()
+    b.close()
+
+
+def drip(sock, data, size=3):
+    for i in range(0, len(data), size):
+        sleep(0.001)
+        sock.send(data[i:i + size])
+    sock.shutdown(socket.SHUT_WR)
+
+
+class TestBufferedSocketReader:
+    def test_readline(self, pair):
+        a, b = pair
+        gt = spawn(drip, b, b'GET / HTTP/1.1\r\nHost: x\r\n\r\ntail')
+        reader = BufferedSocketReader(a, buffer_size=8)
+        assert reader.readline() == b'GET / HTTP/1.1\r\n'
+        assert reader.readline(4) == b'Host'
+        assert reader.readline() == b': x\r\n'
+        assert reader.readline() == b'\r\n'
+        assert reader.readline() == b'tail'
+        assert reader.readline() == b''
+        gt.wait()
+
+    def test_readexactly(self, pair):
+        a, b = pair
+        data = bytes(range(256)) * 64
+        gt = spawn(drip, b, data, 1000)
+        reader = BufferedSocketReader(a, buffer_size=64)
+        assert reader.readexactly(2) == data[:2]
+        assert reader.peek(2) == data[2:4]
+        assert reader.readexactly(len(data) - 10) == data[2:-8]
+        with pytest.raises(IncompleteReadError) as exc_info:
+            reader.readexactly(10)
+        assert exc_info.value.partial == data[-8:]
+        gt.wait()
+
+    def test_readuntil(self, pair):
+        a, b = pair
+        gt = spawn(drip, b, b'abc\r\n' + b'x' * 40 + b'\r\n' + b'y' * 80)
+        reader = BufferedSocketReader(a, buffer_size=16, limit=64)
+        assert reader.readuntil(b'\r\n') == b'abc\r\n'
+
+        # the buffer grows for longer data
+        assert reader.readuntil(b'\r\n') == b'x' * 40 + b'\r\n'
+
+        with pytest.raises(LimitOverrunError):
+            reader.readuntil(b'\r\n')
+        assert reader.read() == b'y' * 80
+        gt.wait()
+
+    def test_pool(self, pair):
+        a, b = pair
+        pool = BufferPool(size=16)
+        b.sendall(b'hello')
+        with BufferedSocketReader(a, pool=pool) as reader:
+            assert reader.read1() == b'hello'
+            buf = reader.buf
+        assert reader.closed
+        assert len(pool) == 1
+        assert BufferedSocketReader(a, pool=pool).buf is buf
+
+    def test_close_while_reading(self, pair):
+        a, b = pair
+        pool = BufferPool(size=16)
+        reader = BufferedSocketReader(a, pool=pool)
+        gt = spawn(reader.read1)
+        sleep(0.01)  # let the greenthread wait for data
+
+        # the buffer is not returned to the pool while data may still be received into it
+        reader.close()
+        assert len(pool) == 0
+
+        b.sendall(b'hello')
+        with pytest.raises(ValueError):
+            gt.wait()
+        assert len(pool) == 1
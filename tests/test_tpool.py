@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+from guv import sleep, spawn, tpool
+from guv.hubs import get_hub, use_hub
+
+
+@pytest.fixture(autouse=True)
+def running_hub():
+    # the hub greenlet finishes when its loop exits with nothing left to wait for (as in
+    # test_threads.py); start a new one
+    if get_hub().dead:
+        use_hub()
+
+
+def fail():
+    raise ValueError('failed')
+
+
+class TestExecute:
+    def test_execute(self):
+        before = tpool.stats()
+        assert tpool.execute(sum, [1, 2, 3]) == 6
+
+        stats = tpool.stats()
+        assert stats['completed'] == before['completed'] + 1
+        assert stats['pending'] == 0
+        assert stats['queue_wait']['count'] == before['queue_wait']['count'] + 1
+
+    def test_exception(self):
+        with pytest.raises(ValueError):
+            tpool.execute(fail)
+
+    def test_nested(self):
+        with pytest.raises(RuntimeError):
+            tpool.execute(tpool.execute, sum, [1, 2, 3])
+
+    def test_hub_not_blocked(self):
+        # the other greenlet keeps running while this one waits for the worker thread
+        ticks = []
+
+        def ticker():
+            for i in range(5):
+                ticks.append(i)
+                sleep(0.005)
+
+        gt = spawn(ticker)
+        tpool.execute(time.sleep, 0.05)
+        assert ticks == list(range(5))
+        gt.wait()
@@ -0,0 +1,85 @@
+import io
+import os
+import tempfile
+
+import pytest
+
+from guv import greenio, listen, spawn, wsgi
+
+
+@pytest.fixture
+def serve():
+    """Serve a WSGI application; return a function which makes a request and returns the response
+    """
+    server_sock = listen(('127.0.0.1', 0))
+    servers = []
+
+    def request(app, path='/'):
+        if not servers:
+            servers.append(spawn(wsgi.serve, server_sock, app))
+
+        sock = greenio.socket()
+        sock.connect(server_sock.getsockname())
+        sock.sendall('GET {} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'
+                     .format(path).encode())
+        # the server reads from the connection until it is closed before closing it
+        sock.shutdown(greenio.socket_orig.SHUT_WR)
+        data = b''
+        while True:
+            d = sock.recv(65536)
+            if not d:
+                break
+            data += d
+        sock.close()
+
+        head, body = data.split(b'\r\n\r\n', 1)
+        lines = head.decode('latin-1').split('\r\n')
+        headers = dict(line.split(': ', 1) for line in lines[1:])
+        return lines[0], headers, body
+
+    yield request
+
+    for gt in servers:
+        gt.kill()
+    server_sock.close()
+
+
+class TestFileWrapper:
+    data = os.urandom(100000)
+
+    def test_file_wrapper(self, serve, monkeypatch):
+        sent = []
+        sendfile = greenio.socket.sendfile
+
+        def counting_sendfile(sock, *args):
+            n = sendfile(sock, *args)
+            sent.append(n)
+            return n
+
+        monkeypatch.setattr(greenio.socket, 'sendfile', counting_sendfile)
+
+        with tempfile.TemporaryFile() as f:
+            f.write(self.data)
+
+            def app(environ, start_response):
+                assert environ['wsgi.file_wrapper'] is wsgi.FileWrapper
+                f.seek(10)
+                start_response('200 OK', [('Content-Type', 'application/octet-stream')])
+                return environ['wsgi.file_wrapper'](f)
+
+            status, headers, body = serve(app)
+
+        assert status == 'HTTP/1.1 200 OK'
+        assert headers['Content-Length'] == str(len(self.data) - 10)
+        assert 'Transfer-Encoding' not in headers
+        assert body == self.data[10:]
+        assert sent == [len(self.data) - 10]
+
+    def test_file_wrapper_not_a_file(self, serve):
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return environ['wsgi.file_wrapper'](io.BytesIO(b'hello'), 2)
+
+        status, headers, body = serve(app)
+        assert headers['Transfer-Encoding'] == 'chunked'
+        assert body == b'2\r\nhe\r\n2\r\nll\r\n1\r\no\r\n0\r\n\r\n'